@@ -0,0 +1,179 @@
+"""
+Admission control: per-lane concurrency limits so heavy work can't starve POS traffic.
+
+Every handler shares one event loop and one MongoDB connection pool. A year
+of sales rendered as PDF holds both for seconds, and counter checkouts queue
+up behind it. AdmissionMiddleware sorts each request into a lane before it
+reaches the app:
+
+- pos_write: checkout and customer writes from the POS counter
+- report: report exports and other heavy reads
+- general: everything else
+
+A lane admits at most `limit` requests at once. Further requests wait in the
+lane's queue for up to `timeout` seconds:
+- a request that finds the queue full gets 429 at once
+- a request still waiting when its timeout runs out gets 503
+Both carry Retry-After, so the POS and the report pages can back off and retry.
+
+Connections reserved for POS writes: only pos_write requests may use the last
+ADMISSION_POS_RESERVED connections of the pool (MONGO_MAX_POOL_SIZE). The
+other lanes also pass through a shared gate of (pool size - reserved) slots.
+A request mostly holds one connection at a time, so a burst of reads and
+exports still leaves connections free for checkouts.
+
+Lane settings come from ADMISSION_<LANE>_LIMIT, ADMISSION_<LANE>_QUEUE and
+ADMISSION_<LANE>_TIMEOUT_MS (for example ADMISSION_REPORT_LIMIT=2).
+ADMISSION_ENABLED=false lets every request straight through.
+"""
+import asyncio
+import json
+import math
+import os
+import time
+
+import metrics
+
+ENABLED = os.environ.get("ADMISSION_ENABLED", "true").lower() != "false"
+POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+POS_RESERVED = int(os.environ.get("ADMISSION_POS_RESERVED", "10"))
+
+QUEUE_DEPTH = metrics.Gauge("admission_queue_depth", "Requests waiting for a slot, by lane", ("lane",))
+IN_FLIGHT = metrics.Gauge("admission_in_flight", "Requests holding a slot, by lane", ("lane",))
+WAIT_TIME = metrics.Histogram(
+    "admission_wait_seconds", "Time requests waited for a slot, by lane", ("lane",)
+)
+REJECTED = metrics.Counter(
+    "admission_rejected_total", "Requests turned away, by lane and reason (queue_full, timeout)",
+    ("lane", "reason"),
+)
+
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def setting(lane: str, name: str, default: float) -> float:
+    return float(os.environ.get(f"ADMISSION_{lane.upper()}_{name}", default))
+
+
+class Lane:
+    """A bounded number of concurrent requests, with a bounded, timed queue in front"""
+
+    def __init__(self, name: str, limit: int, queue_size: int, timeout: float, shared=None):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retry_after = max(1, math.ceil(timeout))
+        self.semaphore = asyncio.Semaphore(limit)
+        # Gates a request must pass in order: the lane's own slots, then the shared pool share
+        self.gates = [self.semaphore] + ([shared] if shared is not None else [])
+        self.waiting = 0
+
+    @classmethod
+    def from_env(cls, name: str, limit: int, queue_size: int, timeout_ms: float, shared=None):
+        return cls(
+            name,
+            int(setting(name, "LIMIT", limit)),
+            int(setting(name, "QUEUE", queue_size)),
+            setting(name, "TIMEOUT_MS", timeout_ms) / 1000,
+            shared,
+        )
+
+    async def acquire(self):
+        if self.waiting >= self.queue_size and any(gate.locked() for gate in self.gates):
+            REJECTED.inc((self.name, "queue_full"))
+            raise Rejected(429, "queue_full", self.retry_after)
+
+        self.waiting += 1
+        QUEUE_DEPTH.inc((self.name,))
+        started = time.perf_counter()
+        acquired = []
+        try:
+            async with asyncio.timeout(self.timeout):
+                for gate in self.gates:
+                    await gate.acquire()
+                    acquired.append(gate)
+        except TimeoutError:
+            for gate in acquired:
+                gate.release()
+            REJECTED.inc((self.name, "timeout"))
+            raise Rejected(503, "timeout", self.retry_after)
+        except BaseException:
+            for gate in acquired:
+                gate.release()
+            raise
+        finally:
+            self.waiting -= 1
+            QUEUE_DEPTH.dec((self.name,))
+            WAIT_TIME.observe((self.name,), time.perf_counter() - started)
+        IN_FLIGHT.inc((self.name,))
+
+    def release(self):
+        IN_FLIGHT.dec((self.name,))
+        for gate in reversed(self.gates):
+            gate.release()
+
+
+def default_lanes() -> dict:
+    shared = asyncio.Semaphore(max(POOL_SIZE - POS_RESERVED, 1))
+    return {
+        "pos_write": Lane.from_env("pos_write", 20, 100, 5000),
+        "general": Lane.from_env("general", 60, 200, 2000, shared),
+        "report": Lane.from_env("report", 4, 20, 10000, shared),
+    }
+
+
+def rejection_response(rejected: Rejected):
+    detail = (
+        "Server is busy, try again shortly"
+        if rejected.reason == "queue_full"
+        else "Timed out waiting for the server, try again shortly"
+    )
+    body = json.dumps({"detail": detail}).encode()
+    return (
+        {
+            "type": "http.response.start",
+            "status": rejected.status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(rejected.retry_after).encode()),
+            ],
+        },
+        {"type": "http.response.body", "body": body},
+    )
+
+
+class AdmissionMiddleware:
+    """Admits each request through the lane `classify(scope)` names (None: not limited)"""
+
+    def __init__(self, app, classify, lanes=None):
+        self.app = app
+        self.classify = classify
+        self.lanes = lanes if lanes is not None else default_lanes()
+        self.enabled = ENABLED
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            return await self.app(scope, receive, send)
+        lane_name = self.classify(scope)
+        if lane_name is None:
+            return await self.app(scope, receive, send)
+        lane = self.lanes[lane_name]
+
+        try:
+            await lane.acquire()
+        except Rejected as rejected:
+            for message in rejection_response(rejected):
+                await send(message)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lane.release()
@@ -0,0 +1,206 @@
+"""
+Columnar analytics for the profit & loss endpoints.
+
+The report paths used to pull whole documents and parse one date at a time.
+Here we ask Mongo for only the fields a report needs, stream them through a
+batched cursor into pandas columns, and do date bucketing, grouping and totals
+with vectorized operations.
+
+Dates are stored in two shapes across the collections:
+- ISO strings written in IST ("2025-11-23T14:30:00+05:30", "2026-01-02")
+- BSON datetimes, which Motor hands back as naive UTC
+Both are normalized to IST calendar days by `to_ist_days`.
+"""
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytz
+
+import tracing
+from cursor_utils import iter_batches
+
+IST = pytz.timezone("Asia/Kolkata")
+
+# Documents fetched per cursor round trip when extracting columns
+ANALYTICS_BATCH_SIZE = int(os.environ.get("ANALYTICS_BATCH_SIZE", "5000"))
+
+# Report granularity -> pandas period frequency (weeks start on Monday)
+GRANULARITIES = {"day": "D", "week": "W-SUN", "month": "M"}
+
+
+def date_range_query(field: str, start_date=None, end_date=None, strings_only=False):
+    """
+    Mongo filter for an inclusive YYYY-MM-DD range on a date field.
+    Mongo only compares values of the same BSON type, so unless the field is
+    always a string we match the string and the datetime representations separately.
+    """
+    if not start_date and not end_date:
+        return {}
+
+    string_range = {}
+    datetime_range = {}
+    if start_date:
+        string_range["$gte"] = start_date[:10]
+        datetime_range["$gte"] = IST.localize(
+            datetime.strptime(start_date[:10], "%Y-%m-%d")
+        )
+    if end_date:
+        # "T99" sorts after any time of day on end_date (lexicographic comparison)
+        string_range["$lte"] = end_date[:10] + "T99:99:99"
+        datetime_range["$lt"] = IST.localize(
+            datetime.strptime(end_date[:10], "%Y-%m-%d") + timedelta(days=1)
+        )
+
+    if strings_only:
+        return {field: string_range}
+    return {"$or": [{field: string_range}, {field: datetime_range}]}
+
+
+async def fetch_columns(collection, query: dict, fields, batch_size: int = None):
+    """Stream only `fields` of the matching documents into a DataFrame"""
+    projection = {"_id": 0}
+    projection.update({field: 1 for field in fields})
+
+    columns = {field: [] for field in fields}
+    cursor = collection.find(query, projection)
+    async for batch in iter_batches(cursor, batch_size or ANALYTICS_BATCH_SIZE):
+        for field in fields:
+            columns[field].extend(doc.get(field) for doc in batch)
+
+    return pd.DataFrame({field: pd.Series(values, dtype=object) for field, values in columns.items()})
+
+
+def to_numbers(values: pd.Series) -> pd.Series:
+    """Numeric column with missing / malformed values counted as 0"""
+    return pd.to_numeric(values, errors="coerce").fillna(0.0).astype(float)
+
+
+def to_ist_days(values: pd.Series) -> pd.Series:
+    """Normalize a column of stored dates to IST calendar days (NaT if unparseable)"""
+    # Strings are written in IST, so their first 10 characters are already the day
+    # (masking first keeps .str usable when a column holds no strings at all)
+    strings = values.where(values.map(type).eq(str))
+    days = pd.to_datetime(strings.str.slice(0, 10), format="%Y-%m-%d", errors="coerce")
+
+    # Everything else should be a BSON datetime (naive UTC) - convert it to IST
+    others = days.isna() & values.notna()
+    if others.any():
+        converted = (
+            pd.to_datetime(values[others], utc=True, errors="coerce")
+            .dt.tz_convert(IST)
+            .dt.tz_localize(None)
+            .dt.normalize()
+        )
+        days = days.astype("datetime64[us]")
+        days[others] = converted.astype("datetime64[us]")
+    return days
+
+
+def bucket_labels(days: pd.Series, granularity: str) -> pd.Series:
+    """YYYY-MM-DD label of the day/week/month bucket each day falls into"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    if granularity != "day":
+        days = days.dt.to_period(GRANULARITIES[granularity]).dt.start_time
+    return days.dt.strftime("%Y-%m-%d")
+
+
+def sum_by_bucket(
+    frame: pd.DataFrame,
+    date_field: str,
+    value_fields,
+    count_name: str,
+    granularity: str,
+    start_date=None,
+    end_date=None,
+) -> pd.DataFrame:
+    """Total `value_fields` and count rows per bucket, keeping only days inside the range"""
+    days = to_ist_days(frame[date_field])
+    mask = days.notna()
+    if start_date:
+        mask &= days >= pd.Timestamp(start_date[:10])
+    if end_date:
+        mask &= days <= pd.Timestamp(end_date[:10])
+
+    values = pd.DataFrame({field: to_numbers(frame[field]) for field in value_fields})
+    values[count_name] = 1
+    values = values[mask]
+    if values.empty:
+        return pd.DataFrame(columns=list(value_fields) + [count_name], dtype=float)
+
+    return values.groupby(bucket_labels(days[mask], granularity)).sum()
+
+
+async def profit_loss_breakdown(db, start_date=None, end_date=None, granularity="day", fetch=None):
+    """
+    Per-bucket revenue, stored FIFO COGS, purchase cost and extra expenses.
+    Returns a DataFrame indexed by bucket label, most recent first.
+    `fetch(collection name, query, fields)` replaces fetch_columns, e.g. to read archived months too.
+    """
+    if fetch is None:
+        async def fetch(collection, query, fields):
+            return await fetch_columns(db[collection], query, fields)
+
+    sales = await fetch(
+        "pos_sales",
+        date_range_query("sale_date", start_date, end_date),
+        ["sale_date", "total", "cogs"],
+    )
+    purchases = await fetch(
+        "inventory_purchases",
+        date_range_query("purchase_date", start_date, end_date),
+        ["purchase_date", "total_cost"],
+    )
+    expenses = await fetch(
+        "extra_expenses",
+        date_range_query("expense_date", start_date, end_date, strings_only=True),
+        ["expense_date", "amount"],
+    )
+
+    with tracing.span("compute", "profit_loss"):
+        breakdown = pd.concat(
+            [
+                sum_by_bucket(
+                    sales, "sale_date", ["total", "cogs"], "sales_count",
+                    granularity, start_date, end_date,
+                ).rename(columns={"total": "revenue"}),
+                sum_by_bucket(
+                    purchases, "purchase_date", ["total_cost"], "purchase_count",
+                    granularity, start_date, end_date,
+                ).rename(columns={"total_cost": "purchase_cost"}),
+                sum_by_bucket(
+                    expenses, "expense_date", ["amount"], "expense_count",
+                    granularity, start_date, end_date,
+                ).rename(columns={"amount": "expenses"}),
+            ],
+            axis=1,
+        ).fillna(0.0)
+
+        breakdown["gross_margin"] = breakdown["revenue"] - breakdown["cogs"]
+        breakdown["gross_profit"] = breakdown["revenue"] - breakdown["purchase_cost"]
+        breakdown["net_profit"] = breakdown["gross_profit"] - breakdown["expenses"]
+        for count_column in ("sales_count", "purchase_count", "expense_count"):
+            breakdown[count_column] = breakdown[count_column].astype(int)
+
+    return breakdown.sort_index(ascending=False)
+
+
+def totals_since(frame: pd.DataFrame, date_field: str, value_fields, since_day: str) -> dict:
+    """Sum `value_fields` over rows dated on or after `since_day` (YYYY-MM-DD)"""
+    days = to_ist_days(frame[date_field])
+    mask = days >= pd.Timestamp(since_day)
+    return {field: float(to_numbers(frame[field])[mask].sum()) for field in value_fields}
+
+
+async def aggregate_totals(collection, match: dict, fields) -> dict:
+    """Sum `fields` (missing counted as 0) and count the matching documents in one aggregation"""
+    group = {"_id": None, "count": {"$sum": 1}}
+    group.update({field: {"$sum": {"$ifNull": [f"${field}", 0]}} for field in fields})
+    rows = await collection.aggregate([{"$match": match}, {"$group": group}]).to_list(1)
+
+    totals = {field: 0.0 for field in fields}
+    totals["count"] = 0
+    if rows:
+        totals.update({key: value for key, value in rows[0].items() if key != "_id"})
+    return totals
@@ -0,0 +1,220 @@
+"""
+Hot/cold archival of closed months of sales, exhausted lots and daily tracking.
+
+pos_sales, inventory_purchases and the daily tracking collections only grow,
+and their indexes and working set grow with them. Months older than
+ARCHIVE_HORIZON_MONTHS are closed. `archive_closed_months` moves their
+documents out of the hot collection into one cold collection per month
+("pos_sales_archive_2025_01").
+
+- Only closed documents move. For inventory_purchases these are exhausted
+  lots (no weight or pieces left), so FIFO costing never needs the cold tier.
+- Documents are copied with their _id, then deleted from the hot collection
+  one batch at a time. A run that dies half-way is finished by the next one;
+  copies already made are skipped as duplicates. A read landing between a
+  batch's copy and its delete can see that batch twice.
+- `archive_months` is the small index of what went where: one document per
+  collection and month with its archive collection, status and count.
+- Rollups stay hot: the server stores daily_rollups (revenue, COGS, costs)
+  for a month before moving it.
+
+Readers reach cold data through `tiers()`: the hot collection plus the
+archive collections of the archived months a date range reaches into.
+`find_all`, `aggregate_totals` and `fetch_columns` read across them, so reports return the
+same data before and after a month is archived. Archived documents are
+read-only. Edits and deletes through the API only see the hot tier; only
+backfill_cogs.py writes to archives (COGS of archived sales).
+"""
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+from pymongo.errors import BulkWriteError
+
+import analytics
+from cursor_utils import fetch_all
+
+logger = logging.getLogger(__name__)
+
+INDEX = "archive_months"
+HORIZON_MONTHS = int(os.environ.get("ARCHIVE_HORIZON_MONTHS", "12"))
+BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "1000"))
+
+# Archived collection -> the date field its months are cut on, and which documents are closed
+ARCHIVED = {
+    "pos_sales": {"date_field": "sale_date"},
+    "inventory_purchases": {
+        "date_field": "purchase_date",
+        "closed": {
+            "remaining_weight_kg": {"$lte": 0},
+            "$or": [{"remaining_pieces": None}, {"remaining_pieces": {"$lte": 0}}],
+        },
+    },
+    "daily_waste_tracking": {"date_field": "tracking_date", "strings_only": True},
+    "daily_pieces_tracking": {"date_field": "tracking_date", "strings_only": True},
+}
+
+
+def archive_name(collection: str, month: str) -> str:
+    return f"{collection}_archive_{month.replace('-', '_')}"
+
+
+def month_bounds(month: str):
+    """First and last day (YYYY-MM-DD) of a YYYY-MM month"""
+    first = datetime.strptime(month, "%Y-%m")
+    last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d")
+
+
+def horizon_month(today: datetime, months: int = None) -> str:
+    """The oldest month still hot; every month before it is closed"""
+    months = HORIZON_MONTHS if months is None else months
+    index = today.year * 12 + today.month - 1 - months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def closed_query(collection: str, start_date: str = None, end_date: str = None) -> dict:
+    spec = ARCHIVED[collection]
+    query = analytics.date_range_query(
+        spec["date_field"], start_date, end_date, strings_only=spec.get("strings_only", False)
+    )
+    if "closed" in spec:
+        query = {"$and": [query, spec["closed"]]}
+    return query
+
+
+# Moving months to the cold tier
+
+
+async def closed_months(db, collection: str, horizon: str) -> list:
+    """Months before `horizon` that still have closed documents in the hot collection"""
+    field = ARCHIVED[collection]["date_field"]
+    day_before = (datetime.strptime(horizon, "%Y-%m") - timedelta(days=1)).strftime("%Y-%m-%d")
+    dates = await analytics.fetch_columns(db[collection], closed_query(collection, None, day_before), [field])
+    if dates.empty:
+        return []
+    days = analytics.to_ist_days(dates[field]).dropna()
+    return sorted({day.strftime("%Y-%m") for day in days if day.strftime("%Y-%m") < horizon})
+
+
+async def archive_month(db, collection: str, month: str) -> int:
+    """Move one month's closed documents to its archive collection; returns how many moved"""
+    spec = ARCHIVED[collection]
+    target = archive_name(collection, month)
+    start_date, end_date = month_bounds(month)
+    await db[target].create_index("id")
+    await db[target].create_index(spec["date_field"])
+    await db[INDEX].update_one(
+        {"_id": f"{collection}:{month}"},
+        {
+            "$set": {"collection": collection, "month": month, "archive": target, "status": "moving"},
+            "$setOnInsert": {"documents": 0},
+        },
+        upsert=True,
+    )
+
+    moved = 0
+    query = closed_query(collection, start_date, end_date)
+    # A fresh query per batch: the documents of the previous batch are gone from the hot tier
+    while batch := await db[collection].find(query).limit(BATCH_SIZE).to_list(BATCH_SIZE):
+        try:
+            await db[target].insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Left over from an interrupted run: those documents are already in the archive
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+        await db[collection].delete_many({"_id": {"$in": [document["_id"] for document in batch]}})
+        moved += len(batch)
+
+    await db[INDEX].update_one(
+        {"_id": f"{collection}:{month}"},
+        {
+            "$set": {
+                "status": "archived",
+                "documents": await db[target].count_documents({}),
+                "archived_at": datetime.now(timezone.utc),
+            }
+        },
+    )
+    return moved
+
+
+async def archive_closed_months(db, today: datetime, before_month=None) -> dict:
+    """Archive every closed month of every archived collection
+
+    `before_month(month)` runs once per month before anything of it moves (rollups).
+    """
+    horizon = horizon_month(today)
+    months = {collection: await closed_months(db, collection, horizon) for collection in ARCHIVED}
+    if before_month is not None:
+        for month in sorted(set().union(*months.values())):
+            await before_month(month)
+
+    moved = {}
+    for collection, collection_months in months.items():
+        for month in collection_months:
+            count = await archive_month(db, collection, month)
+            if count:
+                moved[f"{collection}:{month}"] = count
+                logger.info(f"Archived {count} {collection} documents of {month}")
+    return {"horizon": horizon, "moved": moved}
+
+
+# Reading across tiers
+
+
+async def tiers(db, collection: str, start_date: str = None, end_date: str = None) -> list:
+    """The hot collection and the archives of the archived months the range reaches"""
+    # Months still being moved count too: their archive already holds the batches gone from the hot tier
+    query = {"collection": collection}
+    months = {}
+    if start_date:
+        months["$gte"] = start_date[:7]
+    if end_date:
+        months["$lte"] = end_date[:7]
+    if months:
+        query["month"] = months
+    archived = await db[INDEX].find(query, {"_id": 0, "archive": 1}).sort("month", -1).to_list(length=None)
+    return [db[collection]] + [db[entry["archive"]] for entry in archived]
+
+
+def sort_key(value) -> str:
+    """ISO string in IST, for ordering string and datetime dates together"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(analytics.IST).isoformat()
+    return str(value or "")
+
+
+async def find_all(db, collection: str, query: dict, start_date=None, end_date=None, sort_field=None) -> list:
+    """Every matching document of the hot and cold tiers, newest `sort_field` first"""
+    documents = []
+    for source in await tiers(db, collection, start_date, end_date):
+        cursor = source.find(query, {"_id": 0})
+        if sort_field:
+            cursor = cursor.sort(sort_field, -1)
+        documents.extend(await fetch_all(cursor))
+    if sort_field:
+        documents.sort(key=lambda document: sort_key(document.get(sort_field)), reverse=True)
+    return documents
+
+
+async def aggregate_totals(db, collection: str, match: dict, fields, start_date=None, end_date=None) -> dict:
+    """analytics.aggregate_totals summed over the hot and cold tiers"""
+    totals = {field: 0.0 for field in fields}
+    totals["count"] = 0
+    for source in await tiers(db, collection, start_date, end_date):
+        for key, value in (await analytics.aggregate_totals(source, match, fields)).items():
+            totals[key] += value
+    return totals
+
+
+async def fetch_columns(db, collection: str, query: dict, fields, start_date=None, end_date=None):
+    """analytics.fetch_columns over the hot and cold tiers, as one DataFrame"""
+    frames = [
+        await analytics.fetch_columns(source, query, fields)
+        for source in await tiers(db, collection, start_date, end_date)
+    ]
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
@@ -0,0 +1,247 @@
+"""
+One-time script to backfill FIFO cost of goods sold (COGS) on existing POS sales.
+
+New sales get `cogs` stored on the sale and on each item when they are created.
+This script replays stock history once so older sales get the same numbers:
+purchase lots are rebuilt in memory from their original weight/pieces, and every
+sale, waste entry and pieces entry consumes them oldest-lot-first in the order
+they were recorded. Only the `cogs` fields on pos_sales (and their sync stamps)
+are written - purchase lots are not touched.
+
+Months moved to the cold tier (archive.py) are replayed too: lots, sales,
+waste and pieces are read from the hot collections and their archives, and a
+sale's COGS is written to the collection it lives in. The daily_rollups of an
+archived month were stored before it moved, so the months whose archived
+sales get new COGS are listed at the end.
+
+Run this with: python backfill_cogs.py [--force] [--dry-run]
+  --force    recompute COGS even for sales that already have it
+  --dry-run  print the totals without writing anything
+"""
+import argparse
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import pytz
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+import archive
+import sync
+
+IST = pytz.timezone("Asia/Kolkata")
+BATCH_SIZE = 1000
+
+
+def to_datetime(value):
+    """Normalize stored dates (ISO strings, YYYY-MM-DD or BSON datetimes) to aware datetimes"""
+    if isinstance(value, datetime):
+        # BSON datetimes come back from Mongo as naive UTC
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, str) and value:
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        # Strings without an offset were written in IST
+        return parsed if parsed.tzinfo else IST.localize(parsed)
+    return None
+
+
+def recorded_at(doc, *fallback_fields):
+    """When the stock movement was recorded (created_at, else the given date fields)"""
+    for field in ("created_at",) + fallback_fields:
+        value = to_datetime(doc.get(field))
+        if value:
+            return value
+    return datetime.min.replace(tzinfo=timezone.utc)
+
+
+class Lot:
+    def __init__(self, purchase):
+        self.purchase_date = to_datetime(purchase.get("purchase_date")) or recorded_at(purchase)
+        self.available_from = recorded_at(purchase, "purchase_date")
+        self.remaining_kg = purchase.get("total_weight_kg", 0) or 0
+        self.remaining_pieces = purchase.get("total_pieces", 0) or 0
+        self.cost_per_kg = purchase.get("cost_per_kg", 0) or 0
+        total_pieces = purchase.get("total_pieces") or 0
+        self.cost_per_piece = (
+            (purchase.get("total_cost", 0) or 0) / total_pieces if total_pieces > 0 else 0.0
+        )
+
+
+def item_category(item, product_categories):
+    """Main category of a sale item; older items only name their derived product (like the server's sale_item_category)"""
+    if item.get("main_category_id"):
+        return item["main_category_id"]
+    product_id = item.get("derived_product_id") or item.get("product_id")
+    return product_categories.get(product_id) if product_id else None
+
+
+def item_weight(item):
+    """Weight sold; old-schema items (product_id only) kept it in `quantity`"""
+    if "quantity_kg" not in item and item.get("product_id") and not item.get("derived_product_id"):
+        return item.get("quantity", 0) or 0
+    return item.get("quantity_kg", 0) or 0
+
+
+async def find_all_tiers(db, collection):
+    """(collection name, document) for every document of the hot collection and its archives"""
+    for source in await archive.tiers(db, collection):
+        async for document in source.find({}, {"_id": 0}):
+            yield source.name, document
+
+
+def consume(lots, at, weight_kg=0, pieces=0):
+    """Consume stock from the oldest lots that existed at `at`; return the cost consumed
+
+    Like the server's fifo_deduct_item, pieces are only costed when no weight is consumed
+    with them: the lot's total_cost already covers its weight.
+    """
+    cost = 0.0
+    cost_pieces = weight_kg <= 0
+    for lot in lots:
+        if weight_kg <= 0 and pieces <= 0:
+            break
+        if lot.available_from > at:
+            continue
+        if weight_kg > 0 and lot.remaining_kg > 0:
+            deduction = min(lot.remaining_kg, weight_kg)
+            lot.remaining_kg -= deduction
+            weight_kg -= deduction
+            cost += deduction * lot.cost_per_kg
+        if pieces > 0 and lot.remaining_pieces > 0:
+            deduction = min(lot.remaining_pieces, pieces)
+            lot.remaining_pieces -= deduction
+            pieces -= deduction
+            if cost_pieces:
+                cost += deduction * lot.cost_per_piece
+    return cost
+
+
+async def backfill_cogs(force=False, dry_run=False):
+    # Load .env file
+    load_dotenv()
+
+    mongo_url = os.environ.get("MONGO_URL")
+    db_name = os.environ.get("DB_NAME")
+
+    if not mongo_url or not db_name:
+        print("ERROR: Environment variables not loaded!")
+        return
+
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    print("🔍 Loading purchase lots...")
+    lots_by_category = defaultdict(list)
+    async for _, purchase in find_all_tiers(db, "inventory_purchases"):
+        lots_by_category[purchase.get("main_category_id")].append(Lot(purchase))
+    for lots in lots_by_category.values():
+        lots.sort(key=lambda lot: lot.purchase_date)
+    print(f"   {sum(len(l) for l in lots_by_category.values())} lots in {len(lots_by_category)} categories")
+
+    print("🔍 Loading derived products...")
+    product_categories = {
+        product["id"]: product.get("main_category_id")
+        async for product in db.derived_products.find({}, {"_id": 0, "id": 1, "main_category_id": 1})
+    }
+    print(f"   {len(product_categories)} derived products")
+
+    print("🔍 Loading stock movements...")
+    events = []
+    sale_collections = {}
+    async for collection, sale in find_all_tiers(db, "pos_sales"):
+        sale_collections[sale["id"]] = collection
+        events.append((recorded_at(sale, "sale_date"), "sale", sale))
+    async for _, waste in find_all_tiers(db, "daily_waste_tracking"):
+        events.append((recorded_at(waste, "tracking_date"), "waste", waste))
+    async for _, pieces in find_all_tiers(db, "daily_pieces_tracking"):
+        events.append((recorded_at(pieces, "tracking_date"), "pieces", pieces))
+    events.sort(key=lambda event: event[0])
+    print(f"   {len(events)} sales, waste and pieces entries")
+
+    print("\n🔁 Replaying FIFO...")
+    updates = defaultdict(list)
+    total_cogs = 0.0
+    skipped = 0
+    unresolved = 0
+    for at, kind, doc in events:
+        if kind == "waste":
+            waste_kg = doc.get("waste_kg", doc.get("waste_weight_kg", 0)) or 0
+            consume(lots_by_category[doc.get("main_category_id")], at, weight_kg=waste_kg)
+        elif kind == "pieces":
+            consume(
+                lots_by_category[doc.get("main_category_id")],
+                at,
+                pieces=doc.get("pieces_sold", 0) or 0,
+            )
+        else:
+            item_costs = []
+            for item in doc.get("items", []):
+                category_id = item_category(item, product_categories)
+                if category_id is None:
+                    # No category to take stock from; costed at 0 and reported below
+                    unresolved += 1
+                    item_costs.append(0.0)
+                    continue
+                cost = consume(
+                    lots_by_category[category_id],
+                    at,
+                    weight_kg=item_weight(item),
+                    pieces=item.get("quantity_pieces", 0) or 0,
+                )
+                item_costs.append(round(cost, 2))
+
+            # Stock is always consumed, but already-costed sales keep their numbers
+            if doc.get("cogs") is not None and not force:
+                skipped += 1
+                continue
+
+            update = {f"items.{i}.cogs": cost for i, cost in enumerate(item_costs)}
+            update["cogs"] = round(sum(item_costs), 2)
+            total_cogs += update["cogs"]
+            updates[sale_collections[doc["id"]]].append((doc["id"], update))
+
+    archived = sorted(collection for collection in updates if collection != "pos_sales")
+    print(f"   {sum(len(u) for u in updates.values())} sales to update, {skipped} already costed")
+    print(f"   Backfilled COGS: ₹{total_cogs:.2f}")
+    if unresolved:
+        print(f"   ⚠️  {unresolved} sale items have no main category (unknown derived product), costed at ₹0")
+
+    if not dry_run:
+        for collection, collection_updates in updates.items():
+            for i in range(0, len(collection_updates), BATCH_SIZE):
+                batch = collection_updates[i : i + BATCH_SIZE]
+                # One version per sale, so POS clients pick the new COGS up through /api/sync
+                first_version = await sync.next_version(db, len(batch)) - len(batch) + 1
+                stamped_at = datetime.now(timezone.utc)
+                await db[collection].bulk_write(
+                    [
+                        UpdateOne(
+                            {"id": sale_id},
+                            {"$set": {**update, "sync_version": first_version + n, "updated_at": stamped_at}},
+                        )
+                        for n, (sale_id, update) in enumerate(batch)
+                    ],
+                    ordered=False,
+                )
+        print(f"\n✅ Backfill completed!")
+    else:
+        print(f"\nℹ️  Dry run - nothing written")
+    if archived:
+        print(f"\n⚠️  Archived sales got COGS in {', '.join(archived)}")
+        print("   The daily_rollups of those months predate it; recompute them if you read rollups")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill FIFO COGS on POS sales")
+    parser.add_argument("--force", action="store_true", help="recompute existing COGS")
+    parser.add_argument("--dry-run", action="store_true", help="do not write anything")
+    args = parser.parse_args()
+    asyncio.run(backfill_cogs(force=args.force, dry_run=args.dry_run))
@@ -0,0 +1,121 @@
+"""
+In-process dispatch of batched read requests (POST /api/batch).
+
+A page that needs several endpoints on load can send them in one batch. Each
+item is a GET that runs through the app's router as an ASGI call, with the
+scope copied from the batch request:
+- the same routes, dependencies, validation and exception handlers as a
+  real request
+- none of the per-request middleware overhead. The batch request itself is
+  measured, traced and query-counted as one request.
+- the batch's Authorization header is forwarded, and the server lets sub-requests
+  reuse the user it has already authenticated
+
+Items run concurrently, at most BATCH_CONCURRENCY at a time. A failing item
+gets its own status and error body; the rest of the batch is unaffected.
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+from urllib.parse import urlencode
+
+from starlette.exceptions import HTTPException
+
+logger = logging.getLogger(__name__)
+
+MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "20"))
+CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+
+# Headers passed from the batch request to every item
+FORWARDED_HEADERS = (b"authorization", b"accept-language", b"user-agent")
+# Headers of an item's response worth returning to the client
+RETURNED_HEADERS = ("content-type", "content-disposition", "etag")
+
+
+def item_scope(parent: dict, path: str, query) -> dict:
+    if "?" in path:
+        path, query_string = path.split("?", 1)
+    elif isinstance(query, dict):
+        query_string = urlencode(query, doseq=True)
+    else:
+        query_string = query or ""
+    headers = [(name, value) for name, value in parent["headers"] if name in FORWARDED_HEADERS]
+    # Drop what routing stored for the batch route itself
+    scope = {key: value for key, value in parent.items() if key not in ("route", "endpoint", "path_params")}
+    scope.update(
+        method="GET",
+        path=path,
+        raw_path=path.encode(),
+        query_string=query_string.encode(),
+        headers=headers,
+    )
+    return scope
+
+
+def decode_body(content_type: str, body: bytes):
+    if content_type.startswith("application/json"):
+        return json.loads(body) if body else None, None
+    if content_type.startswith("text/"):
+        return body.decode("utf-8", errors="replace"), None
+    return base64.b64encode(body).decode("ascii"), "base64"
+
+
+async def dispatch(app, parent: dict, path: str, query=None) -> dict:
+    """Run one GET through `app` (an ASGI app, normally the router) and collect its response"""
+    status = 500
+    headers = {}
+    chunks = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            for name, value in message.get("headers", []):
+                name = name.decode("latin-1").lower()
+                if name in RETURNED_HEADERS:
+                    headers[name] = value.decode("latin-1")
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await app(item_scope(parent, path, query), receive, send)
+    except HTTPException as e:
+        # Raised by the router itself (no route, wrong method), outside any route's handlers
+        return {"status": e.status_code, "headers": {}, "body": {"detail": e.detail}}
+    except Exception as e:
+        logger.error(f"Batch item GET {path} failed: {e}")
+        return {"status": 500, "headers": {}, "body": {"detail": "Internal server error"}}
+
+    body, encoding = decode_body(headers.get("content-type", ""), b"".join(chunks))
+    result = {"status": status, "headers": headers, "body": body}
+    if encoding:
+        result["encoding"] = encoding
+    return result
+
+
+async def run(app, parent: dict, items, excluded=()) -> list:
+    """Results in item order; `items` have method, path and query attributes
+
+    Paths starting with one of `excluded` are refused with a 400.
+    """
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def run_item(item):
+        if item.method.upper() != "GET":
+            return {"status": 405, "headers": {}, "body": {"detail": "Only GET requests can be batched"}}
+        path = item.path.split("?", 1)[0]
+        if not path.startswith("/api/") or path.startswith(tuple(excluded)):
+            return {"status": 400, "headers": {}, "body": {"detail": f"{path} cannot be batched"}}
+        async with semaphore:
+            return await dispatch(app, parent, item.path, item.query)
+
+    results = await asyncio.gather(*(run_item(item) for item in items))
+    return [
+        {"id": item.id, **result} if item.id is not None else result
+        for item, result in zip(items, results)
+    ]
@@ -0,0 +1,122 @@
+"""
+Benchmark: per-document P&L loop vs the columnar analytics module.
+
+Generates N synthetic POS sales (default 1,000,000) with the same mix of stored
+date shapes we see in production (IST ISO strings and BSON-style naive UTC
+datetimes), then times:
+  - legacy: the old dict loop with one fromisoformat per document
+  - analytics: column extraction through a batched cursor + vectorized bucketing
+
+Run this with: python benchmarks/bench_analytics.py [--sales 1000000] [--granularity day]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics  # noqa: E402
+
+IST = analytics.IST
+
+
+class ListCursor:
+    """Async cursor over an in-memory list, projecting like Mongo would"""
+
+    def __init__(self, docs, projection):
+        self.docs = docs
+        self.fields = [f for f, keep in projection.items() if keep and f != "_id"]
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield {f: doc[f] for f in self.fields if f in doc}
+
+
+class ListCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection):
+        return ListCursor(self.docs, projection)
+
+
+def generate_sales(count, seed=42):
+    rng = random.Random(seed)
+    start = IST.localize(datetime(2023, 1, 1, 9, 0))
+    sales = []
+    for _ in range(count):
+        sold_at = start + timedelta(minutes=rng.randrange(0, 3 * 365 * 24 * 60))
+        total = round(rng.uniform(80, 4000), 2)
+        if rng.random() < 0.5:
+            sale_date = sold_at.isoformat()
+        else:
+            # Motor returns BSON datetimes as naive UTC
+            sale_date = sold_at.astimezone(analytics.pytz.utc).replace(tzinfo=None)
+        sales.append({"sale_date": sale_date, "total": total, "cogs": round(total * 0.7, 2)})
+    return sales
+
+
+def legacy_daily_totals(sales):
+    daily = defaultdict(lambda: {"revenue": 0, "cogs": 0, "sales_count": 0})
+    for sale in sales:
+        value = sale.get("sale_date")
+        if isinstance(value, str):
+            sale_date = datetime.fromisoformat(value)
+        else:
+            sale_date = analytics.pytz.utc.localize(value)
+        date_key = sale_date.astimezone(IST).strftime("%Y-%m-%d")
+        daily[date_key]["revenue"] += sale.get("total", 0)
+        daily[date_key]["cogs"] += sale.get("cogs") or 0
+        daily[date_key]["sales_count"] += 1
+    return daily
+
+
+async def analytics_totals(collection, granularity):
+    frame = await analytics.fetch_columns(collection, {}, ["sale_date", "total", "cogs"])
+    extracted = time.perf_counter()
+    totals = analytics.sum_by_bucket(
+        frame, "sale_date", ["total", "cogs"], "sales_count", granularity
+    )
+    return frame, totals, extracted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sales", type=int, default=1_000_000)
+    parser.add_argument("--granularity", default="day", choices=list(analytics.GRANULARITIES))
+    args = parser.parse_args()
+
+    print(f"Generating {args.sales:,} sales...")
+    sales = generate_sales(args.sales)
+
+    started = time.perf_counter()
+    legacy = legacy_daily_totals(sales)
+    legacy_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    _, totals, extracted = asyncio.run(analytics_totals(ListCollection(sales), args.granularity))
+    finished = time.perf_counter()
+
+    print(f"legacy loop:        {legacy_seconds:8.3f}s  ({len(legacy)} days)")
+    print(f"analytics total:    {finished - started:8.3f}s  ({len(totals)} {args.granularity} buckets)")
+    print(f"  column extract:   {extracted - started:8.3f}s")
+    print(f"  vectorized group: {finished - extracted:8.3f}s")
+
+    legacy_revenue = sum(day["revenue"] for day in legacy.values())
+    drift = abs(legacy_revenue - float(totals["total"].sum()))
+    print(f"revenue check:      {'OK' if drift < 0.01 * max(1, args.sales) else 'MISMATCH'} (drift {drift:.4f})")
+
+
+if __name__ == "__main__":
+    main()
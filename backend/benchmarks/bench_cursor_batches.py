@@ -0,0 +1,95 @@
+"""
+Benchmark: chunked cursor iteration at sizes past the old to_list() caps.
+
+Builds N synthetic expense documents (default 60,000) behind a Motor-like
+cursor and, for several batch sizes, times `fetch_all` and `sum_fields` and
+checks that the count and amount totals match the source exactly - the old
+`to_list(10000)` cap would have dropped everything past 10k.
+
+Run this with: python benchmarks/bench_cursor_batches.py [--docs 60000]
+Exits non-zero if any total is wrong.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cursor_utils import fetch_all, sum_fields  # noqa: E402
+
+
+class ListCursor:
+    """Async cursor over an in-memory list that records its batch size"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.size = None
+
+    def batch_size(self, size):
+        self.size = size
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for start in range(0, len(self.docs), self.size or 101):
+            # One simulated round trip per batch
+            await asyncio.sleep(0)
+            for doc in self.docs[start : start + (self.size or 101)]:
+                yield doc
+
+
+def generate_expenses(count, seed=7):
+    rng = random.Random(seed)
+    return [
+        {"id": str(i), "amount": round(rng.uniform(10, 2000), 2), "expense_type": "Tea"}
+        for i in range(count)
+    ]
+
+
+async def run(docs, batch_sizes):
+    expected_amount = round(sum(d["amount"] for d in docs), 2)
+    ok = True
+    print(f"{len(docs):,} documents, expected amount total {expected_amount:,.2f}")
+    print(f"old to_list(10000) would have kept {min(len(docs), 10000):,} documents\n")
+
+    for batch_size in batch_sizes:
+        started = time.perf_counter()
+        fetched = await fetch_all(ListCursor(docs), batch_size)
+        fetch_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        totals = await sum_fields(ListCursor(docs), ["amount"], batch_size)
+        sum_seconds = time.perf_counter() - started
+
+        correct = (
+            len(fetched) == len(docs)
+            and totals["count"] == len(docs)
+            and round(totals["amount"], 2) == expected_amount
+        )
+        ok &= correct
+        print(
+            f"batch {batch_size:>6}: fetch_all {fetch_seconds:6.3f}s  "
+            f"sum_fields {sum_seconds:6.3f}s  {'OK' if correct else 'MISMATCH'}"
+        )
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--docs", type=int, default=60_000)
+    parser.add_argument("--batch-sizes", default="100,1000,5000")
+    args = parser.parse_args()
+
+    docs = generate_expenses(args.docs)
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+    if not asyncio.run(run(docs, batch_sizes)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
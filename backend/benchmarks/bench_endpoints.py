@@ -0,0 +1,360 @@
+"""
+Benchmark: hot API endpoints driven in-process through the ASGI app.
+
+Imports server.py against a local mongod, runs its startup hooks and sends
+requests through httpx's ASGITransport (no uvicorn or sockets in the way).
+For each scenario it measures p50 / p95 / p99 latency and throughput over a
+fixed number of requests, then writes everything to a JSON file.
+
+Scenarios: POST and GET /pos-sales, /dashboard/stats, /inventory-summary,
+/stock-alerts, every /reports/* endpoint in json/csv/excel/pdf and
+/reports/daily-profit-loss per granularity.
+
+With --baseline, results are compared against a stored run. Any latency
+percentile that is more than --threshold percent slower, or any throughput
+that is more than --threshold percent lower, is a regression, and the script
+exits non-zero.
+
+POST /pos-sales writes real sales (and deducts stock), so point this at a
+dedicated database - by default it uses "bano_bench", never DB_NAME.
+
+Run this with:
+  python benchmarks/bench_endpoints.py --seed-sales 200000            # seed + run
+  python benchmarks/bench_endpoints.py --output baseline.json
+  python benchmarks/bench_endpoints.py --baseline baseline.json --threshold 15
+  python benchmarks/bench_endpoints.py --results new.json --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+REPORT_FORMATS = ["json", "csv", "excel", "pdf"]
+DATED_REPORTS = ["sales", "purchases", "profit-loss", "extra-expenses"]
+GRANULARITIES = ["day", "week", "month"]
+
+# Metrics where a larger value is worse (throughput is the other way round)
+LATENCY_METRICS = ["p50_ms", "p95_ms", "p99_ms"]
+
+
+def build_scenarios(start_date, end_date):
+    """(name, method, path, params) for every benchmarked request"""
+    window = {"start_date": start_date, "end_date": end_date}
+    scenarios = [
+        ("POST /pos-sales", "POST", "/api/pos-sales", None),
+        ("GET /pos-sales", "GET", "/api/pos-sales", window),
+        ("GET /dashboard/stats", "GET", "/api/dashboard/stats", None),
+        ("GET /inventory-summary", "GET", "/api/inventory-summary", None),
+        ("GET /stock-alerts", "GET", "/api/stock-alerts", None),
+    ]
+    for report in DATED_REPORTS:
+        for fmt in REPORT_FORMATS:
+            scenarios.append(
+                (f"GET /reports/{report} [{fmt}]", "GET", f"/api/reports/{report}", {**window, "format": fmt})
+            )
+    for fmt in REPORT_FORMATS:
+        scenarios.append(
+            (f"GET /reports/inventory [{fmt}]", "GET", "/api/reports/inventory", {"format": fmt})
+        )
+    for granularity in GRANULARITIES:
+        scenarios.append(
+            (
+                f"GET /reports/daily-profit-loss [{granularity}]",
+                "GET",
+                "/api/reports/daily-profit-loss",
+                {**window, "granularity": granularity},
+            )
+        )
+    return scenarios
+
+
+class SaleFactory:
+    """Deterministic POS sale payloads built from the seeded catalog"""
+
+    def __init__(self, products, seed, sale_date):
+        self.products = products
+        self.rng = random.Random(seed)
+        self.sale_date = sale_date
+
+    def item(self, product):
+        unit = product.get("sale_unit", "weight")
+        price = product["selling_price"]
+        if unit == "pieces":
+            pieces = self.rng.randint(1, 6)
+            return {
+                "derived_product_id": product["id"],
+                "derived_product_name": product["name"],
+                "main_category_id": product["main_category_id"],
+                "quantity_kg": 0,
+                "quantity_pieces": pieces,
+                "selling_price": price,
+                "total": round(price * pieces, 2),
+            }
+        if unit == "package":
+            packages = self.rng.randint(1, 3)
+            quantity_kg = round(packages * (product.get("package_weight_kg") or 0.5), 3)
+            total = round(price * packages, 2)
+        else:
+            quantity_kg = round(self.rng.uniform(0.25, 2.5), 3)
+            total = round(price * quantity_kg, 2)
+        return {
+            "derived_product_id": product["id"],
+            "derived_product_name": product["name"],
+            "main_category_id": product["main_category_id"],
+            "quantity_kg": quantity_kg,
+            "selling_price": price,
+            "total": total,
+        }
+
+    def sale(self):
+        items = [
+            self.item(self.rng.choice(self.products))
+            for _ in range(self.rng.choice([1, 1, 2, 2, 3]))
+        ]
+        subtotal = round(sum(item["total"] for item in items), 2)
+        return {
+            "items": items,
+            "subtotal": subtotal,
+            "tax": 0,
+            "discount": 0,
+            "total": subtotal,
+            "payment_method": self.rng.choice(["cash", "upi", "card"]),
+            # The POS screen always sends the selected day
+            "sale_date": self.sale_date,
+        }
+
+
+def summarize(latencies, errors, elapsed):
+    """Latency percentiles (ms) and throughput for one scenario"""
+    ordered = sorted(latencies)
+    if len(ordered) >= 2:
+        cuts = statistics.quantiles(ordered, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = ordered[0] if ordered else 0.0
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "p50_ms": round(p50 * 1000, 2),
+        "p95_ms": round(p95 * 1000, 2),
+        "p99_ms": round(p99 * 1000, 2),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2) if ordered else 0.0,
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+async def run_scenario(client, method, path, params, sales, args):
+    """Warm up, then send args.requests requests with args.concurrency workers"""
+
+    async def send():
+        if method == "POST":
+            response = await client.post(path, json=sales.sale())
+        else:
+            response = await client.get(path, params=params)
+        return response.status_code
+
+    for _ in range(args.warmup):
+        await send()
+
+    latencies = []
+    errors = 0
+    remaining = args.requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            status_code = await send()
+            latencies.append(time.perf_counter() - started)
+            if status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def run(args):
+    if args.seed_sales:
+        import seed_data
+
+        await seed_data.seed(
+            seed_data.parse_args(
+                [
+                    "--reset",
+                    "--sales", str(args.seed_sales),
+                    "--end-date", args.end_date,
+                    "--mongo-url", os.environ["MONGO_URL"],
+                    "--db-name", os.environ["DB_NAME"],
+                ]
+            )
+        )
+
+    import server
+
+    # Per-request info logs would dominate the timings
+    server.logger.setLevel(logging.WARNING)
+    await server.app.router.startup()
+    await server.startup.wait()
+
+    try:
+        admin = await server.db.users.find_one({"is_admin": True}, {"_id": 0, "id": 1})
+        products = await server.db.derived_products.find({}, {"_id": 0}).to_list(length=None)
+        if not admin or not products:
+            print(f"❌ Database '{os.environ['DB_NAME']}' has no admin or derived products.")
+            print("   Seed it first: --seed-sales 200000")
+            return None
+
+        token = server.create_access_token({"sub": admin["id"]})
+        sales = SaleFactory(products, args.seed, args.end_date)
+        end_day = datetime.strptime(args.end_date, "%Y-%m-%d")
+        start_date = (end_day - timedelta(days=args.days - 1)).strftime("%Y-%m-%d")
+        scenarios = [
+            scenario
+            for scenario in build_scenarios(start_date, args.end_date)
+            if not args.only or any(part in scenario[0] for part in args.only)
+        ]
+
+        counts = {
+            name: await server.db[name].estimated_document_count()
+            for name in ("pos_sales", "inventory_purchases", "extra_expenses", "derived_products")
+        }
+        print(
+            f"🏁 {len(scenarios)} scenarios x {args.requests} requests "
+            f"(concurrency {args.concurrency}), window {start_date} → {args.end_date}"
+        )
+        print("   " + ", ".join(f"{name} {count:,}" for name, count in counts.items()) + "\n")
+
+        results = {}
+        # Unhandled handler errors come back as 500s (counted as errors) instead of aborting the run
+        transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url="http://bench",
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=None,
+        ) as client:
+            for name, method, path, params in scenarios:
+                results[name] = await run_scenario(client, method, path, params, sales, args)
+                result = results[name]
+                print(
+                    f"{name:<44} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+                    f"p99 {result['p99_ms']:>9.2f}ms  {result['throughput_rps']:>8.2f} req/s"
+                    + (f"  ⚠️ {result['errors']} errors" if result["errors"] else "")
+                )
+
+        return {
+            "meta": {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "db_name": os.environ["DB_NAME"],
+                "documents": counts,
+                "window": {"start_date": start_date, "end_date": args.end_date},
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "warmup": args.warmup,
+            },
+            "results": results,
+        }
+    finally:
+        await server.app.router.shutdown()
+
+
+def compare(baseline, current, threshold):
+    """Print a per-scenario comparison and return the list of regressions"""
+    regressions = []
+    print(f"\nComparison against baseline (threshold {threshold:g}%)")
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"  {name:<44} (not in baseline)")
+            continue
+
+        changes = []
+        for metric in LATENCY_METRICS + ["throughput_rps"]:
+            before, after = base.get(metric) or 0, result.get(metric) or 0
+            if not before:
+                continue
+            change = (after - before) / before * 100
+            # Slower latency or lower throughput counts against us
+            worse = change if metric in LATENCY_METRICS else -change
+            if worse > threshold:
+                regressions.append((name, metric, before, after, change))
+            changes.append(f"{metric.replace('_ms', '').replace('_rps', '')} {change:+6.1f}%")
+        print(f"  {name:<44} " + "  ".join(changes))
+
+    for name in baseline["results"]:
+        if name not in current["results"]:
+            print(f"  {name:<44} (missing from this run)")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {threshold:g}%:")
+        for name, metric, before, after, change in regressions:
+            print(f"   {name} {metric}: {before} → {after} ({change:+.1f}%)")
+    else:
+        print("\n✅ No regressions")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=50, help="timed requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight per scenario")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed requests per scenario")
+    parser.add_argument("--days", type=int, default=30, help="report window length in days")
+    parser.add_argument(
+        "--end-date",
+        default=datetime.now().strftime("%Y-%m-%d"),
+        help="last day of the report window (and of seeded data), YYYY-MM-DD",
+    )
+    parser.add_argument("--only", nargs="*", help="run scenarios whose name contains any of these")
+    parser.add_argument("--seed", type=int, default=7, help="random seed for POST payloads")
+    parser.add_argument("--seed-sales", type=int, help="reset and seed the database with this many sales first")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="bano_bench")
+    parser.add_argument("--output", default="bench_endpoints.json", help="where to write results")
+    parser.add_argument("--baseline", help="stored results to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed regression in percent")
+    parser.add_argument("--results", help="compare this stored results file instead of running")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+
+    if args.results:
+        with open(args.results) as f:
+            current = json.load(f)
+    else:
+        # server.py reads these at import time
+        os.environ["MONGO_URL"] = args.mongo_url
+        os.environ["DB_NAME"] = args.db_name
+        current = asyncio.run(run(args))
+        if current is None:
+            sys.exit(1)
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\n📄 Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(baseline, current, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
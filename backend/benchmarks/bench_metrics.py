@@ -0,0 +1,114 @@
+"""
+Benchmark: overhead of the metrics middleware and Mongo command listener.
+
+Calls a minimal FastAPI app directly through ASGI (no HTTP client or sockets)
+N times with and without MetricsMiddleware. The difference is the middleware
+cost per request. Because the endpoint does almost nothing, this is the worst
+case - real handlers spend milliseconds on Mongo round trips.
+
+It also times one MongoCommandMetrics started + succeeded pair, which every
+Mongo command pays once.
+
+Run this with: python benchmarks/bench_metrics.py [--requests 20000] [--repeat 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI  # noqa: E402
+
+import metrics  # noqa: E402
+
+
+def build_app():
+    app = FastAPI()
+
+    @app.get("/api/items/{item_id}")
+    async def get_item(item_id: str):
+        return {"id": item_id}
+
+    return app
+
+
+async def drive(app, requests):
+    """Seconds taken by `requests` sequential ASGI calls"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/items/42",
+        "raw_path": b"/api/items/42",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - started
+
+
+def listener_cost(events):
+    listener = metrics.MongoCommandMetrics()
+    start = SimpleNamespace(
+        connection_id=("localhost", 27017), request_id=1, command_name="find", command={"find": "pos_sales"}
+    )
+    done = SimpleNamespace(
+        connection_id=("localhost", 27017), request_id=1, command_name="find", duration_micros=850
+    )
+    started = time.perf_counter()
+    for _ in range(events):
+        listener.started(start)
+        listener.succeeded(done)
+    return (time.perf_counter() - started) / events
+
+
+async def run(args):
+    plain = build_app()
+    instrumented = metrics.MetricsMiddleware(build_app())
+
+    # Warm both paths (route tables, endpoint -> path cache)
+    await drive(plain, 100)
+    await drive(instrumented, 100)
+
+    plain_best = min([await drive(plain, args.requests) for _ in range(args.repeat)])
+    instrumented_best = min([await drive(instrumented, args.requests) for _ in range(args.repeat)])
+
+    plain_us = plain_best / args.requests * 1e6
+    instrumented_us = instrumented_best / args.requests * 1e6
+    overhead_us = instrumented_us - plain_us
+    print(f"{args.requests:,} requests, best of {args.repeat}")
+    print(f"without middleware: {plain_us:8.2f}µs per request")
+    print(f"with middleware:    {instrumented_us:8.2f}µs per request")
+    print(f"overhead:           {overhead_us:8.2f}µs per request ({overhead_us / plain_us * 100:.1f}% of a no-op route)")
+    print(f"mongo listener:     {listener_cost(args.requests) * 1e6:8.2f}µs per command")
+
+    rendered = metrics.render()
+    print(f"exposition:         {len(rendered.splitlines())} lines, {len(rendered):,} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark: Python-layer hot paths on the in-memory database backend.
+
+Seeds an in-memory database with seed_data's simulator (no mongod needed),
+binds it as the app database and times the code that runs between Mongo
+round trips:
+  - fifo: fifo_deduct_weight against the seeded purchase lots
+  - report: analytics.profit_loss_breakdown over the whole history
+  - serialization: validating sales as List[POSSaleNew] and rendering them
+    with CustomJSONResponse, the same path a response_model takes
+
+Database work here is in-process dict operations, so the numbers isolate our
+own Python cost. Compare runs of this script with each other, not with
+bench_endpoints.py.
+
+Run this with: python benchmarks/bench_python_layer.py [--sales 50000] [--repeat 5]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from typing import List
+
+os.environ["DB_BACKEND"] = "memory"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import TypeAdapter  # noqa: E402
+
+import analytics  # noqa: E402
+import seed_data  # noqa: E402
+import server  # noqa: E402
+
+END_DATE = "2026-06-30"
+
+
+async def seed(sales):
+    args = seed_data.parse_args(["--sales", str(sales), "--years", "1", "--end-date", END_DATE])
+    simulator = seed_data.Simulator(args)
+    simulator.build_catalog()
+    writer = seed_data.BatchWriter(server.db, args.batch_size, 1)
+    await simulator.simulate(writer)
+    await writer.close()
+    return simulator
+
+
+async def timed(repeat, action):
+    """Seconds per run of `action` over `repeat` runs"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await action()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def report(name, timings, unit_count=1, unit="run"):
+    best, mean = min(timings), statistics.fmean(timings)
+    print(
+        f"{name:<16} best {best * 1000:9.2f}ms  mean {mean * 1000:9.2f}ms"
+        + (f"  ({mean / unit_count * 1e6:8.1f}µs per {unit})" if unit_count > 1 else "")
+    )
+
+
+async def run(args):
+    server.logger.setLevel(logging.WARNING)
+
+    started = time.perf_counter()
+    simulator = await seed(args.sales)
+    await server.app.router.startup()
+    await server.startup.wait()
+    counts = {
+        name: await server.db[name].estimated_document_count()
+        for name in ("pos_sales", "inventory_purchases", "extra_expenses")
+    }
+    print(
+        f"Seeded in-memory database in {time.perf_counter() - started:.1f}s: "
+        + ", ".join(f"{name} {count:,}" for name, count in counts.items())
+        + "\n"
+    )
+
+    categories = [category["id"] for category in simulator.categories]
+
+    async def fifo():
+        for call in range(args.fifo_calls):
+            await server.fifo_deduct_weight(categories[call % len(categories)], 0.5)
+
+    report("fifo", await timed(args.repeat, fifo), args.fifo_calls, "deduction")
+
+    start_date = simulator.start_day.strftime("%Y-%m-%d")
+
+    async def profit_loss():
+        await analytics.profit_loss_breakdown(server.db, start_date, END_DATE, "day")
+
+    report("report", await timed(args.repeat, profit_loss))
+
+    sales = await server.db.pos_sales.find({}, {"_id": 0}).to_list(length=args.serialize)
+    adapter = TypeAdapter(List[server.POSSaleNew])
+
+    async def serialize():
+        models = adapter.validate_python(sales)
+        server.CustomJSONResponse(adapter.dump_python(models, mode="json"))
+
+    report("serialization", await timed(args.repeat, serialize), len(sales), "sale")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sales", type=int, default=50_000, help="sales to seed")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fifo-calls", type=int, default=500, help="deductions per fifo run")
+    parser.add_argument("--serialize", type=int, default=5000, help="sales per serialization run")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark: worker import time and memory, with and without the report libraries.
+
+Each sample is a fresh Python process, the same thing a uvicorn worker is.
+It imports server.py and reports the import time, its resident memory (RSS)
+and how many modules it loaded:
+  - lazy: `import server` as it is now; openpyxl and reportlab stay unloaded
+    until the first export
+  - eager: `import server` followed by `import report_renderers`. This is
+    what every worker paid when server.py imported the report libraries at
+    module level.
+
+The difference is what each worker saves until someone exports a report.
+Multiply it by your worker count for the saving on the box.
+
+Run this with: python benchmarks/bench_startup.py [--runs 7] [--workers 4]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, resource, sys, time
+started = time.perf_counter()
+import server
+if sys.argv[1] == "eager":
+    import report_renderers
+elapsed = time.perf_counter() - started
+
+rss_kb = None
+with open("/proc/self/status") as status:
+    for line in status:
+        if line.startswith("VmRSS:"):
+            rss_kb = int(line.split()[1])
+if rss_kb is None:
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "seconds": elapsed,
+    "rss_mb": rss_kb / 1024,
+    "modules": len(sys.modules),
+    "report_libs": any(name in sys.modules for name in ("openpyxl", "reportlab")),
+}))
+"""
+
+
+def sample(mode: str) -> dict:
+    # The in-memory backend keeps the measurement free of Mongo connection setup
+    env = {**os.environ, "DB_BACKEND": "memory"}
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, mode],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples) -> dict:
+    return {
+        "seconds": statistics.median(s["seconds"] for s in samples),
+        "rss_mb": statistics.median(s["rss_mb"] for s in samples),
+        "modules": statistics.median(s["modules"] for s in samples),
+        "report_libs": samples[0]["report_libs"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=7, help="fresh processes per mode")
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn workers, for the per-box saving")
+    args = parser.parse_args()
+
+    # Warm the filesystem cache and .pyc files so the first run isn't an outlier
+    sample("eager")
+
+    results = {}
+    for mode in ("eager", "lazy"):
+        results[mode] = summarize([sample(mode) for _ in range(args.runs)])
+
+    print(f"median of {args.runs} fresh processes per mode")
+    print(f"{'mode':<8}{'import':>12}{'RSS':>12}{'modules':>10}  report libs loaded")
+    for mode, result in results.items():
+        print(
+            f"{mode:<8}{result['seconds'] * 1000:>10.0f}ms{result['rss_mb']:>10.1f}MB"
+            f"{result['modules']:>10.0f}  {'yes' if result['report_libs'] else 'no'}"
+        )
+
+    saved_ms = (results["eager"]["seconds"] - results["lazy"]["seconds"]) * 1000
+    saved_mb = results["eager"]["rss_mb"] - results["lazy"]["rss_mb"]
+    print(f"\nper worker: {saved_ms:.0f}ms faster import, {saved_mb:.1f}MB less RSS")
+    print(f"{args.workers} workers: {saved_mb * args.workers:.1f}MB less RSS until someone exports")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Startup pipeline and readiness state.
+
+The server registers its startup work as ordered steps. The steps run in a
+background task, so the worker answers /api/health right away. /api/ready
+reports 503 until every required step has succeeded, so a load balancer only
+routes traffic to warm workers.
+
+- Required steps (connect, seed) are retried with capped exponential
+  backoff until they succeed. A worker that cannot reach Mongo stays
+  not-ready instead of serving errors.
+- Optional steps (index builds, warm-ups) are attempted once. A failure is
+  logged and reported in the step status without blocking readiness.
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+RETRY_INITIAL_SECONDS = 0.5
+RETRY_MAX_SECONDS = 30.0
+
+
+class Step:
+    def __init__(self, name, function, required):
+        self.name = name
+        self.function = function
+        self.required = required
+        self.state = "pending"
+        self.attempts = 0
+        self.duration_ms = None
+        self.result = None
+        self.error = None
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "required": self.required,
+            "state": self.state,
+            "attempts": self.attempts,
+            "duration_ms": self.duration_ms,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class Bootstrap:
+    def __init__(self):
+        self.steps = []
+        self.ready = False
+        self.task = None
+        self.started_at = None
+        self.duration_ms = None
+
+    def step(self, name: str, required: bool = False):
+        """Decorator registering an async function as the next pipeline step"""
+
+        def register(function):
+            self.steps.append(Step(name, function, required))
+            return function
+
+        return register
+
+    def start(self):
+        """Run the pipeline in the background (call from a startup hook)"""
+        self.ready = False
+        self.started_at = time.perf_counter()
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    async def wait(self):
+        """Block until the pipeline has finished (scripts and benchmarks)"""
+        if self.task is not None:
+            await asyncio.shield(self.task)
+
+    async def stop(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    async def run(self):
+        for step in self.steps:
+            await self.run_step(step)
+        self.duration_ms = round((time.perf_counter() - self.started_at) * 1000, 1)
+        self.ready = all(step.state == "done" for step in self.steps if step.required)
+        if self.ready:
+            logger.info(f"✅ Bootstrap finished in {self.duration_ms}ms, worker ready")
+        else:
+            logger.error("Bootstrap finished without its required steps, worker not ready")
+
+    async def run_step(self, step: Step):
+        delay = RETRY_INITIAL_SECONDS
+        step.state = "running"
+        while True:
+            step.attempts += 1
+            started = time.perf_counter()
+            try:
+                step.result = await step.function()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                step.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+                step.error = str(e)
+                if not step.required:
+                    step.state = "failed"
+                    logger.error(f"Bootstrap step {step.name} failed: {e}")
+                    return
+                logger.error(f"Bootstrap step {step.name} failed (attempt {step.attempts}), retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_SECONDS)
+                continue
+            step.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            step.state = "done"
+            step.error = None
+            return
+
+    def report(self) -> dict:
+        return {
+            "ready": self.ready,
+            "duration_ms": self.duration_ms,
+            "steps": [step.as_dict() for step in self.steps],
+        }
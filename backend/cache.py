@@ -0,0 +1,161 @@
+"""
+Per-process LRU cache that stays correct when several workers write.
+
+Entries live in a namespace, conventionally the collection they were read
+from ("main_categories", "users"). Each namespace has a generation counter in
+the `cache_generations` collection:
+
+- a handler that writes calls `await cache.shared.bump("main_categories")`, which
+  increments the counter in Mongo and updates this worker's copy at once,
+  so the writer never reads its own stale data
+- every worker polls the collection every CACHE_POLL_SECONDS (one small find
+  over a handful of documents) and picks up the other workers' bumps
+- an entry is served only while its namespace is still at the generation it
+  was loaded under. Everything cached before a bump is ignored after it.
+
+Other workers can serve stale data for at most one poll interval. If polling
+stops working (Mongo unreachable), the cache goes into pass-through mode
+after CACHE_MAX_STALENESS seconds rather than serve data it can't vouch for.
+CACHE_TTL_SECONDS bounds every entry as a safety net for writes that bypass
+the API, e.g. the seed and cleanup scripts.
+
+Cached values are shared between requests. Treat them as read-only.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from pymongo import ReturnDocument
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "cache_generations"
+MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "2000"))
+TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", "300"))
+POLL_SECONDS = float(os.environ.get("CACHE_POLL_SECONDS", "1"))
+MAX_STALENESS = float(os.environ.get("CACHE_MAX_STALENESS", str(POLL_SECONDS * 5)))
+
+CACHE_REQUESTS = metrics.Counter(
+    "cache_requests_total", "Cache lookups by namespace and result (hit, miss, bypass)",
+    ("namespace", "result"),
+)
+CACHE_BUMPS = metrics.Counter(
+    "cache_generation_bumps_total", "Namespace generation bumps made by this worker", ("namespace",)
+)
+
+
+class GenerationCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS, poll_interval=POLL_SECONDS,
+                 max_staleness=MAX_STALENESS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.max_staleness = max_staleness
+        # (namespace, key) -> (generation, expires_at, value), least recently used first
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.synced_at = None
+        self.db = None
+        self.task = None
+
+    # Generations
+
+    async def start(self, db):
+        """Load the current generations and start polling (bootstrap step)"""
+        self.db = db
+        await self.sync()
+        self.task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def sync(self):
+        documents = await self.db[COLLECTION].find({}, {"generation": 1}).to_list(length=None)
+        for document in documents:
+            self._advance(document["_id"], document.get("generation", 0))
+        self.synced_at = time.monotonic()
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache generation poll failed: {e}")
+
+    def _advance(self, namespace: str, generation: int):
+        # Generations only move forward; a slow poll must not undo a newer local bump
+        if generation > self.generations.get(namespace, 0):
+            self.generations[namespace] = generation
+
+    def generation(self, namespace: str) -> int:
+        return self.generations.get(namespace, 0)
+
+    def fresh(self) -> bool:
+        """Have we heard from the other workers recently enough to trust local entries?"""
+        return self.synced_at is not None and time.monotonic() - self.synced_at <= self.max_staleness
+
+    async def bump(self, *namespaces):
+        """Invalidate namespaces on every worker (call after the write has been made)"""
+        for namespace in namespaces:
+            CACHE_BUMPS.inc((namespace,))
+            try:
+                document = await self.db[COLLECTION].find_one_and_update(
+                    {"_id": namespace},
+                    {"$inc": {"generation": 1}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+                self._advance(namespace, document["generation"])
+            except Exception as e:
+                # Other workers keep their entries until the TTL; this one drops them now
+                logger.error(f"Cache bump of {namespace} failed: {e}")
+                self._advance(namespace, self.generation(namespace) + 1)
+
+    # Entries
+
+    async def get_or_load(self, namespace: str, key, loader, ttl: float = None):
+        """Cached value of `key`, or `await loader()` stored under the current generation"""
+        if not self.fresh():
+            CACHE_REQUESTS.inc((namespace, "bypass"))
+            return await loader()
+
+        entry_key = (namespace, key)
+        generation = self.generation(namespace)
+        entry = self.entries.get(entry_key)
+        if entry is not None:
+            entry_generation, expires_at, value = entry
+            if entry_generation == generation and expires_at > time.monotonic():
+                self.entries.move_to_end(entry_key)
+                CACHE_REQUESTS.inc((namespace, "hit"))
+                return value
+            del self.entries[entry_key]
+
+        CACHE_REQUESTS.inc((namespace, "miss"))
+        # The generation is read before loading: a bump landing mid-load leaves this entry already stale
+        value = await loader()
+        if value is not None:
+            self.entries[entry_key] = (generation, time.monotonic() + (ttl or self.ttl), value)
+            self.entries.move_to_end(entry_key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "fresh": self.fresh(),
+            "generations": dict(self.generations),
+        }
+
+
+shared = GenerationCache()
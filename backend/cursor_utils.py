@@ -0,0 +1,45 @@
+"""
+Chunked cursor iteration.
+
+Handlers used to call `to_list(1000)` / `to_list(10000)` as a safety cap, which
+silently dropped everything past the cap once a shop grew. These helpers walk a
+Motor cursor in fixed-size batches instead: memory per round trip stays bounded
+by the batch size and no document is ever left out.
+"""
+import os
+
+# Documents per cursor round trip (and per yielded chunk)
+CURSOR_BATCH_SIZE = int(os.environ.get("CURSOR_BATCH_SIZE", "1000"))
+
+
+async def iter_batches(cursor, batch_size: int = None):
+    """Yield lists of up to `batch_size` documents until the cursor is exhausted"""
+    batch_size = batch_size or CURSOR_BATCH_SIZE
+    batch = []
+    async for doc in cursor.batch_size(batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def fetch_all(cursor, batch_size: int = None) -> list:
+    """Every document from the cursor, fetched batch by batch (never truncated)"""
+    documents = []
+    async for batch in iter_batches(cursor, batch_size):
+        documents.extend(batch)
+    return documents
+
+
+async def sum_fields(cursor, fields, batch_size: int = None) -> dict:
+    """Running totals of `fields` plus a document count, holding one batch at a time"""
+    totals = {field: 0 for field in fields}
+    totals["count"] = 0
+    async for batch in iter_batches(cursor, batch_size):
+        totals["count"] += len(batch)
+        for doc in batch:
+            for field in fields:
+                totals[field] += doc.get(field) or 0
+    return totals
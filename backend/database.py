@@ -0,0 +1,73 @@
+"""
+Database backend selection and injection.
+
+DB_BACKEND picks the engine behind every collection the API uses:
+- motor (default): MongoDB at MONGO_URL through AsyncIOMotorClient
+- memory: the in-process engine from memory_db, for tests and profiling
+
+Handlers reach the database through `db`, a proxy over whatever database is
+currently bound. `bind()` swaps the backend for the whole app (a benchmark can
+bind a fresh in-memory database per run), and `get_db` is the matching FastAPI
+dependency, so `app.dependency_overrides[get_db]` and route signatures like
+`db = Depends(get_db)` resolve to the same place.
+"""
+import os
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from memory_db import MemoryClient
+
+BACKENDS = ("motor", "memory")
+
+
+def create_client(backend: str = None, **kwargs):
+    """Client for the configured backend (kwargs such as event_listeners go to the client)"""
+    backend = backend or os.environ.get("DB_BACKEND", "motor")
+    if backend == "motor":
+        return AsyncIOMotorClient(os.environ["MONGO_URL"], **kwargs)
+    if backend == "memory":
+        return MemoryClient(**kwargs)
+    raise ValueError(f"DB_BACKEND must be one of {', '.join(BACKENDS)}, got '{backend}'")
+
+
+def database_name(backend: str = None) -> str:
+    backend = backend or os.environ.get("DB_BACKEND", "motor")
+    if backend == "memory":
+        return os.environ.get("DB_NAME", "bano_memory")
+    return os.environ["DB_NAME"]
+
+
+class DatabaseProxy:
+    """Forwards collection access to the currently bound database"""
+
+    def __init__(self):
+        self._database = None
+
+    def _bound(self):
+        if self._database is None:
+            raise RuntimeError("No database bound - call database.bind() first")
+        return self._database
+
+    def __getattr__(self, name):
+        return getattr(self._bound(), name)
+
+    def __getitem__(self, name):
+        return self._bound()[name]
+
+
+db = DatabaseProxy()
+
+
+def bind(database):
+    """Point `db` (and `get_db`) at a database; returns the proxy"""
+    db._database = database
+    return db
+
+
+def bound_database():
+    return db._database
+
+
+async def get_db():
+    """FastAPI dependency returning the bound database"""
+    return db
@@ -0,0 +1,91 @@
+"""
+Conditional GET (ETag / If-None-Match) for catalog-style read endpoints.
+
+Each registered route has a version source: a function of the request scope
+that returns a version string built from data already in memory. Most sources
+use cache.shared generations, which every write bumps. The middleware then
+works like this:
+
+- the ETag is a hash of the route, the query string and the version
+- a request whose If-None-Match matches gets 304 at once. The handler never
+  runs, so there is no Mongo query and no serialization. The token is still
+  checked (signature only, through `authorize`).
+- any other request runs normally and its 200 response carries the ETag
+
+The version is read before the handler runs. A write landing during the
+request can only make the response newer than its ETag, never older.
+
+Versions also roll over every CACHE_TTL_SECONDS. Writes that bypass the API
+(scripts) therefore become visible within the same bound the cache gives them.
+If cache.shared is not fresh, generations can't be trusted, so the middleware
+stays out of the way.
+"""
+import hashlib
+import time
+
+import cache
+import metrics
+
+CONDITIONAL_REQUESTS = metrics.Counter(
+    "conditional_get_requests_total",
+    "Conditional GETs by route and result (not_modified, modified)",
+    ("route", "result"),
+)
+
+
+def generations(*namespaces):
+    """Version source for a route whose response depends only on these cache namespaces"""
+
+    def version(scope) -> str:
+        return ".".join(str(cache.shared.generation(namespace)) for namespace in namespaces)
+
+    return version
+
+
+def make_etag(path: str, query: bytes, version: str) -> str:
+    epoch = int(time.time() // cache.shared.ttl)
+    digest = hashlib.sha1(f"{path}?{query.decode('latin-1')}|{version}|{epoch}".encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def if_none_match(scope):
+    for name, value in scope["headers"]:
+        if name == b"if-none-match":
+            return [tag.strip() for tag in value.decode("latin-1").split(",")]
+    return []
+
+
+class ConditionalGetMiddleware:
+    """ETags for the GET routes in `sources` (path -> version source)"""
+
+    def __init__(self, app, sources, authorize):
+        self.app = app
+        self.sources = sources
+        self.authorize = authorize
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+        source = self.sources.get(scope["path"])
+        if source is None or not cache.shared.fresh():
+            return await self.app(scope, receive, send)
+
+        etag = make_etag(scope["path"], scope.get("query_string", b""), source(scope))
+        headers = [(b"etag", etag.encode()), (b"cache-control", b"private, no-cache")]
+
+        candidates = if_none_match(scope)
+        matched = etag in candidates or f"W/{etag}" in candidates
+        if matched and self.authorize(scope):
+            CONDITIONAL_REQUESTS.inc((scope["path"], "not_modified"))
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                message = {**message, "headers": [*message.get("headers", []), *headers]}
+            await send(message)
+
+        if candidates and not matched:
+            CONDITIONAL_REQUESTS.inc((scope["path"], "modified"))
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,268 @@
+"""
+Live change events for the dashboard and inventory screens (GET /api/events).
+
+Handlers that change stock or daily totals publish small events through
+`broker`. Screens subscribe with an EventSource and patch what they show
+instead of polling the expensive aggregation endpoints. Events carry the
+new values, not increments, so a dropped event is fixed by the next one.
+
+- Screens connected to this worker get each event straight from the broker
+  (one queue per connection).
+- Events are also written to the `live_events` collection. A worker polls
+  it every EVENTS_POLL_SECONDS while it has subscribers, so events published
+  by other workers reach its screens too. A worker with no subscribers does
+  not poll.
+- Each stream sends a comment line every EVENTS_HEARTBEAT_SECONDS, so
+  proxies keep the connection open and dead clients are noticed.
+- A worker with subscribers keeps a presence document in `live_subscribers`
+  (refreshed while it has them, expiring after EVENTS_PRESENCE_SECONDS).
+  `has_audience()` reads it, so no worker recomputes live values while no
+  screen is connected anywhere.
+
+`Coalescer` batches the work that produces events. A burst of writes (one
+sale touching five categories) is recomputed and published once after
+EVENTS_DEBOUNCE_MS, not once per write.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "live_events"
+PRESENCE = "live_subscribers"
+ORIGIN = uuid.uuid4().hex
+QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", "100"))
+HEARTBEAT_SECONDS = float(os.environ.get("EVENTS_HEARTBEAT_SECONDS", "15"))
+POLL_SECONDS = float(os.environ.get("EVENTS_POLL_SECONDS", "1"))
+DEBOUNCE_MS = float(os.environ.get("EVENTS_DEBOUNCE_MS", "100"))
+RETENTION_SECONDS = int(os.environ.get("EVENTS_RETENTION_SECONDS", "3600"))
+PRESENCE_SECONDS = float(os.environ.get("EVENTS_PRESENCE_SECONDS", "30"))
+# Other workers' clocks may run a little behind ours; re-read this much of the past
+RELAY_OVERLAP_SECONDS = 2.0
+
+SUBSCRIBERS = metrics.Gauge("live_event_subscribers", "Event streams open on this worker")
+EVENTS_PUBLISHED = metrics.Counter(
+    "live_events_published_total", "Events published by this worker", ("type",)
+)
+EVENTS_DROPPED = metrics.Counter(
+    "live_events_dropped_total", "Events dropped because a subscriber fell behind"
+)
+
+
+def utc_now() -> datetime:
+    # Naive UTC, the shape both backends store and return
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def format_event(event: dict) -> str:
+    data = json.dumps(event["data"], default=str, separators=(",", ":"))
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+class Broker:
+    def __init__(self, queue_size=QUEUE_SIZE, poll_interval=POLL_SECONDS):
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.subscribers = set()
+        # Ids of relayed events already delivered (the relay window overlaps)
+        self.seen = deque(maxlen=4096)
+        self.seen_ids = set()
+        self.since = None
+        self.db = None
+        self.task = None
+        # When this worker last wrote its presence document (monotonic)
+        self.announced_at = None
+
+    # Relay between workers
+
+    async def start(self, db):
+        """Start relaying other workers' events (bootstrap step)"""
+        self.db = db
+        self.since = utc_now()
+        self.task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        for queue in list(self.subscribers):
+            queue.put_nowait(None)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if not self.subscribers:
+                # Nobody to deliver to; don't replay the idle period to the next subscriber
+                self.since = utc_now()
+                continue
+            if self.announced_at is None or time.monotonic() - self.announced_at > PRESENCE_SECONDS / 2:
+                await self.announce()
+            try:
+                await self.relay()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Live event relay failed: {e}")
+
+    async def relay(self):
+        events = (
+            await self.db[COLLECTION]
+            .find(
+                {
+                    "created_at": {"$gte": self.since - timedelta(seconds=RELAY_OVERLAP_SECONDS)},
+                    "origin": {"$ne": ORIGIN},
+                },
+                {"_id": 0},
+            )
+            .sort("created_at", 1)
+            .to_list(length=None)
+        )
+        for event in events:
+            self.since = max(self.since, event["created_at"])
+            if event["id"] in self.seen_ids:
+                continue
+            self._remember(event["id"])
+            self.deliver(event)
+
+    # Presence across workers
+
+    async def announce(self):
+        """Write (or, with no subscribers left, remove) this worker's presence document"""
+        if self.db is None:
+            return
+        try:
+            if self.subscribers:
+                await self.db[PRESENCE].update_one(
+                    {"_id": ORIGIN},
+                    {
+                        "$set": {
+                            "subscribers": len(self.subscribers),
+                            "expires_at": utc_now() + timedelta(seconds=PRESENCE_SECONDS),
+                        }
+                    },
+                    upsert=True,
+                )
+                self.announced_at = time.monotonic()
+            else:
+                await self.db[PRESENCE].delete_one({"_id": ORIGIN})
+                self.announced_at = None
+        except Exception as e:
+            logger.warning(f"Could not update live subscriber presence: {e}")
+
+    async def has_audience(self) -> bool:
+        """Is a screen connected to any worker? (else live values aren't worth computing)"""
+        if self.subscribers:
+            return True
+        if self.db is None:
+            return False
+        try:
+            present = await self.db[PRESENCE].find_one({"expires_at": {"$gt": utc_now()}}, {"_id": 1})
+        except Exception as e:
+            logger.warning(f"Could not read live subscriber presence: {e}")
+            return True
+        return present is not None
+
+    def _remember(self, event_id: str):
+        if len(self.seen) == self.seen.maxlen:
+            self.seen_ids.discard(self.seen[0])
+        self.seen.append(event_id)
+        self.seen_ids.add(event_id)
+
+    # Publishing
+
+    async def publish(self, event_type: str, data: dict):
+        event = {
+            "id": uuid.uuid4().hex,
+            "type": event_type,
+            "data": data,
+            "origin": ORIGIN,
+            "created_at": utc_now(),
+        }
+        EVENTS_PUBLISHED.inc((event_type,))
+        self.deliver(event)
+        if self.db is not None:
+            try:
+                await self.db[COLLECTION].insert_one(dict(event))
+            except Exception as e:
+                logger.warning(f"Could not share live event with other workers: {e}")
+
+    def deliver(self, event: dict):
+        frame = format_event(event)
+        for queue in self.subscribers:
+            if queue.full():
+                # A slow screen loses its oldest event rather than holding up everyone
+                queue.get_nowait()
+                EVENTS_DROPPED.inc()
+            queue.put_nowait(frame)
+
+    # Subscribing
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        SUBSCRIBERS.inc()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        if queue in self.subscribers:
+            self.subscribers.discard(queue)
+            SUBSCRIBERS.dec()
+
+    async def stream(self, request, heartbeat=HEARTBEAT_SECONDS):
+        """SSE frames for one connection until the client goes away or the worker stops"""
+        queue = self.subscribe()
+        if len(self.subscribers) == 1:
+            await self.announce()
+        try:
+            yield f"retry: {int(self.poll_interval * 1000) + 2000}\n\n"
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            self.unsubscribe(queue)
+            if not self.subscribers:
+                await self.announce()
+
+
+class Coalescer:
+    """Collects (kind, key) changes and hands them to `flush` once per burst"""
+
+    def __init__(self, flush, delay_ms=DEBOUNCE_MS):
+        self.flush = flush
+        self.delay = delay_ms / 1000
+        self.pending = {}
+        self.task = None
+
+    def add(self, kind: str, *keys):
+        self.pending.setdefault(kind, set()).update(keys)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        # Changes added while a flush is running go out in the next round
+        while self.pending:
+            await asyncio.sleep(self.delay)
+            pending, self.pending = self.pending, {}
+            try:
+                await self.flush(pending)
+            except Exception as e:
+                logger.error(f"Publishing live events failed: {e}")
+
+
+broker = Broker()
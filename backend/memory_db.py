@@ -0,0 +1,1469 @@
+"""
+In-memory stand-in for the Motor database API.
+
+Implements the subset of Motor the backend relies on:
+- find / find_one with filters, projections, sort, skip and limit
+- insert, update (with upsert), find_one_and_update, delete and bulk_write
+- count_documents, estimated_document_count and distinct
+- aggregate with $match, $group, $project, $addFields, $unwind, $lookup,
+  $sort, $skip, $limit, $count and $out
+- single and compound indexes: unique indexes are enforced, and an equality
+  or $in filter on an index's first field skips the full collection scan
+
+Documents go through the same normalization as a BSON round trip. They are
+copied on the way in and out, and timezone-aware datetimes come back as naive
+UTC truncated to milliseconds, just as Motor returns them. Comparisons only
+match values of the same BSON type.
+
+Clients accept pymongo `event_listeners`. Every operation publishes command
+started / succeeded / failed events shaped like the driver's, so the metrics,
+round-trip counting and slow-query listeners work on this backend too.
+
+Select it with DB_BACKEND=memory (see database.py).
+"""
+import functools
+import itertools
+import re
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from bson import ObjectId
+from bson.errors import InvalidDocument
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import (
+    BulkWriteResult,
+    DeleteResult,
+    InsertManyResult,
+    InsertOneResult,
+    UpdateResult,
+)
+
+_MISSING = object()
+
+# BSON comparison / sort order of the types we store
+NULL, NUMBER, STRING, OBJECT, ARRAY, BINARY, OBJECT_ID, BOOLEAN, DATE, REGEX, OTHER = range(11)
+ORDERED_TYPES = {NUMBER, STRING, BINARY, OBJECT_ID, BOOLEAN, DATE}
+
+
+# ========== VALUES ==========
+
+
+def to_bson(value):
+    """Copy a value the way a BSON round trip would shape it"""
+    if isinstance(value, dict):
+        document = {}
+        for key, item in value.items():
+            if not isinstance(key, str):
+                raise InvalidDocument(f"documents must have only string keys, key was {key!r}")
+            document[key] = to_bson(item)
+        return document
+    if isinstance(value, (list, tuple)):
+        return [to_bson(item) for item in value]
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    if isinstance(value, (date, set, frozenset, Decimal)):
+        raise InvalidDocument(f"cannot encode object: {value!r}, of type: {type(value)}")
+    return value
+
+
+def copy_value(value):
+    """Deep copy of stored data (only dicts and lists are mutable)"""
+    if isinstance(value, dict):
+        return {key: copy_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_value(item) for item in value]
+    return value
+
+
+def bson_type(value) -> int:
+    if value is None or value is _MISSING:
+        return NULL
+    if isinstance(value, bool):
+        return BOOLEAN
+    if isinstance(value, (int, float)):
+        return NUMBER
+    if isinstance(value, str):
+        return STRING
+    if isinstance(value, dict):
+        return OBJECT
+    if isinstance(value, list):
+        return ARRAY
+    if isinstance(value, bytes):
+        return BINARY
+    if isinstance(value, ObjectId):
+        return OBJECT_ID
+    if isinstance(value, datetime):
+        return DATE
+    if isinstance(value, re.Pattern):
+        return REGEX
+    return OTHER
+
+
+def sort_key(value):
+    """Key ordering mixed values the way Mongo does (by BSON type, then value)"""
+    kind = bson_type(value)
+    if kind in ORDERED_TYPES:
+        return (kind, value)
+    if kind == NULL:
+        return (kind, 0)
+    return (kind, repr(value))
+
+
+def freeze(value):
+    """Hashable form of a value for index and group keys"""
+    if isinstance(value, dict):
+        return ("object", tuple((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return ("array", tuple(freeze(item) for item in value))
+    if value is _MISSING:
+        return None
+    return value
+
+
+# ========== FIELD PATHS ==========
+
+
+def lookup(value, parts):
+    """Every value reachable along a dotted path, traversing arrays like a query does"""
+    if not parts:
+        return [value]
+    if isinstance(value, dict):
+        if parts[0] in value:
+            return lookup(value[parts[0]], parts[1:])
+        return []
+    if isinstance(value, list):
+        if parts[0].isdigit():
+            index = int(parts[0])
+            return lookup(value[index], parts[1:]) if index < len(value) else []
+        found = []
+        for element in value:
+            if isinstance(element, dict):
+                found.extend(lookup(element, parts))
+        return found
+    return []
+
+
+def resolve(value, parts):
+    """Value of a dotted path in an aggregation expression (arrays map over their elements)"""
+    for position, part in enumerate(parts):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+            if value is _MISSING:
+                return None
+        elif isinstance(value, list):
+            rest = parts[position:]
+            return [
+                resolved
+                for element in value
+                if isinstance(element, dict)
+                for resolved in [resolve(element, rest)]
+                if resolved is not None
+            ]
+        else:
+            return None
+    return value
+
+
+def set_path(document, path, value):
+    parts = path.split(".")
+    target = document
+    for part in parts[:-1]:
+        if isinstance(target, list):
+            target = target[int(part)]
+            continue
+        if not isinstance(target.get(part), (dict, list)):
+            target[part] = {}
+        target = target[part]
+    last = parts[-1]
+    if isinstance(target, list):
+        index = int(last)
+        target.extend([None] * (index + 1 - len(target)))
+        target[index] = value
+    else:
+        target[last] = value
+
+
+def get_path(document, path, default=_MISSING):
+    value = document
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return default
+    return value
+
+
+def remove_path(document, path):
+    parts = path.split(".")
+    target = get_path(document, ".".join(parts[:-1])) if len(parts) > 1 else document
+    if isinstance(target, dict):
+        target.pop(parts[-1], None)
+    elif isinstance(target, list) and parts[-1].isdigit() and int(parts[-1]) < len(target):
+        target[int(parts[-1])] = None
+
+
+# ========== QUERIES ==========
+
+
+def expand(values):
+    """Candidate values for a query condition: each value plus the elements of arrays"""
+    expanded = []
+    for value in values:
+        expanded.append(value)
+        if isinstance(value, list):
+            expanded.extend(value)
+    return expanded
+
+
+def values_equal(values, target) -> bool:
+    if target is None and (not values or None in values):
+        return True
+    for value in expand(values):
+        if isinstance(target, re.Pattern):
+            if isinstance(value, str) and target.search(value):
+                return True
+        elif bson_type(value) == bson_type(target) and value == target:
+            return True
+    return False
+
+
+def values_compare(values, operator, target) -> bool:
+    for value in expand(values):
+        kind = bson_type(value)
+        if kind != bson_type(target) or kind not in ORDERED_TYPES:
+            continue
+        if (
+            (operator == "$gt" and value > target)
+            or (operator == "$gte" and value >= target)
+            or (operator == "$lt" and value < target)
+            or (operator == "$lte" and value <= target)
+        ):
+            return True
+    return False
+
+
+def regex_flags(options: str) -> int:
+    flags = 0
+    for option, flag in (("i", re.I), ("m", re.M), ("s", re.S), ("x", re.X)):
+        if option in options:
+            flags |= flag
+    return flags
+
+
+def is_operator_dict(condition) -> bool:
+    return isinstance(condition, dict) and bool(condition) and all(
+        key.startswith("$") for key in condition
+    )
+
+
+def match_condition(values, condition) -> bool:
+    """Whether the values found at a field path satisfy a query condition"""
+    if not is_operator_dict(condition):
+        return values_equal(values, condition)
+
+    for operator, target in condition.items():
+        if operator == "$options":
+            continue
+        if operator == "$eq":
+            matched = values_equal(values, target)
+        elif operator == "$ne":
+            matched = not values_equal(values, target)
+        elif operator in ("$gt", "$gte", "$lt", "$lte"):
+            matched = values_compare(values, operator, target)
+        elif operator == "$in":
+            matched = any(values_equal(values, item) for item in target)
+        elif operator == "$nin":
+            matched = not any(values_equal(values, item) for item in target)
+        elif operator == "$exists":
+            matched = bool(values) == bool(target)
+        elif operator == "$regex":
+            pattern = target if isinstance(target, re.Pattern) else re.compile(
+                target, regex_flags(condition.get("$options", ""))
+            )
+            matched = values_equal(values, pattern)
+        elif operator == "$not":
+            matched = not match_condition(values, target)
+        elif operator == "$size":
+            matched = any(isinstance(value, list) and len(value) == target for value in values)
+        elif operator == "$all":
+            matched = all(values_equal(values, item) for item in target)
+        elif operator == "$elemMatch":
+            matched = any(
+                isinstance(value, list)
+                and any(
+                    matches(element, target) if isinstance(element, dict) and not is_operator_dict(target)
+                    else match_condition([element], target)
+                    for element in value
+                )
+                for value in values
+            )
+        else:
+            raise OperationFailure(f"unknown operator: {operator}")
+        if not matched:
+            return False
+    return True
+
+
+def matches(document, query) -> bool:
+    """Whether a document satisfies a Mongo query filter"""
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            matched = all(matches(document, part) for part in condition)
+        elif key == "$or":
+            matched = any(matches(document, part) for part in condition)
+        elif key == "$nor":
+            matched = not any(matches(document, part) for part in condition)
+        elif key == "$expr":
+            matched = truthy(evaluate(condition, document, {"NOW": now(), "ROOT": document}))
+        elif key.startswith("$"):
+            raise OperationFailure(f"unknown top level operator: {key}")
+        else:
+            matched = match_condition(lookup(document, key.split(".")), condition)
+        if not matched:
+            return False
+    return True
+
+
+# ========== EXPRESSIONS ==========
+
+
+def now():
+    return to_bson(datetime.now(timezone.utc))
+
+
+def truthy(value) -> bool:
+    return value not in (None, False, 0, _MISSING)
+
+
+def numbers(values):
+    return [value for value in values if bson_type(value) == NUMBER]
+
+
+def arithmetic(operator, values):
+    if any(value is None for value in values):
+        return None
+    if operator == "$add":
+        total = 0
+        moment = None
+        for value in values:
+            if isinstance(value, datetime):
+                moment = value
+            else:
+                total += value
+        return moment + timedelta(milliseconds=total) if moment else total
+    if operator == "$subtract":
+        first, second = values
+        if isinstance(first, datetime) and isinstance(second, datetime):
+            return int((first - second).total_seconds() * 1000)
+        if isinstance(first, datetime):
+            return first - timedelta(milliseconds=second)
+        return first - second
+    if operator == "$multiply":
+        product = 1
+        for value in values:
+            product *= value
+        return product
+    if operator == "$divide":
+        return values[0] / values[1]
+    if operator == "$mod":
+        return values[0] % values[1]
+    raise OperationFailure(f"unknown expression: {operator}")
+
+
+def compare_values(operator, first, second) -> bool:
+    first, second = sort_key(first), sort_key(second)
+    return {
+        "$eq": first == second,
+        "$ne": first != second,
+        "$gt": first > second,
+        "$gte": first >= second,
+        "$lt": first < second,
+        "$lte": first <= second,
+    }[operator]
+
+
+def evaluate(expression, document, variables):
+    """Evaluate an aggregation expression against a document"""
+    if isinstance(expression, str):
+        if expression.startswith("$$"):
+            name, _, path = expression[2:].partition(".")
+            value = variables.get(name, document)
+            return resolve(value, path.split(".")) if path else value
+        if expression.startswith("$"):
+            return resolve(document, expression[1:].split("."))
+        return expression
+    if isinstance(expression, list):
+        return [evaluate(item, document, variables) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if not (len(expression) == 1 and next(iter(expression)).startswith("$")):
+        return {key: evaluate(value, document, variables) for key, value in expression.items()}
+
+    operator, arguments = next(iter(expression.items()))
+    if operator == "$literal":
+        return arguments
+    if operator == "$cond":
+        if isinstance(arguments, dict):
+            arguments = [arguments["if"], arguments["then"], arguments["else"]]
+        branch = arguments[1] if truthy(evaluate(arguments[0], document, variables)) else arguments[2]
+        return evaluate(branch, document, variables)
+
+    values = evaluate(arguments, document, variables)
+    if not isinstance(arguments, list):
+        values = [values]
+
+    if operator == "$ifNull":
+        for value in values:
+            if value is not None:
+                return value
+        return None
+    if operator in ("$add", "$subtract", "$multiply", "$divide", "$mod"):
+        return arithmetic(operator, values)
+    if operator in ("$sum", "$avg", "$min", "$max"):
+        # One array argument aggregates its elements
+        if len(values) == 1 and isinstance(values[0], list):
+            values = values[0]
+        if operator == "$sum":
+            return sum(numbers(values))
+        if operator == "$avg":
+            found = numbers(values)
+            return sum(found) / len(found) if found else None
+        present = [value for value in values if value is not None]
+        if not present:
+            return None
+        return (min if operator == "$min" else max)(present, key=sort_key)
+    if operator in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte"):
+        return compare_values(operator, values[0], values[1])
+    if operator == "$and":
+        return all(truthy(value) for value in values)
+    if operator == "$or":
+        return any(truthy(value) for value in values)
+    if operator == "$not":
+        return not truthy(values[0])
+    if operator == "$in":
+        return any(sort_key(values[0]) == sort_key(item) for item in values[1])
+    if operator == "$size":
+        return len(values[0])
+    if operator == "$abs":
+        return None if values[0] is None else abs(values[0])
+    if operator == "$round":
+        return None if values[0] is None else round(values[0], values[1] if len(values) > 1 else 0)
+    if operator == "$concat":
+        return None if any(value is None for value in values) else "".join(values)
+    if operator == "$toString":
+        return None if values[0] is None else str(values[0])
+    raise OperationFailure(f"unknown expression: {operator}")
+
+
+# ========== PROJECTION / UPDATE ==========
+
+
+def _include(source, target, parts):
+    key = parts[0]
+    if key not in source:
+        return
+    value = source[key]
+    if len(parts) == 1 or not isinstance(value, dict):
+        target[key] = copy_value(value)
+    else:
+        _include(value, target.setdefault(key, {}), parts[1:])
+
+
+def apply_projection(document, projection):
+    """Copy of a stored document shaped by a find() projection"""
+    if not projection:
+        return copy_value(document)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if any(fields.values()):
+        projected = {}
+        if include_id and "_id" in document:
+            projected["_id"] = document["_id"]
+        for path, keep in fields.items():
+            if keep:
+                _include(document, projected, path.split("."))
+        return projected
+
+    projected = copy_value(document)
+    for path in fields:
+        remove_path(projected, path)
+    if not include_id:
+        projected.pop("_id", None)
+    return projected
+
+
+def equality_fields(query):
+    """Fields an upsert seeds the new document with (plain equality conditions)"""
+    fields = {}
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            for part in condition:
+                fields.update(equality_fields(part))
+        elif not key.startswith("$"):
+            if is_operator_dict(condition):
+                if "$eq" in condition:
+                    fields[key] = condition["$eq"]
+            else:
+                fields[key] = condition
+    return fields
+
+
+def apply_update(document, update, inserting=False):
+    """Apply update operators (or a replacement) to a document in place"""
+    if not any(key.startswith("$") for key in update):
+        preserved = document.get("_id")
+        document.clear()
+        document.update(to_bson(update))
+        if preserved is not None:
+            document["_id"] = preserved
+        return
+
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            current = get_path(document, path)
+            if operator == "$set":
+                set_path(document, path, to_bson(value))
+            elif operator == "$setOnInsert":
+                if inserting:
+                    set_path(document, path, to_bson(value))
+            elif operator == "$unset":
+                remove_path(document, path)
+            elif operator in ("$inc", "$mul"):
+                if current is not _MISSING and bson_type(current) != NUMBER:
+                    raise OperationFailure(f"Cannot apply {operator} to a value of non-numeric type")
+                base = 0 if current in (_MISSING, None) else current
+                set_path(document, path, base + value if operator == "$inc" else base * value)
+            elif operator in ("$min", "$max"):
+                value = to_bson(value)
+                if current is _MISSING or (
+                    sort_key(value) < sort_key(current)
+                    if operator == "$min"
+                    else sort_key(value) > sort_key(current)
+                ):
+                    set_path(document, path, value)
+            elif operator in ("$push", "$addToSet"):
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                array = [] if current is _MISSING else current
+                if not isinstance(array, list):
+                    raise OperationFailure(f"The field '{path}' must be an array")
+                for item in to_bson(items):
+                    if operator == "$push" or item not in array:
+                        array.append(item)
+                set_path(document, path, array)
+            elif operator == "$pull":
+                if isinstance(current, list):
+                    set_path(
+                        document,
+                        path,
+                        [
+                            item
+                            for item in current
+                            if not (
+                                match_condition([item], value)
+                                if is_operator_dict(value) or not isinstance(item, dict)
+                                else matches(item, value)
+                            )
+                        ],
+                    )
+            elif operator == "$currentDate":
+                set_path(document, path, now())
+            else:
+                raise OperationFailure(f"Unknown modifier: {operator}")
+
+
+# ========== INDEXES ==========
+
+
+class MemoryIndex:
+    """Single or compound index; lookups use its first field, uniqueness uses every field"""
+
+    def __init__(self, name, keys, unique=False):
+        self.name = name
+        self.keys = keys
+        self.unique = unique
+        self.entries = {}
+        self.unique_keys = {}
+
+    @property
+    def field(self):
+        return self.keys[0][0]
+
+    def lookup_keys(self, document):
+        values = lookup(document, self.field.split("."))
+        if not values:
+            return {None}
+        return {freeze(value) for value in expand(values)}
+
+    def unique_key(self, document):
+        return tuple(freeze(get_path(document, field, None)) for field, _ in self.keys)
+
+    def check(self, document, row_id=None):
+        if self.unique:
+            holder = self.unique_keys.get(self.unique_key(document))
+            if holder is not None and holder != row_id:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error index: {self.name} dup key: "
+                    f"{dict(zip((field for field, _ in self.keys), self.unique_key(document)))}",
+                    11000,
+                )
+
+    def add(self, document, row_id):
+        for key in self.lookup_keys(document):
+            self.entries.setdefault(key, set()).add(row_id)
+        if self.unique:
+            self.unique_keys[self.unique_key(document)] = row_id
+
+    def remove(self, document, row_id):
+        for key in self.lookup_keys(document):
+            rows = self.entries.get(key)
+            if rows is not None:
+                rows.discard(row_id)
+                if not rows:
+                    del self.entries[key]
+        if self.unique and self.unique_keys.get(self.unique_key(document)) == row_id:
+            del self.unique_keys[self.unique_key(document)]
+
+    def candidates(self, condition):
+        """Row ids that may satisfy an equality / $in condition on the indexed field"""
+        if is_operator_dict(condition):
+            if "$eq" in condition:
+                targets = [condition["$eq"]]
+            elif "$in" in condition:
+                targets = list(condition["$in"])
+            else:
+                return None
+        elif isinstance(condition, re.Pattern):
+            return None
+        else:
+            targets = [condition]
+        rows = set()
+        for target in targets:
+            if isinstance(target, re.Pattern):
+                return None
+            rows |= self.entries.get(freeze(target), set())
+        return rows
+
+
+def index_name(keys):
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def normalize_keys(keys, direction=None):
+    if isinstance(keys, str):
+        return [(keys, direction if direction is not None else 1)]
+    if isinstance(keys, dict):
+        return list(keys.items())
+    return [tuple(key) if not isinstance(key, str) else (key, 1) for key in keys]
+
+
+# ========== COMMAND MONITORING ==========
+
+
+class CommandEvent:
+    """Attributes of pymongo's command started / succeeded / failed events"""
+
+    def __init__(self, command_name, command, database_name, request_id):
+        self.command_name = command_name
+        self.command = command
+        self.database_name = database_name
+        self.request_id = request_id
+        self.operation_id = request_id
+        self.connection_id = ("memory", 0)
+        self.duration_micros = 0
+        self.reply = None
+        self.failure = None
+
+
+def monitored(describe):
+    """Publish command events around a collection / database method; `describe` builds the command"""
+
+    def decorate(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            database = self if isinstance(self, MemoryDatabase) else self.database
+            event = database.client._begin(describe(self, *args, **kwargs), database.name)
+            try:
+                result = await method(self, *args, **kwargs)
+            except Exception as error:
+                database.client._end(event, error)
+                raise
+            database.client._end(event)
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+def update_command(self, filter, update, upsert=False, *args, **kwargs):
+    return {"update": self.name, "updates": [{"q": filter, "u": update, "upsert": upsert}]}
+
+
+def delete_command(self, filter, *args, **kwargs):
+    return {"delete": self.name, "deletes": [{"q": filter}]}
+
+
+def bulk_command(self, requests, *args, **kwargs):
+    first = requests[0] if requests else None
+    if isinstance(first, InsertOne):
+        return {"insert": self.name, "documents": [request._doc for request in requests]}
+    if isinstance(first, (DeleteOne, DeleteMany)):
+        return {"delete": self.name, "deletes": [{"q": request._filter} for request in requests]}
+    return {"update": self.name, "updates": [{"q": getattr(request, "_filter", None)} for request in requests]}
+
+
+# ========== CURSORS ==========
+
+
+class MemoryCursor:
+    """find() cursor: chain sort / skip / limit, then await to_list or iterate"""
+
+    def __init__(self, collection, query, projection, sort=None, skip=0, limit=0):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self._sort = normalize_keys(sort) if sort else []
+        self._skip = skip
+        self._limit = limit
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = normalize_keys(key_or_list, direction)
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def _command(self):
+        command = {"find": self.collection.name, "filter": self.query or {}}
+        if self._sort:
+            command["sort"] = dict(self._sort)
+        if self.projection:
+            command["projection"] = self.projection
+        if self._skip:
+            command["skip"] = self._skip
+        if self._limit:
+            command["limit"] = self._limit
+        return command
+
+    def _documents(self):
+        return self.collection._monitored(self._command(), self._run)
+
+    def _run(self):
+        rows = self.collection._select(self.query)
+        if self._sort:
+            rows = sort_documents(rows, self._sort)
+        if self._skip:
+            rows = rows[self._skip :]
+        if self._limit:
+            rows = rows[: abs(self._limit)]
+        return [apply_projection(document, self.projection) for document in rows]
+
+    async def to_list(self, length=None):
+        documents = self._documents()
+        return documents[:length] if length else documents
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self._documents():
+            yield document
+
+    async def explain(self):
+        index = self.collection._index_for(self.query)
+        return {
+            "queryPlanner": {
+                "winningPlan": {"stage": "IXSCAN" if index else "COLLSCAN", "indexName": index and index.name}
+            },
+            "executionStats": {
+                "nReturned": len(self._run()),
+                "totalDocsExamined": len(self.collection._candidate_rows(self.query)),
+            },
+        }
+
+
+class MemoryCommandCursor:
+    """aggregate() cursor; the pipeline runs when the results are first read"""
+
+    def __init__(self, collection, pipeline):
+        self.collection = collection
+        self.pipeline = pipeline
+
+    def batch_size(self, size):
+        return self
+
+    def _documents(self):
+        return self.collection._monitored(
+            {"aggregate": self.collection.name, "pipeline": self.pipeline},
+            lambda: self.collection._aggregate(self.pipeline),
+        )
+
+    async def to_list(self, length=None):
+        documents = self._documents()
+        return documents[:length] if length else documents
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self._documents():
+            yield document
+
+
+def sort_documents(documents, keys):
+    documents = list(documents)
+    # Stable sorts applied from the last key to the first give a multi-key order
+    for field, direction in reversed(keys):
+        documents.sort(
+            key=lambda document: sort_key(get_path(document, field, None)),
+            reverse=direction == -1,
+        )
+    return documents
+
+
+# ========== AGGREGATION ==========
+
+
+def group_documents(documents, spec, variables):
+    groups = {}
+    for document in documents:
+        key = evaluate(spec["_id"], document, variables)
+        group = groups.setdefault(freeze(key), {"_id": key, "__docs": []})
+        group["__docs"].append(document)
+
+    results = []
+    for group in groups.values():
+        result = {"_id": group["_id"]}
+        members = group.pop("__docs")
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            operator, argument = next(iter(accumulator.items()))
+            values = [evaluate(argument, member, variables) for member in members]
+            if operator == "$sum":
+                result[field] = sum(numbers(values))
+            elif operator == "$count":
+                result[field] = len(members)
+            elif operator == "$avg":
+                found = numbers(values)
+                result[field] = sum(found) / len(found) if found else None
+            elif operator in ("$min", "$max"):
+                present = [value for value in values if value is not None]
+                result[field] = (
+                    (min if operator == "$min" else max)(present, key=sort_key) if present else None
+                )
+            elif operator == "$first":
+                result[field] = values[0]
+            elif operator == "$last":
+                result[field] = values[-1]
+            elif operator == "$push":
+                result[field] = values
+            elif operator == "$addToSet":
+                unique = {}
+                for value in values:
+                    unique.setdefault(freeze(value), value)
+                result[field] = list(unique.values())
+            else:
+                raise OperationFailure(f"unknown group operator: {operator}")
+        results.append(result)
+    return results
+
+
+def project_documents(documents, spec, variables):
+    include_id = spec.get("_id", 1)
+    fields = {key: value for key, value in spec.items() if key != "_id"}
+    excluding = all(value in (0, False) for value in fields.values())
+
+    projected = []
+    for document in documents:
+        if excluding:
+            result = copy_value(document)
+            for path in fields:
+                remove_path(result, path)
+        else:
+            result = {}
+            for path, value in fields.items():
+                if value in (1, True):
+                    _include(document, result, path.split("."))
+                elif value not in (0, False):
+                    set_path(result, path, evaluate(value, document, variables))
+            if include_id not in (0, False) and "_id" in document:
+                result = {"_id": document["_id"], **result}
+        if include_id in (0, False):
+            result.pop("_id", None)
+        elif include_id not in (1, True):
+            result["_id"] = evaluate(include_id, document, variables)
+        projected.append(result)
+    return projected
+
+
+def unwind_documents(documents, spec):
+    if isinstance(spec, str):
+        spec = {"path": spec}
+    path = spec["path"].lstrip("$")
+    keep_empty = spec.get("preserveNullAndEmptyArrays", False)
+
+    unwound = []
+    for document in documents:
+        value = get_path(document, path)
+        if isinstance(value, list) and value:
+            for element in value:
+                copy = copy_value(document)
+                set_path(copy, path, copy_value(element))
+                unwound.append(copy)
+        elif isinstance(value, list) or value in (_MISSING, None):
+            if keep_empty:
+                unwound.append(document)
+        else:
+            unwound.append(document)
+    return unwound
+
+
+# ========== COLLECTIONS ==========
+
+
+class MemoryCollection:
+    """One collection: documents in insertion order plus their indexes"""
+
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.full_name = f"{database.name}.{name}"
+        self.options = {}
+        self._rows = {}
+        self._next_row = 0
+        self._indexes = {"_id_": MemoryIndex("_id_", [("_id", 1)], unique=True)}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.database[f"{self.name}.{name}"]
+
+    def __repr__(self):
+        return f"MemoryCollection({self.full_name!r})"
+
+    # Internal helpers
+
+    def _monitored(self, command, operation):
+        """Run a cursor's work inside command events (one round trip per cursor)"""
+        client = self.database.client
+        event = client._begin(command, self.database.name)
+        try:
+            result = operation()
+        except Exception as error:
+            client._end(event, error)
+            raise
+        client._end(event)
+        return result
+
+    def _index_for(self, query):
+        """Index whose first field has an equality / $in condition in the query"""
+        for field, condition in (query or {}).items():
+            if field.startswith("$"):
+                continue
+            for index in self._indexes.values():
+                if index.field == field and index.candidates(condition) is not None:
+                    return index
+        return None
+
+    def _candidate_rows(self, query):
+        index = self._index_for(query)
+        if index is None:
+            return list(self._rows)
+        # Row ids grow with insertion, so sorting them keeps natural order
+        return sorted(index.candidates(query[index.field]))
+
+    def _select_rows(self, query):
+        query = to_bson(query or {})
+        return [
+            row_id for row_id in self._candidate_rows(query) if matches(self._rows[row_id], query)
+        ]
+
+    def _select(self, query):
+        return [self._rows[row_id] for row_id in self._select_rows(query)]
+
+    def _insert(self, document):
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        stored = to_bson(document)
+        for index in self._indexes.values():
+            index.check(stored)
+        row_id = self._next_row
+        self._next_row += 1
+        self._rows[row_id] = stored
+        for index in self._indexes.values():
+            index.add(stored, row_id)
+        self.database._created(self.name)
+
+        maximum = self.options.get("max")
+        if self.options.get("capped") and maximum and len(self._rows) > maximum:
+            oldest = next(iter(self._rows))
+            self._delete(oldest)
+        return stored["_id"]
+
+    def _delete(self, row_id):
+        document = self._rows.pop(row_id)
+        for index in self._indexes.values():
+            index.remove(document, row_id)
+
+    def _replace(self, row_id, document):
+        previous = self._rows[row_id]
+        for index in self._indexes.values():
+            index.remove(previous, row_id)
+        try:
+            for index in self._indexes.values():
+                index.check(document, row_id)
+        except DuplicateKeyError:
+            for index in self._indexes.values():
+                index.add(previous, row_id)
+            raise
+        self._rows[row_id] = document
+        for index in self._indexes.values():
+            index.add(document, row_id)
+
+    def _update(self, query, update, upsert=False, many=False, sort=None):
+        rows = self._select_rows(query)
+        if sort and rows:
+            ordered = sort_documents(self._select(query), normalize_keys(sort))
+            rows = [next(r for r in rows if self._rows[r] is ordered[0])]
+        if not many:
+            rows = rows[:1]
+
+        modified = 0
+        for row_id in rows:
+            document = copy_value(self._rows[row_id])
+            apply_update(document, update)
+            if document != self._rows[row_id]:
+                self._replace(row_id, document)
+                modified += 1
+
+        upserted_id = None
+        if not rows and upsert:
+            document = to_bson(equality_fields(query))
+            apply_update(document, update, inserting=True)
+            upserted_id = self._insert(document)
+        return rows, modified, upserted_id
+
+    def _aggregate(self, pipeline):
+        variables = {"NOW": now()}
+        documents = None
+        for stage in pipeline:
+            name, spec = next(iter(stage.items()))
+            if name == "$match":
+                spec = to_bson(spec)
+                documents = (
+                    [copy_value(document) for document in self._select(spec)]
+                    if documents is None
+                    else [document for document in documents if matches(document, spec)]
+                )
+                continue
+            if documents is None:
+                documents = [copy_value(document) for document in self._rows.values()]
+
+            if name == "$group":
+                documents = group_documents(documents, spec, variables)
+            elif name == "$project":
+                documents = project_documents(documents, spec, variables)
+            elif name in ("$addFields", "$set"):
+                for document in documents:
+                    for path, expression in spec.items():
+                        set_path(document, path, evaluate(expression, document, variables))
+            elif name == "$unset":
+                for document in documents:
+                    for path in [spec] if isinstance(spec, str) else spec:
+                        remove_path(document, path)
+            elif name == "$unwind":
+                documents = unwind_documents(documents, spec)
+            elif name == "$sort":
+                documents = sort_documents(documents, normalize_keys(spec))
+            elif name == "$skip":
+                documents = documents[spec:]
+            elif name == "$limit":
+                documents = documents[:spec]
+            elif name == "$count":
+                documents = [{spec: len(documents)}] if documents else []
+            elif name == "$lookup":
+                foreign = self.database[spec["from"]]
+                for document in documents:
+                    local = get_path(document, spec["localField"], None)
+                    document[spec["as"]] = [
+                        copy_value(match)
+                        for match in foreign._select({spec["foreignField"]: local})
+                    ]
+            elif name == "$out":
+                target = self.database[spec]
+                for row_id in list(target._rows):
+                    target._delete(row_id)
+                for document in documents:
+                    target._insert(document)
+                return []
+            else:
+                raise OperationFailure(f"Unrecognized pipeline stage name: '{name}'")
+        if documents is None:
+            documents = [copy_value(document) for document in self._rows.values()]
+        return documents
+
+    # Motor API
+
+    def find(self, filter=None, projection=None, sort=None, skip=0, limit=0, **kwargs):
+        return MemoryCursor(self, filter, projection, sort, skip, limit)
+
+    async def find_one(self, filter=None, projection=None, *args, sort=None, **kwargs):
+        # The cursor publishes the "find" event
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        documents = await MemoryCursor(self, filter, projection, sort, limit=1).to_list()
+        return documents[0] if documents else None
+
+    @monitored(lambda self, document, **kwargs: {"insert": self.name, "documents": [document]})
+    async def insert_one(self, document, **kwargs):
+        return InsertOneResult(self._insert(document), True)
+
+    @monitored(lambda self, documents, *args, **kwargs: {"insert": self.name, "documents": documents})
+    async def insert_many(self, documents, ordered=True, **kwargs):
+        inserted, errors = [], []
+        for position, document in enumerate(documents):
+            try:
+                inserted.append(self._insert(document))
+            except DuplicateKeyError as error:
+                errors.append({"index": position, "code": 11000, "errmsg": str(error), "op": document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError(
+                {"writeErrors": errors, "writeConcernErrors": [], "nInserted": len(inserted),
+                 "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []}
+            )
+        return InsertManyResult(inserted, True)
+
+    @monitored(update_command)
+    async def update_one(self, filter, update, upsert=False, sort=None, **kwargs):
+        rows, modified, upserted_id = self._update(filter, update, upsert, sort=sort)
+        raw = {"n": len(rows) or int(upserted_id is not None), "nModified": modified}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    @monitored(update_command)
+    async def update_many(self, filter, update, upsert=False, **kwargs):
+        rows, modified, upserted_id = self._update(filter, update, upsert, many=True)
+        raw = {"n": len(rows) or int(upserted_id is not None), "nModified": modified}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    @monitored(update_command)
+    async def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        rows, modified, upserted_id = self._update(filter, replacement, upsert)
+        raw = {"n": len(rows) or int(upserted_id is not None), "nModified": modified}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    @monitored(
+        lambda self, filter, update, *args, **kwargs: {
+            "findAndModify": self.name, "query": filter, "sort": kwargs.get("sort"), "update": update
+        }
+    )
+    async def find_one_and_update(
+        self, filter, update, projection=None, sort=None, upsert=False, return_document=False, **kwargs
+    ):
+        rows = self._select_rows(filter)
+        if sort and rows:
+            first = sort_documents(self._select(filter), normalize_keys(sort))[0]
+            rows = [row_id for row_id in rows if self._rows[row_id] is first]
+        before = copy_value(self._rows[rows[0]]) if rows else None
+
+        rows, _, upserted_id = self._update(
+            {"_id": before["_id"]} if before else filter, update, upsert
+        )
+        if not return_document:
+            return apply_projection(before, projection) if before else None
+        if before is not None:
+            after = self._rows[rows[0]]
+        elif upserted_id is not None:
+            after = self._select({"_id": upserted_id})[0]
+        else:
+            return None
+        return apply_projection(after, projection)
+
+    @monitored(lambda self, filter, *args, **kwargs: {"findAndModify": self.name, "query": filter, "remove": True})
+    async def find_one_and_delete(self, filter, projection=None, sort=None, **kwargs):
+        rows = self._select_rows(filter)
+        if sort and rows:
+            first = sort_documents(self._select(filter), normalize_keys(sort))[0]
+            rows = [row_id for row_id in rows if self._rows[row_id] is first]
+        if not rows:
+            return None
+        document = self._rows[rows[0]]
+        self._delete(rows[0])
+        return apply_projection(document, projection)
+
+    @monitored(delete_command)
+    async def delete_one(self, filter, **kwargs):
+        rows = self._select_rows(filter)[:1]
+        for row_id in rows:
+            self._delete(row_id)
+        return DeleteResult({"n": len(rows)}, True)
+
+    @monitored(delete_command)
+    async def delete_many(self, filter, **kwargs):
+        rows = self._select_rows(filter)
+        for row_id in rows:
+            self._delete(row_id)
+        return DeleteResult({"n": len(rows)}, True)
+
+    @monitored(bulk_command)
+    async def bulk_write(self, requests, ordered=True, **kwargs):
+        result = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0,
+                  "upserted": [], "writeErrors": [], "writeConcernErrors": []}
+        for position, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    result["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    rows, modified, upserted_id = self._update(
+                        request._filter, request._doc, request._upsert,
+                        many=isinstance(request, UpdateMany),
+                    )
+                    result["nMatched"] += len(rows)
+                    result["nModified"] += modified
+                    if upserted_id is not None:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": position, "_id": upserted_id})
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    rows = self._select_rows(request._filter)
+                    if isinstance(request, DeleteOne):
+                        rows = rows[:1]
+                    for row_id in rows:
+                        self._delete(row_id)
+                    result["nRemoved"] += len(rows)
+                else:
+                    raise TypeError(f"{request!r} is not a valid request")
+            except DuplicateKeyError as error:
+                result["writeErrors"].append({"index": position, "code": 11000, "errmsg": str(error)})
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    @monitored(
+        lambda self, filter=None, **kwargs: {
+            "aggregate": self.name,
+            "pipeline": [{"$match": filter or {}}, {"$group": {"_id": 1, "n": {"$sum": 1}}}],
+        }
+    )
+    async def count_documents(self, filter=None, **kwargs):
+        return len(self._select_rows(filter))
+
+    @monitored(lambda self, **kwargs: {"count": self.name})
+    async def estimated_document_count(self, **kwargs):
+        return len(self._rows)
+
+    @monitored(lambda self, key, filter=None, **kwargs: {"distinct": self.name, "key": key, "query": filter or {}})
+    async def distinct(self, key, filter=None, **kwargs):
+        unique = {}
+        for document in self._select(filter):
+            for value in expand(lookup(document, key.split("."))):
+                if not isinstance(value, list):
+                    unique.setdefault(freeze(value), copy_value(value))
+        return list(unique.values())
+
+    def aggregate(self, pipeline, **kwargs):
+        return MemoryCommandCursor(self, pipeline)
+
+    @monitored(
+        lambda self, keys, unique=False, **kwargs: {
+            "createIndexes": self.name, "indexes": [{"key": dict(normalize_keys(keys)), "unique": unique}]
+        }
+    )
+    async def create_index(self, keys, unique=False, name=None, **kwargs):
+        keys = normalize_keys(keys)
+        name = name or index_name(keys)
+        if name in self._indexes:
+            return name
+        index = MemoryIndex(name, keys, unique=unique)
+        for row_id, document in self._rows.items():
+            index.check(document)
+            index.add(document, row_id)
+        self._indexes[name] = index
+        self.database._created(self.name)
+        return name
+
+    async def create_indexes(self, indexes, **kwargs):
+        return [
+            await self.create_index(index.document["key"], **{
+                key: value for key, value in index.document.items() if key != "key"
+            })
+            for index in indexes
+        ]
+
+    @monitored(lambda self: {"listIndexes": self.name})
+    async def index_information(self):
+        return {
+            name: {"key": list(index.keys), **({"unique": True} if index.unique and name != "_id_" else {})}
+            for name, index in self._indexes.items()
+        }
+
+    @monitored(lambda self, name: {"dropIndexes": self.name, "index": name})
+    async def drop_index(self, name):
+        if name == "_id_" or name not in self._indexes:
+            raise OperationFailure(f"index not found with name [{name}]")
+        del self._indexes[name]
+
+    @monitored(lambda self: {"dropIndexes": self.name, "index": "*"})
+    async def drop_indexes(self):
+        for name in list(self._indexes):
+            if name != "_id_":
+                del self._indexes[name]
+
+    async def drop(self):
+        await self.database.drop_collection(self.name)
+
+
+# ========== DATABASE / CLIENT ==========
+
+
+class MemoryDatabase:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self._collections = {}
+        self._existing = set()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self, name)
+        return self._collections[name]
+
+    def __repr__(self):
+        return f"MemoryDatabase({self.name!r})"
+
+    def _created(self, name):
+        self._existing.add(name)
+
+    def get_collection(self, name, **kwargs):
+        return self[name]
+
+    @monitored(lambda self, name, **kwargs: {"create": name, **kwargs})
+    async def create_collection(self, name, **kwargs):
+        collection = self[name]
+        collection.options = kwargs
+        self._created(name)
+        return collection
+
+    @monitored(lambda self, **kwargs: {"listCollections": 1})
+    async def list_collection_names(self, **kwargs):
+        return sorted(self._existing)
+
+    @monitored(lambda self, name_or_collection, **kwargs: {"drop": getattr(name_or_collection, "name", name_or_collection)})
+    async def drop_collection(self, name_or_collection, **kwargs):
+        name = getattr(name_or_collection, "name", name_or_collection)
+        self._collections.pop(name, None)
+        self._existing.discard(name)
+        return {"ok": 1.0}
+
+    @monitored(lambda self, command, *args, **kwargs: {command: 1} if isinstance(command, str) else dict(command))
+    async def command(self, command, *args, **kwargs):
+        name = command if isinstance(command, str) else next(iter(command))
+        if name == "ping":
+            return {"ok": 1.0}
+        if name == "buildInfo":
+            return {"version": "memory", "ok": 1.0}
+        if name == "explain":
+            return await self._explain(command["explain"])
+        raise OperationFailure(f"no such command: '{name}'")
+
+
+    async def _explain(self, explained):
+        """explain of a find-shaped command: the plan its filter would get here"""
+        name = next(iter(explained))
+        collection = self[explained[name]]
+        if name == "aggregate":
+            pipeline = explained.get("pipeline") or [{}]
+            plan = await collection.find(pipeline[0].get("$match", {})).explain()
+            return {"stages": [{"$cursor": plan}], "ok": 1.0}
+        if name in ("update", "delete"):
+            query = (explained.get(f"{name}s") or [{}])[0].get("q")
+        else:
+            query = explained.get("filter", explained.get("query"))
+        cursor = collection.find(query or {}, sort=explained.get("sort"))
+        return {**await cursor.explain(), "ok": 1.0}
+
+
+class MemoryClient:
+    """Drop-in for AsyncIOMotorClient holding every database in process memory"""
+
+    def __init__(self, *args, event_listeners=None, **kwargs):
+        self._databases = {}
+        self._listeners = list(event_listeners or [])
+        self._request_ids = itertools.count(1)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(self, name)
+        return self._databases[name]
+
+    def get_database(self, name, **kwargs):
+        return self[name]
+
+    def _begin(self, command, database_name):
+        """Publish a command started event (None when nobody is listening)"""
+        if not self._listeners:
+            return None
+        event = CommandEvent(next(iter(command)), command, database_name, next(self._request_ids))
+        for listener in self._listeners:
+            listener.started(event)
+        event.started_at = time.perf_counter()
+        return event
+
+    def _end(self, event, error=None):
+        if event is None:
+            return
+        event.duration_micros = int((time.perf_counter() - event.started_at) * 1_000_000)
+        if error is None:
+            event.reply = {"ok": 1.0}
+            for listener in self._listeners:
+                listener.succeeded(event)
+        else:
+            event.failure = {"ok": 0.0, "errmsg": str(error)}
+            for listener in self._listeners:
+                listener.failed(event)
+
+    async def list_database_names(self):
+        return sorted(self._databases)
+
+    async def drop_database(self, name_or_database):
+        self._databases.pop(getattr(name_or_database, "name", name_or_database), None)
+
+    def close(self):
+        pass
@@ -0,0 +1,244 @@
+"""
+Request and MongoDB metrics in the Prometheus text exposition format.
+
+- MetricsMiddleware (plain ASGI) records per-route request counts, latency
+  and response size histograms, and the number of requests in flight.
+  Routes are labelled by their template ("/api/pos-sales/{sale_id}"), so
+  label cardinality stays bounded.
+- MongoCommandMetrics is a pymongo CommandListener. It records operation
+  counts and durations per collection and command. Register it through
+  `event_listeners` when the AsyncIOMotorClient is created.
+
+render() produces the text served at /api/metrics. Metric updates take a
+short lock, because pymongo calls the listeners from Motor's executor threads.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+MONGO_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY = []
+
+
+def format_value(value) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1.0):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def lines(self):
+        with self.lock:
+            samples = list(self.values.items())
+        return [
+            f"{self.name}{format_labels(self.labels, labels)} {format_value(value)}"
+            for labels, value in samples
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels=(), amount=1.0):
+        self.inc(labels, -amount)
+
+    def set(self, labels=(), value=0.0):
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        # Per-bucket (non-cumulative) counts; render() accumulates them
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def lines(self):
+        with self.lock:
+            samples = [(labels, list(counts), total, count) for labels, (counts, total, count) in self.values.items()]
+        lines = []
+        for labels, counts, total, count in samples:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else format_value(bound)
+                lines.append(
+                    f"{self.name}_bucket{format_labels(self.labels, labels, ('le', le))} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{format_labels(self.labels, labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, labels)} {count}")
+        return lines
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.header())
+        lines.extend(metric.lines())
+    return "\n".join(lines) + "\n"
+
+
+# HTTP
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route, method and status", ("method", "route", "status")
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+HTTP_RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "HTTP response body size by route", ("method", "route"), SIZE_BUCKETS
+)
+HTTP_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests currently being served", ("method",)
+)
+
+
+_route_paths = {}
+
+
+def route_label(scope) -> str:
+    """Path template of the route that served a request ("unmatched" if none did)"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    path = _route_paths.get(endpoint)
+    if path is None:
+        # Endpoint -> path template, built on first sight of each endpoint
+        for route in scope["app"].routes:
+            if getattr(route, "endpoint", None) is not None:
+                _route_paths.setdefault(route.endpoint, route.path)
+        path = _route_paths.setdefault(endpoint, "unmatched")
+    return path
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request count, latency, size and in-flight requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status_code = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc((method,))
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_PROGRESS.dec((method,))
+            route = route_label(scope)
+            HTTP_REQUESTS.inc((method, route, str(status_code)))
+            HTTP_LATENCY.observe((method, route), elapsed)
+            HTTP_RESPONSE_SIZE.observe((method, route), size)
+
+
+# MongoDB
+
+MONGO_COMMANDS = Counter(
+    "mongodb_commands_total", "MongoDB commands by collection, command and outcome",
+    ("collection", "command", "outcome"),
+)
+MONGO_LATENCY = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency by collection and command",
+    ("collection", "command"), MONGO_LATENCY_BUCKETS,
+)
+
+
+def command_collection(event) -> str:
+    """Collection a command targets ("-" for database / admin commands)"""
+    if event.command_name == "getMore":
+        target = event.command.get("collection")
+    else:
+        target = event.command.get(event.command_name)
+    return target if isinstance(target, str) else "-"
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Counts and times every command sent through the client it is registered on"""
+
+    def __init__(self):
+        self.pending = {}
+
+    def started(self, event):
+        self.pending[(event.connection_id, event.request_id)] = command_collection(event)
+
+    def _finished(self, event, outcome):
+        collection = self.pending.pop((event.connection_id, event.request_id), "-")
+        labels = (collection, event.command_name)
+        MONGO_COMMANDS.inc(labels + (outcome,))
+        MONGO_LATENCY.observe(labels, event.duration_micros / 1_000_000)
+
+    def succeeded(self, event):
+        self._finished(event, "success")
+
+    def failed(self, event):
+        self._finished(event, "failure")
@@ -0,0 +1,218 @@
+"""
+On-demand sampling profiler for single requests.
+
+An admin adds `X-Profile: 1` (or `?profile=1`) to a request. ProfilerMiddleware
+then starts a thread that samples the request's task every PROFILE_INTERVAL_MS
+until the response is done:
+- while the task is running on the event loop, the sample is the loop
+  thread's Python stack (from sys._current_frames)
+- while it is suspended, the sample is its coroutine await chain ending in a
+  "[await ...]" frame. Time spent waiting on Mongo stays visible in the graph.
+
+Samples are saved as collapsed stacks ("frame;frame;frame count" per line).
+flamegraph.pl, speedscope and similar tools read this format directly. Each
+profile gets a JSON sidecar with its route, duration and sample counts. Only
+the newest PROFILE_KEEP profiles are kept in PROFILE_DIR (a ring on disk).
+The profile id is returned in the X-Profile-Id response header.
+
+Requests without the flag pay for one header scan. Non-admin requests with
+the flag are served normally, without profiling.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("PROFILER_ENABLED", "true").lower() not in ("0", "false", "no")
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", Path(tempfile.gettempdir()) / "bano_profiles"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "20"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "120"))
+
+TRIGGER_HEADER = b"x-profile"
+ID_HEADER = b"x-profile-id"
+PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def coroutine_frames(coro):
+    """Frames of a suspended coroutine chain (outermost first) and what the innermost awaits"""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        awaited = getattr(coro, "cr_await", None)
+        if awaited is None:
+            awaited = getattr(coro, "gi_yieldfrom", None)
+        coro = awaited
+    return frames, coro
+
+
+class Sampler(threading.Thread):
+    """Samples one asyncio task from a side thread until stopped"""
+
+    def __init__(self, loop, task, loop_thread_id, interval):
+        super().__init__(name="request-profiler", daemon=True)
+        self.loop = loop
+        self.task = task
+        self.loop_thread_id = loop_thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.running_samples = 0
+        self.waiting_samples = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        deadline = time.monotonic() + PROFILE_MAX_SECONDS
+        while not self.stopped.wait(self.interval) and time.monotonic() < deadline:
+            self.sample()
+
+    def sample(self):
+        root = self.task.get_coro()
+        root_frame = getattr(root, "cr_frame", None)
+        if asyncio.current_task(self.loop) is self.task:
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                if frame is root_frame:
+                    break
+                frame = frame.f_back
+            stack.reverse()
+            self.running_samples += 1
+        else:
+            frames, awaited = coroutine_frames(root)
+            stack = [frame_label(frame.f_code) for frame in frames]
+            stack.append(f"[await {type(awaited).__name__}]")
+            self.waiting_samples += 1
+        if stack:
+            self.stacks[";".join(stack)] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def requested(scope) -> bool:
+    """Does the request ask to be profiled (header or query flag)?"""
+    for name, value in scope["headers"]:
+        if name == TRIGGER_HEADER:
+            return value.strip().lower() in (b"1", b"true", b"yes")
+    query = scope.get("query_string", b"")
+    if b"profile" in query:
+        values = parse_qs(query.decode("latin-1")).get("profile", [])
+        return any(value.lower() in ("1", "true", "yes") for value in values)
+    return False
+
+
+# Profile storage (ring of the newest PROFILE_KEEP profiles)
+
+
+def save_profile(profile_id: str, collapsed: str, meta: dict):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    (PROFILE_DIR / f"{profile_id}.collapsed").write_text(collapsed, encoding="utf-8")
+    (PROFILE_DIR / f"{profile_id}.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    sidecars = sorted(PROFILE_DIR.glob("*.json"), key=lambda path: path.stat().st_mtime, reverse=True)
+    for old in sidecars[PROFILE_KEEP:]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".collapsed").unlink(missing_ok=True)
+
+
+def list_profiles() -> list:
+    """Metadata of the stored profiles, newest first"""
+    if not PROFILE_DIR.exists():
+        return []
+    profiles = []
+    for path in PROFILE_DIR.glob("*.json"):
+        try:
+            profiles.append(json.loads(path.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            continue
+    return sorted(profiles, key=lambda meta: meta["created_at"], reverse=True)
+
+
+def profile_path(profile_id: str):
+    """Path of a stored profile's collapsed stacks (None if unknown or malformed id)"""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = PROFILE_DIR / f"{profile_id}.collapsed"
+    return path if path.exists() else None
+
+
+class ProfilerMiddleware:
+    """Profiles flagged requests when `authorize(scope)` accepts the caller"""
+
+    def __init__(self, app, authorize):
+        self.app = app
+        self.authorize = authorize
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED or not requested(scope):
+            return await self.app(scope, receive, send)
+        if not await self.authorize(scope):
+            return await self.app(scope, receive, send)
+
+        profile_id = uuid.uuid4().hex
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((ID_HEADER, profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        sampler = Sampler(
+            asyncio.get_running_loop(), asyncio.current_task(), threading.get_ident(),
+            PROFILE_INTERVAL_MS / 1000,
+        )
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            await asyncio.to_thread(sampler.stop)
+            meta = {
+                "id": profile_id,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "method": scope["method"],
+                "route": metrics.route_label(scope),
+                "path": scope["path"],
+                "query_string": scope.get("query_string", b"").decode("latin-1"),
+                "status": status_code,
+                "duration_ms": round(duration * 1000, 2),
+                "interval_ms": PROFILE_INTERVAL_MS,
+                "running_samples": sampler.running_samples,
+                "waiting_samples": sampler.waiting_samples,
+            }
+            try:
+                await asyncio.to_thread(save_profile, profile_id, sampler.collapsed(), meta)
+                logger.info(f"Profiled {scope['method']} {scope['path']} as {profile_id}")
+            except OSError as e:
+                logger.error(f"Could not save profile {profile_id}: {e}")
@@ -0,0 +1,144 @@
+"""
+Per-request database query counting, for catching N+1 loops.
+
+QueryCountListener is a pymongo CommandListener (the in-memory backend feeds
+it the same events). It adds every command to the QueryCounter of the
+current context. Motor copies contextvars into its executor threads, so each
+command is charged to the request that awaited it, including work fanned out
+with asyncio.gather.
+
+QueryCounterMiddleware opens a counter for every request:
+- it logs a warning when a route goes over its budget, naming the busiest
+  collection.command pairs
+- with DEBUG_DB_QUERIES=true, it returns the count in an X-DB-Queries header
+
+Budgets: DB_QUERY_BUDGET (default 25) applies to every route. Override it per
+route template with DB_QUERY_BUDGETS="/api/inventory-summary=60,/api/stock-alerts=40".
+
+Tests can bound an endpoint's queries, so an N+1 regression fails CI:
+
+    with assert_max_queries(4):
+        response = await client.get("/api/dashboard/stats")
+"""
+import contextvars
+import logging
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEBUG_HEADER = os.environ.get("DEBUG_DB_QUERIES", "").lower() in ("1", "true", "yes")
+HEADER_NAME = b"x-db-queries"
+DEFAULT_BUDGET = int(os.environ.get("DB_QUERY_BUDGET", "25"))
+
+
+def parse_budgets(value: str) -> dict:
+    """'/api/a=10,/api/b=20' -> {'/api/a': 10, '/api/b': 20}"""
+    budgets = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        route, _, limit = entry.rpartition("=")
+        budgets[route] = int(limit)
+    return budgets
+
+
+ROUTE_BUDGETS = parse_budgets(os.environ.get("DB_QUERY_BUDGETS", ""))
+
+_current = contextvars.ContextVar("db_query_counter", default=None)
+
+
+class QueryCounter:
+    """Commands sent while this counter is active (also charged to enclosing counters)"""
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.count = 0
+        self.commands = Counter()
+        self.lock = threading.Lock()
+
+    def record(self, collection: str, command_name: str):
+        counter = self
+        while counter is not None:
+            with counter.lock:
+                counter.count += 1
+                counter.commands[f"{collection}.{command_name}"] += 1
+            counter = counter.parent
+
+    def summary(self, top: int = 5) -> str:
+        return ", ".join(f"{name} x{count}" for name, count in self.commands.most_common(top))
+
+
+class QueryCountListener(monitoring.CommandListener):
+    def started(self, event):
+        counter = _current.get()
+        if counter is not None:
+            counter.record(metrics.command_collection(event), event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def budget_for(route: str) -> int:
+    return ROUTE_BUDGETS.get(route, DEFAULT_BUDGET)
+
+
+class QueryCounterMiddleware:
+    """Counts each request's database commands, warns over budget, optionally reports them in a header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        counter = QueryCounter(parent=_current.get())
+        token = _current.set(counter)
+
+        async def send_wrapper(message):
+            if DEBUG_HEADER and message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((HEADER_NAME, str(counter.count).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = metrics.route_label(scope)
+            budget = budget_for(route)
+            if counter.count > budget:
+                logger.warning(
+                    f"{scope['method']} {route} made {counter.count} database queries "
+                    f"(budget {budget}): {counter.summary()}"
+                )
+
+
+@contextmanager
+def count_queries():
+    """Count the database commands issued inside the block"""
+    counter = QueryCounter(parent=_current.get())
+    token = _current.set(counter)
+    try:
+        yield counter
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int):
+    """Fail (AssertionError) if the block issues more than `limit` database commands"""
+    with count_queries() as counter:
+        yield counter
+    assert counter.count <= limit, (
+        f"{counter.count} database queries, expected at most {limit}: {counter.summary(10)}"
+    )
@@ -0,0 +1,429 @@
+"""
+CSV / Excel / PDF renderers for the report endpoints.
+
+server.py imports this module on the first export, not at startup. Only a few
+admins ever export, so workers that never do skip loading openpyxl and
+reportlab. That saves their import time and memory
+(see benchmarks/bench_startup.py).
+
+Every renderer takes the rows the endpoint already fetched and returns the
+file as bytes.
+"""
+import csv
+from datetime import datetime, timezone
+from io import BytesIO, StringIO
+
+import pytz
+from openpyxl import Workbook
+from openpyxl.styles import Alignment, Font, PatternFill
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+IST = pytz.timezone("Asia/Kolkata")
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "excel": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+}
+EXTENSIONS = {"csv": "csv", "excel": "xlsx", "pdf": "pdf"}
+
+
+# Shared helpers
+
+
+def day_label(value) -> str:
+    """YYYY-MM-DD of a stored date (IST strings, or BSON datetimes that come back as naive UTC)"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(IST).strftime("%Y-%m-%d")
+    return str(value)[:10] if value else ""
+
+
+def text(value, length=None) -> str:
+    """String cell, '' for missing values, optionally truncated"""
+    value = "" if value is None else str(value)
+    return value[:length] if length else value
+
+
+def write_csv(rows) -> bytes:
+    output = StringIO()
+    csv.writer(output).writerows(rows)
+    return output.getvalue().encode("utf-8")
+
+
+def header_workbook(title: str, headers, color: str):
+    """Workbook whose first row is `headers` in bold white on `color`"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = title
+    ws.append(headers)
+    for cell in ws[1]:
+        cell.font = Font(bold=True, color="FFFFFF")
+        cell.fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+        cell.alignment = Alignment(horizontal="center")
+    return wb, ws
+
+
+def save_workbook(wb) -> bytes:
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def build_pdf(title: str, elements, pagesize=letter, spacing=0.3) -> bytes:
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=pagesize)
+    styles = getSampleStyleSheet()
+    doc.build([Paragraph(f"<b>{title}</b>", styles["Title"]), Spacer(1, spacing * inch)] + elements)
+    return buffer.getvalue()
+
+
+def no_records(message: str):
+    return [Paragraph(message, getSampleStyleSheet()["Normal"])]
+
+
+def header_table_style(color: str, font_size: int, extra=()):
+    return TableStyle(
+        [
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor(color)),
+            ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
+            ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("FONTSIZE", (0, 0), (-1, 0), font_size),
+            *extra,
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+        ]
+    )
+
+
+# Sales
+
+SALES_HEADERS = ["Date", "Customer", "Items", "Subtotal", "Tax", "Discount", "Total", "Payment Method"]
+NO_SALES = "No records found for the selected date range"
+
+
+def sales_rows(sales):
+    for sale in sales:
+        yield [
+            sale.get("sale_date") or sale.get("created_at", ""),
+            sale.get("customer_name") or "Walk-in",
+            len(sale.get("items", [])),
+            sale.get("subtotal", 0),
+            sale.get("tax", 0),
+            sale.get("discount", 0),
+            sale.get("total", 0),
+            sale.get("payment_method", ""),
+        ]
+
+
+def sales_csv(sales) -> bytes:
+    rows = [SALES_HEADERS]
+    if not sales:
+        rows.append([NO_SALES, "", "", "", "", "", "", ""])
+    rows.extend(sales_rows(sales))
+    return write_csv(rows)
+
+
+def sales_excel(sales) -> bytes:
+    wb, ws = header_workbook("Sales Report", SALES_HEADERS, "0066CC")
+    if not sales:
+        ws.append([NO_SALES, "", "", "", "", "", "", ""])
+    for row in sales_rows(sales):
+        ws.append(row)
+    return save_workbook(wb)
+
+
+def sales_pdf(sales) -> bytes:
+    if not sales:
+        return build_pdf("Sales Report", no_records(NO_SALES + "."))
+
+    data = [["Date", "Customer", "Items", "Subtotal", "Tax", "Discount", "Total", "Payment"]]
+    for sale in sales:
+        data.append(
+            [
+                day_label(sale.get("sale_date") or sale.get("created_at", "")),
+                text(sale.get("customer_name") or "Walk-in", 15),
+                str(len(sale.get("items", []))),
+                f"Rs {sale.get('subtotal', 0):.2f}",
+                f"Rs {sale.get('tax', 0):.2f}",
+                f"Rs {sale.get('discount', 0):.2f}",
+                f"Rs {sale.get('total', 0):.2f}",
+                text(sale.get("payment_method")),
+            ]
+        )
+    table = Table(data)
+    table.setStyle(header_table_style("#0066CC", 10, [("BOTTOMPADDING", (0, 0), (-1, 0), 12)]))
+    return build_pdf("Sales Report", [table])
+
+
+# Inventory
+
+INVENTORY_HEADERS = [
+    "Name", "Category", "Type", "Stock", "Unit", "Reorder Level", "Price", "Purchase Cost", "Status",
+]
+
+
+def inventory_rows(products):
+    for product in products:
+        status = "Low Stock" if product["stock_quantity"] <= product["reorder_level"] else "In Stock"
+        ptype = "Raw Material" if product.get("is_raw_material", False) else "Derived Product"
+        yield [
+            product["name"],
+            product["category"],
+            ptype,
+            product["stock_quantity"],
+            product["unit"],
+            product["reorder_level"],
+            product["price_per_unit"],
+            product.get("purchase_cost", 0),
+            status,
+        ]
+
+
+def inventory_csv(products) -> bytes:
+    return write_csv([INVENTORY_HEADERS, *inventory_rows(products)])
+
+
+def inventory_excel(products) -> bytes:
+    wb, ws = header_workbook("Inventory Report", INVENTORY_HEADERS, "008000")
+    for row in inventory_rows(products):
+        ws.append(row)
+    return save_workbook(wb)
+
+
+def inventory_pdf(products) -> bytes:
+    data = [["Name", "Category", "Type", "Stock", "Unit", "Price", "Status"]]
+    for product in products:
+        data.append(
+            [
+                product["name"][:20],
+                product["category"][:10],
+                "Raw" if product.get("is_raw_material", False) else "Derived",
+                str(product["stock_quantity"]),
+                product["unit"],
+                f"Rs {product['price_per_unit']:.0f}",
+                "Low" if product["stock_quantity"] <= product["reorder_level"] else "OK",
+            ]
+        )
+    table = Table(data)
+    table.setStyle(header_table_style("#008000", 9))
+    return build_pdf("Inventory Report", [table], pagesize=A4)
+
+
+# Purchases
+
+PURCHASE_HEADERS = ["Date", "Category", "Vendor", "Weight (kg)", "Pieces", "Cost/kg", "Total Cost"]
+NO_PURCHASES = "No records found for the selected date range"
+
+
+def purchase_rows(purchases):
+    for purchase in purchases:
+        yield [
+            purchase.get("purchase_date", ""),
+            purchase.get("main_category_name", ""),
+            purchase.get("vendor_name", ""),
+            purchase.get("total_weight_kg", 0),
+            purchase.get("total_pieces", 0),
+            purchase.get("cost_per_kg", 0),
+            purchase.get("total_cost", 0),
+        ]
+
+
+def purchases_csv(purchases) -> bytes:
+    rows = [PURCHASE_HEADERS]
+    if not purchases:
+        rows.append([NO_PURCHASES, "", "", "", "", "", ""])
+    rows.extend(purchase_rows(purchases))
+    return write_csv(rows)
+
+
+def purchases_excel(purchases) -> bytes:
+    wb, ws = header_workbook("Purchase Report", PURCHASE_HEADERS, "FF6600")
+    if not purchases:
+        ws.append([NO_PURCHASES, "", "", "", "", "", ""])
+    for row in purchase_rows(purchases):
+        ws.append(row)
+    return save_workbook(wb)
+
+
+def purchases_pdf(purchases) -> bytes:
+    if not purchases:
+        return build_pdf("Purchase Report", no_records(NO_PURCHASES + "."))
+
+    data = [["Date", "Category", "Vendor", "Weight", "Pieces", "Cost/kg", "Total"]]
+    for purchase in purchases:
+        data.append(
+            [
+                day_label(purchase.get("purchase_date")),
+                text(purchase.get("main_category_name"), 15),
+                text(purchase.get("vendor_name"), 15),
+                f"{purchase.get('total_weight_kg', 0):.2f}",
+                str(purchase.get("total_pieces", 0)),
+                f"Rs {purchase.get('cost_per_kg', 0):.2f}",
+                f"Rs {purchase.get('total_cost', 0):.2f}",
+            ]
+        )
+    table = Table(data)
+    table.setStyle(header_table_style("#FF6600", 9))
+    return build_pdf("Purchase Report", [table])
+
+
+# Profit & loss (totals dict built by the endpoint)
+
+
+def profit_loss_csv(totals) -> bytes:
+    return write_csv(
+        [
+            ["Metric", "Amount"],
+            ["Total Revenue", totals["total_revenue"]],
+            ["Cost of Goods Sold", totals["total_cogs"]],
+            ["Gross Margin", totals["gross_margin"]],
+            ["Total Purchase Cost", totals["total_purchase_cost"]],
+            ["Gross Profit", totals["gross_profit"]],
+            ["Profit Margin %", f"{totals['profit_margin']:.2f}%"],
+            [],
+            ["Sales Count", totals["sales_count"]],
+            ["Purchase Count", totals["purchase_count"]],
+        ]
+    )
+
+
+def profit_loss_excel(totals) -> bytes:
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Profit & Loss"
+
+    ws["A1"] = "Profit & Loss Report"
+    ws["A1"].font = Font(bold=True, size=16)
+    ws.merge_cells("A1:B1")
+
+    ws.append([])
+    ws.append(["Metric", "Amount"])
+    ws["A3"].font = Font(bold=True)
+    ws["B3"].font = Font(bold=True)
+
+    ws.append(["Total Revenue", totals["total_revenue"]])
+    ws.append(["Cost of Goods Sold", totals["total_cogs"]])
+    ws.append(["Gross Margin", totals["gross_margin"]])
+    ws.append(["Total Purchase Cost", totals["total_purchase_cost"]])
+    ws.append(["Gross Profit", totals["gross_profit"]])
+    ws.append(["Profit Margin %", f"{totals['profit_margin']:.2f}%"])
+    ws.append([])
+    ws.append(["Sales Count", totals["sales_count"]])
+    ws.append(["Purchase Count", totals["purchase_count"]])
+    return save_workbook(wb)
+
+
+def profit_loss_pdf(totals) -> bytes:
+    data = [
+        ["Metric", "Amount"],
+        ["Total Revenue", f"Rs {totals['total_revenue']:.2f}"],
+        ["Cost of Goods Sold", f"Rs {totals['total_cogs']:.2f}"],
+        ["Gross Margin", f"Rs {totals['gross_margin']:.2f}"],
+        ["Total Purchase Cost", f"Rs {totals['total_purchase_cost']:.2f}"],
+        ["Gross Profit", f"Rs {totals['gross_profit']:.2f}"],
+        ["Profit Margin", f"{totals['profit_margin']:.2f}%"],
+        ["", ""],
+        ["Sales Count", str(totals["sales_count"])],
+        ["Purchase Count", str(totals["purchase_count"])],
+    ]
+    profit_color = "#CCFFCC" if totals["gross_profit"] > 0 else "#FFCCCC"
+
+    table = Table(data, colWidths=[3 * inch, 2 * inch])
+    table.setStyle(
+        TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#6600CC")),
+                ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
+                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+                ("FONTSIZE", (0, 0), (-1, -1), 11),
+                ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+                ("BACKGROUND", (0, 5), (-1, 5), colors.HexColor(profit_color)),
+            ]
+        )
+    )
+    return build_pdf("Profit & Loss Report", [table], spacing=0.5)
+
+
+# Extra expenses
+
+EXPENSE_HEADERS = ["Date", "Type", "Description", "Amount (Rs)", "Notes"]
+NO_EXPENSES = "No records found for the selected filters"
+
+
+def expense_rows(expenses):
+    for expense in expenses:
+        yield [
+            expense.get("expense_date", ""),
+            expense.get("expense_type", ""),
+            expense.get("description", ""),
+            expense.get("amount", 0),
+            expense.get("notes", ""),
+        ]
+
+
+def expenses_total(expenses) -> float:
+    return sum(e.get("amount", 0) for e in expenses)
+
+
+def extra_expenses_csv(expenses) -> bytes:
+    rows = [EXPENSE_HEADERS]
+    if not expenses:
+        rows.append([NO_EXPENSES, "", "", "", ""])
+    rows.extend(expense_rows(expenses))
+    if expenses:
+        rows += [[], ["TOTAL", "", "", expenses_total(expenses), ""]]
+    return write_csv(rows)
+
+
+def extra_expenses_excel(expenses) -> bytes:
+    wb, ws = header_workbook("Extra Expenses", EXPENSE_HEADERS, "059669")
+    if not expenses:
+        ws.append([NO_EXPENSES, "", "", "", ""])
+    else:
+        for row in expense_rows(expenses):
+            ws.append(row)
+
+        # Total row, in bold
+        ws.append([])
+        ws.append(["TOTAL", "", "", expenses_total(expenses), ""])
+        for cell in ws[ws.max_row]:
+            cell.font = Font(bold=True)
+    return save_workbook(wb)
+
+
+def extra_expenses_pdf(expenses) -> bytes:
+    if not expenses:
+        return build_pdf("Extra Expenses Report", no_records(NO_EXPENSES + "."))
+
+    data = [["Date", "Type", "Description", "Amount", "Notes"]]
+    for expense in expenses:
+        data.append(
+            [
+                day_label(expense.get("expense_date")),
+                text(expense.get("expense_type"), 12),
+                text(expense.get("description"), 25),
+                f"Rs {expense.get('amount', 0):.2f}",
+                text(expense.get("notes"), 15) or "-",
+            ]
+        )
+    data.append(["", "", "TOTAL", f"Rs {expenses_total(expenses):.2f}", ""])
+
+    table = Table(data)
+    table.setStyle(
+        header_table_style(
+            "#059669",
+            8,
+            [
+                ("BACKGROUND", (0, -1), (-1, -1), colors.HexColor("#E0E0E0")),
+                ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
+            ],
+        )
+    )
+    return build_pdf("Extra Expenses Report", [table])
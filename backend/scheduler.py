@@ -0,0 +1,336 @@
+"""
+In-process scheduler for maintenance jobs (rollups, snapshots, cache warm-up, integrity checks).
+
+Jobs are async functions registered with a cron expression, read in the
+business timezone:
+
+    @jobs.job("daily_rollup", "5 0 * * *")
+    async def daily_rollup():
+        ...
+
+Cron expressions have the usual five fields (minute hour day-of-month month
+day-of-week, Sunday = 0), each `*`, a number, a range `a-b`, a list `a,b` or a
+step `*/n` / `a-b/n`.
+
+Every worker runs the scheduler. For an exclusive job (the default), a lease
+document in `scheduler_leases` makes sure one worker runs each occurrence:
+- the lease names the occurrence it was last taken for
+- a worker takes it with a conditional upsert, and only for a newer
+  occurrence whose previous run has finished or whose lease has expired
+- losing the race is silent. A worker that crashes mid-run holds the lease
+  until `lease_seconds` runs out.
+Jobs with `exclusive=False` (per-process cache warm-up) run on every worker
+without a lease.
+
+`trigger()` runs a job by hand. It refuses (JobBusy) while a run of the job
+is going on this worker, and for exclusive jobs it takes the lease like a
+scheduled occurrence, so a manual run never overlaps another worker's run.
+
+An error in the scheduling itself (Mongo down while taking a lease) is logged
+and retried with capped exponential backoff; the job keeps its schedule.
+
+Each run leaves a document in `scheduler_runs` with its status, duration,
+result or error. History expires after SCHEDULER_HISTORY_DAYS through a TTL
+index.
+
+`stop()` (called from shutdown_db_client) stops scheduling at once. It gives
+running jobs SCHEDULER_STOP_TIMEOUT seconds to finish, then cancels them and
+records them as cancelled. SCHEDULER_ENABLED=false leaves the scheduler off
+on a worker.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LEASES = "scheduler_leases"
+RUNS = "scheduler_runs"
+
+ENABLED = os.environ.get("SCHEDULER_ENABLED", "true").lower() != "false"
+HISTORY_DAYS = int(os.environ.get("SCHEDULER_HISTORY_DAYS", "30"))
+STOP_TIMEOUT = float(os.environ.get("SCHEDULER_STOP_TIMEOUT", "10"))
+# Backoff after a failure in the scheduling loop itself (taking a lease, say)
+RETRY_INITIAL_SECONDS = 5.0
+RETRY_MAX_SECONDS = 300.0
+WORKER = f"{socket.gethostname()}:{os.getpid()}"
+
+JOB_RUNS = metrics.Counter(
+    "scheduler_job_runs_total", "Scheduled job runs by job and status (success, failed, cancelled)",
+    ("job", "status"),
+)
+JOB_DURATION = metrics.Histogram(
+    "scheduler_job_duration_seconds", "Scheduled job run time by job", ("job",),
+    (0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0),
+)
+
+
+# Cron expressions
+
+FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+
+def parse_field(field: str, low: int, high: int) -> frozenset:
+    values = set()
+    for part in field.split(","):
+        part, _, step = part.partition("/")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(value) for value in part.split("-", 1))
+        else:
+            start = end = int(part)
+            if step:
+                end = high
+        if not low <= start <= end <= high:
+            raise ValueError(f"Cron field '{field}' is outside {low}-{high}")
+        values.update(range(start, end + 1, int(step or 1)))
+    return frozenset(values)
+
+
+class Cron:
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields, got '{expression}'")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            parse_field(field, low, high) for field, (low, high) in zip(fields, FIELD_RANGES)
+        )
+        # Like cron: with both day fields restricted, either one matching is enough
+        self.any_day = fields[2] == "*" or fields[4] == "*"
+
+    def day_matches(self, moment: datetime) -> bool:
+        in_month = moment.day in self.days
+        # datetime weekday(): Monday = 0; cron: Sunday = 0
+        in_week = (moment.weekday() + 1) % 7 in self.weekdays
+        return in_month and in_week if self.any_day else in_month or in_week
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First matching minute strictly after `moment` (wall-clock time, no tzinfo)"""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months or not self.day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+
+# Jobs
+
+
+class JobBusy(Exception):
+    """A job can't be triggered: a run of it is already going (here or on another worker)"""
+
+
+class Job:
+    def __init__(self, name, cron, function, exclusive, lease_seconds):
+        self.name = name
+        self.cron = Cron(cron)
+        self.function = function
+        self.exclusive = exclusive
+        self.lease_seconds = lease_seconds
+        self.next_run = None
+        self.running = None
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "schedule": self.cron.expression,
+            "exclusive": self.exclusive,
+            "next_run": self.next_run,
+            "running": self.running is not None,
+        }
+
+
+class Scheduler:
+    def __init__(self, now):
+        # `now` returns the current time in the timezone schedules are written in
+        self.now = now
+        self.jobs = {}
+        self.db = None
+        self.tasks = []
+
+    def job(self, name: str, cron: str, exclusive: bool = True, lease_seconds: float = 3600):
+        """Decorator registering an async function as a scheduled job"""
+
+        def register(function):
+            self.jobs[name] = Job(name, cron, function, exclusive, lease_seconds)
+            return function
+
+        return register
+
+    async def start(self, db):
+        self.db = db
+        if not ENABLED:
+            return {"enabled": False, "jobs": 0}
+        self.tasks = [asyncio.create_task(self._loop(job)) for job in self.jobs.values()]
+        return {"enabled": True, "jobs": len(self.jobs)}
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        running = [job.running for job in self.jobs.values() if job.running is not None]
+        if running:
+            logger.info(f"Waiting up to {STOP_TIMEOUT}s for {len(running)} scheduled job(s) to finish")
+            _, pending = await asyncio.wait(running, timeout=STOP_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _loop(self, job: Job):
+        backoff = RETRY_INITIAL_SECONDS
+        while True:
+            try:
+                await self._next_occurrence(job)
+                backoff = RETRY_INITIAL_SECONDS
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # A Mongo error taking the lease must not end the job's schedule
+                logger.exception(f"Scheduling {job.name} failed, retrying in {backoff:.0f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, RETRY_MAX_SECONDS)
+
+    async def _next_occurrence(self, job: Job):
+        """Wait for the job's next occurrence and run it, if this worker gets the lease"""
+        now = self.now()
+        job.next_run = job.cron.next_after(now.replace(tzinfo=None)).replace(tzinfo=now.tzinfo)
+        await asyncio.sleep(max((job.next_run - self.now()).total_seconds(), 0))
+        while self.now() < job.next_run:
+            # The event loop's clock can wake us a little before the wall clock gets there
+            await asyncio.sleep(0.05)
+        if job.running is not None:
+            # A manual run is still going; this occurrence is skipped
+            return
+        if job.exclusive and not await self._take_lease(job, job.next_run):
+            return
+        # Shielded: stop() cancels this loop, but gives the run itself time to finish
+        job.running = asyncio.create_task(self.run(job, job.next_run))
+        try:
+            await asyncio.shield(job.running)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass
+
+    # Leases
+
+    async def _take_lease(self, job: Job, occurrence: datetime) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            await self.db[LEASES].find_one_and_update(
+                {
+                    "_id": job.name,
+                    "occurrence": {"$lt": occurrence.isoformat()},
+                    "$or": [{"running": False}, {"lease_until": {"$lte": now}}],
+                },
+                {
+                    "$set": {
+                        "occurrence": occurrence.isoformat(),
+                        "owner": WORKER,
+                        "running": True,
+                        "lease_until": now + timedelta(seconds=job.lease_seconds),
+                    }
+                },
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # The lease exists and didn't match: another worker has this occurrence
+            return False
+        lease = await self.db[LEASES].find_one({"_id": job.name})
+        return lease is not None and lease.get("owner") == WORKER and lease.get("occurrence") == occurrence.isoformat()
+
+    async def _release_lease(self, job: Job):
+        await self.db[LEASES].update_one(
+            {"_id": job.name, "owner": WORKER},
+            {"$set": {"running": False, "lease_until": datetime.now(timezone.utc)}},
+        )
+
+    # Running
+
+    async def trigger(self, job: Job) -> dict:
+        """Run a job by hand now; raises JobBusy while a run of it is going"""
+        if job.running is not None:
+            raise JobBusy(f"{job.name} is already running on this worker")
+        occurrence = self.now()
+        # Exclusive jobs take the lease like a scheduled occurrence, so no other worker runs them meanwhile
+        if job.exclusive and not await self._take_lease(job, occurrence):
+            raise JobBusy(f"{job.name} is running on another worker")
+        if job.running is not None:
+            # A scheduled occurrence started while the lease was being taken
+            await self._release_lease(job)
+            raise JobBusy(f"{job.name} is already running on this worker")
+        # Tracked like a scheduled run, so stop() waits for it too
+        job.running = asyncio.create_task(self.run(job, occurrence, manual=True))
+        return await asyncio.shield(job.running)
+
+    async def run(self, job: Job, occurrence: datetime = None, manual: bool = False) -> dict:
+        """Run a job now and record the run (the scheduled loop and trigger() call this)"""
+        record = {
+            "id": str(uuid.uuid4()),
+            "job": job.name,
+            "worker": WORKER,
+            "manual": manual,
+            "scheduled_for": None if manual or occurrence is None else occurrence.isoformat(),
+            "started_at": datetime.now(timezone.utc),
+            "status": "running",
+        }
+        await self.db[RUNS].insert_one(dict(record))
+        started = time.perf_counter()
+        result = error = None
+        try:
+            result = await job.function()
+            status = "success"
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            status = "failed"
+            error = str(e)
+            logger.error(f"Scheduled job {job.name} failed: {e}")
+        finally:
+            duration = time.perf_counter() - started
+            JOB_RUNS.inc((job.name, status))
+            JOB_DURATION.observe((job.name,), duration)
+            finished = {
+                "status": status,
+                "finished_at": datetime.now(timezone.utc),
+                "duration_ms": round(duration * 1000, 1),
+                "result": result,
+                "error": error,
+            }
+            record.update(finished)
+            try:
+                await self.db[RUNS].update_one({"id": record["id"]}, {"$set": finished})
+                if job.exclusive and occurrence is not None:
+                    await self._release_lease(job)
+            except Exception as e:
+                logger.warning(f"Could not record the run of {job.name}: {e}")
+            # Only this run's own handle; clearing another run's would let stop() miss it
+            if job.running is asyncio.current_task():
+                job.running = None
+        if status == "success":
+            logger.info(f"✅ Scheduled job {job.name} finished in {record['duration_ms']}ms")
+        return record
+
+    async def history(self, job_name: str = None, limit: int = 20) -> list:
+        query = {"job": job_name} if job_name else {}
+        return (
+            await self.db[RUNS].find(query, {"_id": 0}).sort("started_at", -1).limit(limit).to_list(limit)
+        )
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator for scale testing Bano Fresh.
+
+Fills a database with categories, derived products, vendors, customers and
+several years of purchases, POS sales, waste entries, pieces entries and
+extra expenses shaped exactly like the documents server.py writes.
+
+The simulation follows realistic daily patterns:
+- busier weekends and festive months, morning and evening sales peaks
+- categories are restocked from vendors whenever stock runs low
+- sales and waste consume purchase lots FIFO, so remaining_weight_kg,
+  remaining_pieces and the stored sale COGS are all consistent
+
+Output is fully determined by --seed and the size options (pass --end-date
+as well so the date range does not move), which keeps benchmarks repeatable.
+Documents are written with unordered insert_many batches, several in flight
+at once.
+
+Run this with:
+  python seed_data.py --reset --sales 200000 --years 2
+  python seed_data.py --reset --sales 4000000 --years 5 --batch-size 10000 --concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytz
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+IST = pytz.timezone("Asia/Kolkata")
+
+SEEDED_COLLECTIONS = [
+    "main_categories",
+    "derived_products",
+    "vendors",
+    "customers",
+    "expense_types",
+    "inventory_purchases",
+    "pos_sales",
+    "daily_waste_tracking",
+    "daily_pieces_tracking",
+    "extra_expenses",
+]
+
+CATEGORY_NAMES = ["Chicken", "Mutton", "Frozen", "Liver", "Kidney", "Fish", "Prawns", "Eggs"]
+PRODUCT_CUTS = ["Curry Cut", "Boneless", "Mince", "Whole", "Drumsticks", "Breast", "Wings", "Lollipop"]
+EXPENSE_TYPES = [
+    "Tea", "Coffee", "Staff Food", "Petrol", "Transport", "Electricity", "Water",
+    "Gas", "Maintenance", "Cleaning", "Stationery", "Repairs", "Miscellaneous",
+]
+PAYMENT_METHODS = ["cash", "upi", "card", "credit"]
+PAYMENT_WEIGHTS = [45, 40, 10, 5]
+
+# Relative sales volume per weekday (Mon..Sun) and per month (Jan..Dec)
+WEEKDAY_WEIGHTS = [0.85, 0.8, 0.85, 0.9, 1.0, 1.3, 1.45]
+MONTH_WEIGHTS = [1.0, 0.95, 1.0, 1.1, 0.9, 0.9, 0.95, 1.0, 1.05, 1.25, 1.2, 1.15]
+# Sales per hour of the day, peaking in the morning and evening
+HOUR_WEIGHTS = {7: 6, 8: 10, 9: 12, 10: 10, 11: 7, 12: 5, 13: 4, 14: 3, 15: 3,
+                16: 4, 17: 7, 18: 10, 19: 11, 20: 8, 21: 4}
+
+AVG_ITEMS_PER_SALE = 1.8
+AVG_KG_PER_ITEM = 1.1
+
+
+class Simulator:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.end_day = datetime.strptime(args.end_date, "%Y-%m-%d")
+        self.start_day = self.end_day - timedelta(days=int(args.years * 365) - 1)
+        self.days = (self.end_day - self.start_day).days + 1
+
+    # ---------- helpers ----------
+
+    def new_id(self):
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def at(self, day, hour, minute=None, second=None):
+        return IST.localize(
+            day.replace(
+                hour=hour,
+                minute=self.rng.randrange(60) if minute is None else minute,
+                second=self.rng.randrange(60) if second is None else second,
+            )
+        )
+
+    # ---------- catalog ----------
+
+    def build_catalog(self):
+        start = self.at(self.start_day, 6, 0, 0)
+        self.categories = []
+        for i in range(self.args.categories):
+            name = CATEGORY_NAMES[i] if i < len(CATEGORY_NAMES) else f"Category {i + 1}"
+            self.categories.append(
+                {
+                    "id": self.new_id(),
+                    "name": name,
+                    "description": f"{name} (seeded)",
+                    "created_at": start,
+                    "updated_at": start,
+                    # Simulation state below is stripped before insert
+                    "_base_cost": self.rng.uniform(140, 650),
+                    "_sells_pieces": "mutton" in name.lower() or "frozen" in name.lower(),
+                    "_lots": [],
+                    "_weight_lot": 0,
+                    "_pieces_lot": 0,
+                    "_stock_kg": 0.0,
+                }
+            )
+
+        self.products = []
+        for category in self.categories:
+            for j in range(self.args.products_per_category):
+                cut = PRODUCT_CUTS[j % len(PRODUCT_CUTS)]
+                roll = self.rng.random()
+                if category["_sells_pieces"] and roll < 0.3:
+                    sale_unit, package_weight = "pieces", None
+                elif roll < 0.2:
+                    sale_unit, package_weight = "package", self.rng.choice([0.25, 0.5, 1.0])
+                else:
+                    sale_unit, package_weight = "weight", None
+                self.products.append(
+                    {
+                        "id": self.new_id(),
+                        "main_category_id": category["id"],
+                        "name": f"{category['name']} {cut}",
+                        "sku": f"{category['name'][:3].upper()}-{j + 1:03d}",
+                        "sale_unit": sale_unit,
+                        "package_weight_kg": package_weight,
+                        "selling_price": round(category["_base_cost"] * self.rng.uniform(1.25, 1.6), 0),
+                        "description": None,
+                        "created_at": start,
+                        "updated_at": start,
+                        "_category": category,
+                    }
+                )
+
+        self.vendors = [
+            {
+                "id": self.new_id(),
+                "name": f"Vendor {i + 1}",
+                "contact_person": f"Contact {i + 1}",
+                "phone": f"9{self.rng.randrange(10**8, 10**9)}",
+                "email": None,
+                "address": None,
+                "created_at": start,
+            }
+            for i in range(self.args.vendors)
+        ]
+
+        self.customers = [
+            {
+                "id": self.new_id(),
+                "name": f"Customer {i + 1}",
+                "phone": f"8{self.rng.randrange(10**8, 10**9)}",
+                "email": None,
+                "address": None,
+                "total_purchases": 0.0,
+                "created_at": start,
+            }
+            for i in range(self.args.customers)
+        ]
+
+    # ---------- FIFO stock ----------
+
+    def restock(self, category, day, expected_kg):
+        cost_per_kg = round(category["_base_cost"] * self.rng.uniform(0.9, 1.1), 2)
+        weight = round(max(expected_kg * 4 * self.rng.uniform(0.8, 1.2), 5.0), 2)
+        pieces = int(weight / 1.5) if category["_sells_pieces"] else None
+        vendor = self.rng.choice(self.vendors)
+        purchased_at = self.at(day, 5)
+        lot = {
+            "id": self.new_id(),
+            "main_category_id": category["id"],
+            "main_category_name": category["name"],
+            "vendor_id": vendor["id"],
+            "vendor_name": vendor["name"],
+            "purchase_date": purchased_at,
+            "total_weight_kg": weight,
+            "total_pieces": pieces,
+            "remaining_weight_kg": weight,
+            "remaining_pieces": pieces,
+            "cost_per_kg": cost_per_kg,
+            "total_cost": round(weight * cost_per_kg, 2),
+            "notes": None,
+            "created_at": purchased_at,
+        }
+        category["_lots"].append(lot)
+        category["_stock_kg"] += weight
+
+    def consume(self, category, weight_kg=0.0, pieces=0):
+        """Deduct from the oldest lots first; returns the cost consumed"""
+        lots = category["_lots"]
+        cost = 0.0
+
+        # Weight and pieces run out at different rates, so each has its own FIFO pointer
+        index = category["_weight_lot"]
+        while weight_kg > 0 and index < len(lots):
+            lot = lots[index]
+            deduction = min(lot["remaining_weight_kg"], weight_kg)
+            lot["remaining_weight_kg"] = round(lot["remaining_weight_kg"] - deduction, 2)
+            weight_kg -= deduction
+            category["_stock_kg"] -= deduction
+            cost += deduction * lot["cost_per_kg"]
+            if lot["remaining_weight_kg"] <= 0:
+                index += 1
+        category["_weight_lot"] = index
+
+        index = category["_pieces_lot"]
+        while index < len(lots) and (pieces > 0 or not lots[index]["remaining_pieces"]):
+            lot = lots[index]
+            if lot["remaining_pieces"]:
+                deduction = min(lot["remaining_pieces"], pieces)
+                lot["remaining_pieces"] -= deduction
+                pieces -= deduction
+                cost += deduction * lot["total_cost"] / lot["total_pieces"]
+            if not lot["remaining_pieces"]:
+                index += 1
+        category["_pieces_lot"] = index
+
+        return cost
+
+    async def flush_closed_lots(self, writer, category):
+        """Lots behind both FIFO pointers can no longer change - write them out"""
+        closed = min(category["_weight_lot"], category["_pieces_lot"])
+        if closed:
+            for lot in category["_lots"][:closed]:
+                await writer.add("inventory_purchases", lot)
+            del category["_lots"][:closed]
+            category["_weight_lot"] -= closed
+            category["_pieces_lot"] -= closed
+
+    # ---------- daily activity ----------
+
+    def daily_sales_counts(self):
+        weights = []
+        for offset in range(self.days):
+            day = self.start_day + timedelta(days=offset)
+            weights.append(
+                WEEKDAY_WEIGHTS[day.weekday()]
+                * MONTH_WEIGHTS[day.month - 1]
+                * self.rng.uniform(0.85, 1.15)
+            )
+        scale = self.args.sales / sum(weights)
+        counts = [int(w * scale) for w in weights]
+        # Hand out the rounding remainder so the total is exact
+        for offset in sorted(range(self.days), key=lambda i: weights[i], reverse=True)[
+            : self.args.sales - sum(counts)
+        ]:
+            counts[offset] += 1
+        return counts
+
+    def sale_item(self, product):
+        category = product["_category"]
+        price = product["selling_price"]
+        if product["sale_unit"] == "pieces":
+            quantity_pieces = self.rng.randint(1, 4)
+            quantity_kg = 0
+            total = round(price * quantity_pieces, 2)
+        elif product["sale_unit"] == "package":
+            quantity_pieces = None
+            quantity_kg = round(product["package_weight_kg"] * self.rng.randint(1, 3), 3)
+            total = round(price * quantity_kg, 2)
+        else:
+            quantity_pieces = None
+            quantity_kg = round(self.rng.choice([0.25, 0.5, 0.75, 1, 1, 1.5, 2, 3]), 2)
+            total = round(price * quantity_kg, 2)
+
+        cogs = self.consume(category, weight_kg=quantity_kg, pieces=quantity_pieces or 0)
+        return {
+            "derived_product_id": product["id"],
+            "derived_product_name": product["name"],
+            "main_category_id": category["id"],
+            "main_category_name": category["name"],
+            "quantity_kg": quantity_kg,
+            "quantity_pieces": quantity_pieces,
+            "selling_price": price,
+            "total": total,
+            "cogs": round(cogs, 2),
+            "product_id": None,
+            "product_name": None,
+            "quantity": None,
+            "price_per_unit": None,
+            "unit": None,
+        }
+
+    def sale(self, day):
+        hour = self.rng.choices(list(HOUR_WEIGHTS), weights=list(HOUR_WEIGHTS.values()))[0]
+        sold_at = self.at(day, hour)
+        item_count = 1 + int(self.rng.expovariate(1 / (AVG_ITEMS_PER_SALE - 1)))
+        items = [self.sale_item(self.rng.choice(self.products)) for _ in range(min(item_count, 6))]
+        subtotal = round(sum(item["total"] for item in items), 2)
+        discount = round(subtotal * 0.05, 2) if self.rng.random() < 0.1 else 0
+        total = round(subtotal - discount, 2)
+
+        customer = self.rng.choice(self.customers) if self.rng.random() < 0.3 else None
+        if customer:
+            customer["total_purchases"] = round(customer["total_purchases"] + total, 2)
+
+        return {
+            "id": self.new_id(),
+            "customer_id": customer["id"] if customer else None,
+            "customer_name": customer["name"] if customer else None,
+            "items": items,
+            "subtotal": subtotal,
+            "tax": 0,
+            "discount": discount,
+            "total": total,
+            "payment_method": self.rng.choices(PAYMENT_METHODS, weights=PAYMENT_WEIGHTS)[0],
+            "cogs": round(sum(item["cogs"] for item in items), 2),
+            "sale_date": sold_at,
+            "created_at": sold_at,
+        }
+
+    async def simulate(self, writer):
+        opened_at = self.at(self.start_day, 6, 0, 0)
+        for category in self.categories:
+            await writer.add("main_categories", strip(category))
+        for product in self.products:
+            await writer.add("derived_products", strip(product))
+        for vendor in self.vendors:
+            await writer.add("vendors", vendor)
+        for name in EXPENSE_TYPES:
+            await writer.add(
+                "expense_types",
+                {"id": self.new_id(), "name": name, "created_at": opened_at, "updated_at": opened_at},
+            )
+
+        for offset, sales_today in enumerate(self.daily_sales_counts()):
+            day = self.start_day + timedelta(days=offset)
+            day_key = day.strftime("%Y-%m-%d")
+            expected_kg = sales_today * AVG_ITEMS_PER_SALE * AVG_KG_PER_ITEM / len(self.categories)
+
+            for category in self.categories:
+                if category["_stock_kg"] < expected_kg * 2:
+                    self.restock(category, day, expected_kg)
+
+            for _ in range(sales_today):
+                await writer.add("pos_sales", self.sale(day))
+
+            for category in self.categories:
+                if self.rng.random() < 0.6:
+                    waste_kg = round(self.rng.uniform(0.1, 1.5), 2)
+                    self.consume(category, weight_kg=waste_kg)
+                    await writer.add(
+                        "daily_waste_tracking",
+                        {
+                            "id": self.new_id(),
+                            "main_category_id": category["id"],
+                            "main_category_name": category["name"],
+                            "tracking_date": day_key,
+                            "waste_kg": waste_kg,
+                            "notes": None,
+                            "created_at": self.at(day, 22),
+                        },
+                    )
+                if category["_sells_pieces"] and self.rng.random() < 0.3:
+                    pieces_sold = self.rng.randint(1, 6)
+                    self.consume(category, pieces=pieces_sold)
+                    await writer.add(
+                        "daily_pieces_tracking",
+                        {
+                            "id": self.new_id(),
+                            "main_category_id": category["id"],
+                            "main_category_name": category["name"],
+                            "tracking_date": day_key,
+                            "pieces_sold": pieces_sold,
+                            "created_at": self.at(day, 22),
+                        },
+                    )
+                await self.flush_closed_lots(writer, category)
+
+            for _ in range(self.rng.randint(0, self.args.expenses_per_day * 2)):
+                expense_type = self.rng.choice(EXPENSE_TYPES)
+                await writer.add(
+                    "extra_expenses",
+                    {
+                        "id": self.new_id(),
+                        "expense_date": day_key,
+                        "expense_type": expense_type,
+                        "description": f"{expense_type} ({day_key})",
+                        "amount": round(self.rng.uniform(20, 1500), 2),
+                        "notes": None,
+                        "created_at": self.at(day, self.rng.randint(8, 20)),
+                    },
+                )
+
+        # Lots still holding stock and customers (with their final totals) go last
+        for category in self.categories:
+            for lot in category["_lots"]:
+                await writer.add("inventory_purchases", lot)
+        for customer in self.customers:
+            await writer.add("customers", customer)
+
+
+def strip(doc):
+    """Drop simulator-only keys (prefixed with _)"""
+    return {key: value for key, value in doc.items() if not key.startswith("_")}
+
+
+class BatchWriter:
+    """Buffers documents per collection and keeps several insert_many calls in flight"""
+
+    def __init__(self, db, batch_size, concurrency):
+        self.db = db
+        self.batch_size = batch_size
+        self.buffers = {}
+        self.counts = {}
+        self.slots = asyncio.Semaphore(concurrency)
+        self.pending = set()
+
+    async def add(self, collection, doc):
+        buffer = self.buffers.setdefault(collection, [])
+        buffer.append(doc)
+        if len(buffer) >= self.batch_size:
+            await self._submit(collection)
+
+    async def _submit(self, collection):
+        batch = self.buffers.pop(collection, [])
+        if not batch:
+            return
+        # Waiting for a free slot is the backpressure that keeps memory bounded
+        await self.slots.acquire()
+        task = asyncio.create_task(self._insert(collection, batch))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def _insert(self, collection, batch):
+        try:
+            await self.db[collection].insert_many(batch, ordered=False)
+            self.counts[collection] = self.counts.get(collection, 0) + len(batch)
+        finally:
+            self.slots.release()
+
+    async def close(self):
+        for collection in list(self.buffers):
+            await self._submit(collection)
+        if self.pending:
+            await asyncio.gather(*self.pending)
+
+
+async def seed(args):
+    load_dotenv()
+
+    mongo_url = args.mongo_url or os.environ.get("MONGO_URL")
+    db_name = args.db_name or os.environ.get("DB_NAME")
+    if not mongo_url or not db_name:
+        print("❌ Error: MONGO_URL or DB_NAME not found in environment")
+        return
+
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    try:
+        existing = [
+            name for name in await db.list_collection_names() if name in SEEDED_COLLECTIONS
+        ]
+        if existing and not args.reset:
+            print(f"❌ Database '{db_name}' already has data in: {', '.join(existing)}")
+            print("   Re-run with --reset to drop those collections first.")
+            return
+        if args.reset:
+            for name in SEEDED_COLLECTIONS + ["inventory_valuation"]:
+                await db.drop_collection(name)
+
+        simulator = Simulator(args)
+        simulator.build_catalog()
+        print(
+            f"🌱 Seeding '{db_name}': {args.sales:,} sales over {simulator.days} days "
+            f"({simulator.start_day:%Y-%m-%d} → {simulator.end_day:%Y-%m-%d}), seed {args.seed}"
+        )
+
+        started = time.perf_counter()
+        writer = BatchWriter(db, args.batch_size, args.concurrency)
+        await simulator.simulate(writer)
+        await writer.close()
+        elapsed = time.perf_counter() - started
+
+        total = sum(writer.counts.values())
+        for name in SEEDED_COLLECTIONS:
+            print(f"   {name:<24} {writer.counts.get(name, 0):>12,}")
+        print(f"\n✅ Inserted {total:,} documents in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} docs/s)")
+        print("   inventory_valuation was cleared; the server rebuilds it on startup.")
+    finally:
+        client.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Seed Bano Fresh with deterministic synthetic data")
+    parser.add_argument("--seed", type=int, default=42, help="random seed (default 42)")
+    parser.add_argument("--categories", type=int, default=6)
+    parser.add_argument("--products-per-category", type=int, default=5)
+    parser.add_argument("--vendors", type=int, default=12)
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--sales", type=int, default=200_000, help="total POS sales")
+    parser.add_argument("--expenses-per-day", type=int, default=3, help="average extra expenses per day")
+    parser.add_argument("--years", type=float, default=2, help="length of the simulated history")
+    parser.add_argument(
+        "--end-date",
+        default=datetime.now(IST).strftime("%Y-%m-%d"),
+        help="last simulated day, YYYY-MM-DD (default today; pin it for repeatable data)",
+    )
+    parser.add_argument("--batch-size", type=int, default=5000, help="documents per insert_many")
+    parser.add_argument("--concurrency", type=int, default=4, help="insert_many calls in flight")
+    parser.add_argument("--mongo-url", help="defaults to MONGO_URL")
+    parser.add_argument("--db-name", help="defaults to DB_NAME")
+    parser.add_argument("--reset", action="store_true", help="drop the seeded collections first")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(seed(parse_args()))
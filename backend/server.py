@@ -1,9 +1,11 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, status
+from pymongo import IndexModel, UpdateOne
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+import contextvars
 import os
 import logging
 from pathlib import Path
@@ -16,6 +18,25 @@ import bcrypt
 import jwt
 from passlib.context import CryptContext
 
+import admission
+import analytics
+import archive
+import batch
+import bootstrap
+import cache
+import database
+import etag
+import events
+import metrics
+import profiler
+import query_counter
+import scheduler
+import singleflight
+import slow_queries
+import sync
+import tracing
+from cursor_utils import fetch_all
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / ".env")
 
@@ -28,34 +49,43 @@ def get_ist_now():
     return datetime.now(IST)
 
 
-# MongoDB connection
-mongo_url = os.environ["MONGO_URL"]
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ["DB_NAME"]]
+# MongoDB connection (DB_BACKEND=memory runs on the in-memory engine instead)
+client = database.create_client(
+    maxPoolSize=admission.POOL_SIZE,
+    event_listeners=[
+        metrics.MongoCommandMetrics(),
+        query_counter.QueryCountListener(),
+        slow_queries.SlowQueryListener(),
+        tracing.TraceCommandListener(),
+    ]
+)
+db = database.bind(client[database.database_name()])
 
 # Security
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
 # Custom JSON response to handle timezone-aware datetimes
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, FileResponse, StreamingResponse
 from typing import Any
 import json
 
 
 class CustomJSONResponse(JSONResponse):
     def render(self, content: Any) -> bytes:
-        return json.dumps(
-            content,
-            ensure_ascii=False,
-            allow_nan=False,
-            indent=None,
-            separators=(",", ":"),
-            default=str,  # This will call __str__ on datetime objects, preserving timezone
-        ).encode("utf-8")
+        with tracing.span("serialize", "json"):
+            return json.dumps(
+                content,
+                ensure_ascii=False,
+                allow_nan=False,
+                indent=None,
+                separators=(",", ":"),
+                default=str,  # This will call __str__ on datetime objects, preserving timezone
+            ).encode("utf-8")
 
 
 app = FastAPI(default_response_class=CustomJSONResponse)
@@ -203,6 +233,8 @@ class DashboardStats(BaseModel):
     total_purchases_month: float
     profit_today: float
     profit_month: float
+    cogs_today: float = 0.0
+    cogs_month: float = 0.0
     low_stock_items: int
     total_customers: int
     total_products: int
@@ -244,80 +276,180 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 
+# Set by /batch, so its sub-requests reuse the user it has already authenticated
+authenticated_user = contextvars.ContextVar("authenticated_user", default=None)
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
 ):
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
+    return await user_from_token(credentials.credentials)
+
+
+async def user_from_token(token: str) -> User:
+    known = authenticated_user.get()
+    if known is not None and known[0] == token:
+        return known[1]
+    with tracing.span("auth"):
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            user_id: str = payload.get("sub")
+            if user_id is None:
+                raise HTTPException(status_code=401, detail="Invalid token")
+
+            user = await cache.shared.get_or_load(
+                "users", user_id, lambda: db.users.find_one({"id": user_id}, {"_id": 0})
+            )
+            if user is None:
+                raise HTTPException(status_code=401, detail="User not found")
+            return User(**user)
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expired")
+        except Exception as e:
             raise HTTPException(status_code=401, detail="Invalid token")
 
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
-        if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        return User(**user)
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
 
-# Initialize admin user on startup
-@app.on_event("startup")
-async def create_admin_user():
+def request_token_payload(scope):
+    """Claims of the request's bearer token, None if missing or invalid (for use outside Depends)"""
+    authorization = dict(scope["headers"]).get(b"authorization", b"").decode("latin-1")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
     try:
-        # Check if admin exists
-        admin_exists = await db.users.find_one({"username": "admin-bano"}, {"_id": 0})
-        if not admin_exists:
-            # Create admin user
-            hashed_password = pwd_context.hash("India@54321")
-            admin_user = {
-                "id": str(uuid.uuid4()),
-                "username": "admin-bano",
-                "email": "admin@banofresh.com",
-                "full_name": "Bano Fresh Admin",
-                "is_admin": True,
-                "created_at": get_ist_now().isoformat(),
-            }
-            admin_user["password"] = hashed_password
-            await db.users.insert_one(admin_user)
-            logger.info("✅ Admin user created: admin-bano")
-        else:
-            logger.info("✅ Admin user already exists")
-
-        # Seed default expense types
-        default_expense_types = [
-            "Tea",
-            "Coffee",
-            "Staff Food",
-            "Petrol",
-            "Transport",
-            "Electricity",
-            "Water",
-            "Gas",
-            "Maintenance",
-            "Cleaning",
-            "Stationery",
-            "Repairs",
-            "Miscellaneous"
-        ]
-
-        seeded_count = 0
-        for type_name in default_expense_types:
-            existing = await db.expense_types.find_one({"name": type_name}, {"_id": 0})
-            if not existing:
-                new_type = ExpenseType(name=type_name)
-                await db.expense_types.insert_one(new_type.dict())
-                seeded_count += 1
-
-        if seeded_count > 0:
-            logger.info(f"✅ Seeded {seeded_count} default expense types")
-        else:
-            logger.info("✅ Default expense types already exist")
-    except Exception as e:
-        logger.error(f"Error during startup: {e}")
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        return None
+
+
+# ========== BOOTSTRAP ==========
+# Startup work runs as a background pipeline; /api/ready turns 200 once it is done
+startup = bootstrap.Bootstrap()
+
+# Connections opened up front, so the first requests don't pay the handshakes
+WARM_CONNECTIONS = int(os.environ.get("BOOTSTRAP_WARM_CONNECTIONS", "4"))
+
+# Lookups by id / name, report date ranges, per-category tracking and delta sync
+INDEXES = {
+    "users": [IndexModel("id"), IndexModel("username")],
+    "expense_types": [IndexModel("id"), IndexModel("name", unique=True)],
+    "main_categories": [IndexModel("id"), IndexModel("sync_version")],
+    "derived_products": [IndexModel("id"), IndexModel("main_category_id"), IndexModel("sync_version")],
+    "products": [IndexModel("id")],
+    "vendors": [IndexModel("id")],
+    "customers": [IndexModel("id")],
+    "sales": [IndexModel("id")],
+    "purchases": [IndexModel("id")],
+    "pos_sales": [IndexModel("id"), IndexModel("sale_date"), IndexModel("sync_version")],
+    "inventory_purchases": [
+        IndexModel("id"),
+        IndexModel([("main_category_id", 1), ("purchase_date", 1)]),
+        IndexModel("purchase_date"),
+        IndexModel("sync_version"),
+    ],
+    "extra_expenses": [IndexModel("id"), IndexModel("expense_date")],
+    "daily_pieces_tracking": [
+        IndexModel("id"),
+        IndexModel([("main_category_id", 1), ("tracking_date", 1)]),
+    ],
+    "daily_waste_tracking": [
+        IndexModel("id"),
+        IndexModel([("main_category_id", 1), ("tracking_date", 1)]),
+    ],
+    sync.TOMBSTONES: [
+        IndexModel("sync_version"),
+        IndexModel("deleted_at", expireAfterSeconds=sync.TOMBSTONE_DAYS * 86400),
+    ],
+    events.COLLECTION: [IndexModel("created_at", expireAfterSeconds=events.RETENTION_SECONDS)],
+    events.PRESENCE: [IndexModel("expires_at", expireAfterSeconds=0)],
+    scheduler.RUNS: [
+        IndexModel([("job", 1), ("started_at", -1)]),
+        IndexModel("started_at", expireAfterSeconds=scheduler.HISTORY_DAYS * 86400),
+    ],
+    "daily_rollups": [IndexModel("date", unique=True)],
+    archive.INDEX: [IndexModel([("collection", 1), ("month", 1)])],
+    "inventory_snapshots": [IndexModel([("date", 1), ("main_category_id", 1)], unique=True)],
+}
+
+DEFAULT_EXPENSE_TYPES = [
+    "Tea",
+    "Coffee",
+    "Staff Food",
+    "Petrol",
+    "Transport",
+    "Electricity",
+    "Water",
+    "Gas",
+    "Maintenance",
+    "Cleaning",
+    "Stationery",
+    "Repairs",
+    "Miscellaneous"
+]
+
+
+@startup.step("connect", required=True)
+async def warm_connection_pool():
+    # Concurrent pings make the driver open several pooled connections at once
+    await asyncio.gather(*(db.command("ping") for _ in range(max(WARM_CONNECTIONS, 1))))
+    return {"connections": max(WARM_CONNECTIONS, 1)}
+
+
+@startup.step("cache")
+async def start_cache():
+    await cache.shared.start(db)
+
+
+@startup.step("indexes")
+async def ensure_indexes():
+    failed = []
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except Exception as e:
+            # e.g. duplicate expense type names (run cleanup_duplicates.py)
+            logger.error(f"Error creating indexes on {collection}: {e}")
+            failed.append(collection)
+    if failed:
+        raise RuntimeError(f"index build failed for {', '.join(failed)}")
+    return {"collections": len(INDEXES)}
+
+
+@startup.step("seed", required=True)
+async def seed_defaults():
+    # Check if admin exists
+    admin_exists = await db.users.find_one({"username": "admin-bano"}, {"_id": 0})
+    if not admin_exists:
+        # Create admin user
+        hashed_password = pwd_context.hash("India@54321")
+        admin_user = {
+            "id": str(uuid.uuid4()),
+            "username": "admin-bano",
+            "email": "admin@banofresh.com",
+            "full_name": "Bano Fresh Admin",
+            "is_admin": True,
+            "created_at": get_ist_now().isoformat(),
+        }
+        admin_user["password"] = hashed_password
+        await db.users.insert_one(admin_user)
+        logger.info("✅ Admin user created: admin-bano")
+
+    # Seed default expense types: one round trip, and the unique name index
+    # keeps workers starting together from inserting the same type twice
+    result = await db.expense_types.bulk_write(
+        [
+            UpdateOne(
+                {"name": type_name},
+                {"$setOnInsert": ExpenseType(name=type_name).model_dump()},
+                upsert=True,
+            )
+            for type_name in DEFAULT_EXPENSE_TYPES
+        ],
+        ordered=False,
+    )
+    if result.upserted_count > 0:
+        await cache.shared.bump("expense_types")
+        logger.info(f"✅ Seeded {result.upserted_count} default expense types")
+    return {"admin_created": not admin_exists, "expense_types_seeded": result.upserted_count}
 
 
 @api_router.post("/auth/login", response_model=TokenResponse)
@@ -326,7 +458,9 @@ async def login(user_input: UserLogin):
     if not user_doc:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    if not pwd_context.verify(user_input.password, user_doc["password"]):
+    with tracing.span("auth", "bcrypt"):
+        password_ok = pwd_context.verify(user_input.password, user_doc["password"])
+    if not password_ok:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     user = User(**{k: v for k, v in user_doc.items() if k != "password"})
@@ -518,6 +652,7 @@ class POSSaleItemNew(BaseModel):
     quantity_pieces: Optional[int] = None  # Number of pieces (for pieces unit)
     selling_price: Optional[float] = 0
     total: float = 0
+    cogs: Optional[float] = None  # FIFO cost of goods sold, captured at sale time
     # Old schema fields for backward compatibility
     product_id: Optional[str] = None
     product_name: Optional[str] = None
@@ -549,6 +684,7 @@ class POSSaleNew(BaseModel):
     discount: float
     total: float
     payment_method: str
+    cogs: Optional[float] = None  # Sum of item COGS, captured at sale time
     sale_date: datetime = Field(default_factory=get_ist_now)
     created_at: datetime = Field(default_factory=get_ist_now)
 
@@ -573,6 +709,32 @@ class InventorySummary(BaseModel):
     week_waste_percentage: float = 0.0
 
 
+class InventoryValuation(BaseModel):
+    main_category_id: str
+    main_category_name: str
+    remaining_weight_kg: float
+    remaining_value: float
+    weighted_avg_cost_per_kg: float
+
+
+class SlowQuerySettingsUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    threshold_ms: Optional[float] = Field(default=None, ge=0)
+    explain_sample_rate: Optional[float] = Field(default=None, ge=0, le=1)
+    explain_interval_seconds: Optional[float] = Field(default=None, ge=0)
+
+
+class BatchItem(BaseModel):
+    id: Optional[str] = None  # echoed back, for matching results to requests
+    method: str = "GET"
+    path: str  # e.g. "/api/dashboard/stats"
+    query: Optional[dict] = None
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+
+
 @api_router.post("/users", response_model=User)
 async def create_user(
     user_input: UserCreate, current_user: User = Depends(get_current_user)
@@ -606,6 +768,7 @@ async def create_user(
     user_doc["created_at"] = user_doc["created_at"].isoformat()
 
     await db.users.insert_one(user_doc)
+    await cache.shared.bump("users")
     return user
 
 
@@ -616,7 +779,7 @@ async def get_users(current_user: User = Depends(get_current_user)):
     if not user_doc.get("is_admin", False):
         raise HTTPException(status_code=403, detail="Only admin can view users")
 
-    users = await db.users.find({}, {"_id": 0, "password": 0}).to_list(1000)
+    users = await fetch_all(db.users.find({}, {"_id": 0, "password": 0}))
     for u in users:
         if isinstance(u.get("created_at"), str):
             u["created_at"] = datetime.fromisoformat(u["created_at"])
@@ -638,11 +801,22 @@ async def delete_user(user_id: str, current_user: User = Depends(get_current_use
     result = await db.users.delete_one({"id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    await cache.shared.bump("users")
     return {"message": "User deleted successfully"}
 
 
 # ========== PRODUCTS ==========
 
+# Products at or below their reorder level (missing fields count as 0)
+LOW_STOCK_PRODUCT_QUERY = {
+    "$expr": {
+        "$lte": [
+            {"$ifNull": ["$stock_quantity", 0]},
+            {"$ifNull": ["$reorder_level", 0]},
+        ]
+    }
+}
+
 
 @api_router.post("/products", response_model=Product)
 async def create_product(
@@ -658,7 +832,7 @@ async def create_product(
 
 @api_router.get("/products", response_model=List[Product])
 async def get_products(current_user: User = Depends(get_current_user)):
-    products = await db.products.find({}, {"_id": 0}).to_list(1000)
+    products = await fetch_all(db.products.find({}, {"_id": 0}))
     for p in products:
         if isinstance(p.get("created_at"), str):
             p["created_at"] = datetime.fromisoformat(p["created_at"])
@@ -714,15 +888,14 @@ async def delete_product(
 
 @api_router.get("/products/low-stock/alert", response_model=List[Product])
 async def get_low_stock_products(current_user: User = Depends(get_current_user)):
-    products = await db.products.find({}, {"_id": 0}).to_list(1000)
+    products = await fetch_all(db.products.find(LOW_STOCK_PRODUCT_QUERY, {"_id": 0}))
     low_stock = []
     for p in products:
-        if p["stock_quantity"] <= p["reorder_level"]:
-            if isinstance(p.get("created_at"), str):
-                p["created_at"] = datetime.fromisoformat(p["created_at"])
-            if isinstance(p.get("updated_at"), str):
-                p["updated_at"] = datetime.fromisoformat(p["updated_at"])
-            low_stock.append(Product(**p))
+        if isinstance(p.get("created_at"), str):
+            p["created_at"] = datetime.fromisoformat(p["created_at"])
+        if isinstance(p.get("updated_at"), str):
+            p["updated_at"] = datetime.fromisoformat(p["updated_at"])
+        low_stock.append(Product(**p))
     return low_stock
 
 
@@ -737,12 +910,13 @@ async def create_vendor(
     doc = vendor.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
     await db.vendors.insert_one(doc)
+    await cache.shared.bump("vendors")
     return vendor
 
 
 @api_router.get("/vendors", response_model=List[Vendor])
 async def get_vendors(current_user: User = Depends(get_current_user)):
-    vendors = await db.vendors.find({}, {"_id": 0}).to_list(1000)
+    vendors = await fetch_all(db.vendors.find({}, {"_id": 0}))
     for v in vendors:
         if isinstance(v.get("created_at"), str):
             v["created_at"] = datetime.fromisoformat(v["created_at"])
@@ -760,6 +934,7 @@ async def update_vendor(
         raise HTTPException(status_code=404, detail="Vendor not found")
 
     await db.vendors.update_one({"id": vendor_id}, {"$set": vendor_input.model_dump()})
+    await cache.shared.bump("vendors")
     updated = await db.vendors.find_one({"id": vendor_id}, {"_id": 0})
     if isinstance(updated.get("created_at"), str):
         updated["created_at"] = datetime.fromisoformat(updated["created_at"])
@@ -771,6 +946,7 @@ async def delete_vendor(vendor_id: str, current_user: User = Depends(get_current
     result = await db.vendors.delete_one({"id": vendor_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Vendor not found")
+    await cache.shared.bump("vendors")
     return {"message": "Vendor deleted successfully"}
 
 
@@ -785,12 +961,13 @@ async def create_customer(
     doc = customer.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
     await db.customers.insert_one(doc)
+    await cache.shared.bump("customers")
     return customer
 
 
 @api_router.get("/customers", response_model=List[Customer])
 async def get_customers(current_user: User = Depends(get_current_user)):
-    customers = await db.customers.find({}, {"_id": 0}).to_list(1000)
+    customers = await fetch_all(db.customers.find({}, {"_id": 0}))
     for c in customers:
         if isinstance(c.get("created_at"), str):
             c["created_at"] = datetime.fromisoformat(c["created_at"])
@@ -810,6 +987,7 @@ async def update_customer(
     await db.customers.update_one(
         {"id": customer_id}, {"$set": customer_input.model_dump()}
     )
+    await cache.shared.bump("customers")
     updated = await db.customers.find_one({"id": customer_id}, {"_id": 0})
     if isinstance(updated.get("created_at"), str):
         updated["created_at"] = datetime.fromisoformat(updated["created_at"])
@@ -823,6 +1001,7 @@ async def delete_customer(
     result = await db.customers.delete_one({"id": customer_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Customer not found")
+    await cache.shared.bump("customers")
     return {"message": "Customer deleted successfully"}
 
 
@@ -852,6 +1031,7 @@ async def create_sale(
             await db.customers.update_one(
                 {"id": sale_input.customer_id}, {"$set": {"total_purchases": new_total}}
             )
+            await cache.shared.bump("customers")
 
     sale_data = sale_input.model_dump()
 
@@ -876,7 +1056,7 @@ async def create_sale(
 
 @api_router.get("/sales", response_model=List[Sale])
 async def get_sales(current_user: User = Depends(get_current_user)):
-    sales = await db.sales.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    sales = await fetch_all(db.sales.find({}, {"_id": 0}).sort("created_at", -1))
     for s in sales:
         if isinstance(s.get("created_at"), str):
             s["created_at"] = datetime.fromisoformat(s["created_at"])
@@ -951,6 +1131,8 @@ async def update_sale(sale_id: str, sale_input: SaleCreate, current_user: User =
             {"id": sale_input.customer_id},
             {"$inc": {"total_purchases": sale_input.total}}
         )
+    if existing_sale.get('customer_id') or sale_input.customer_id:
+        await cache.shared.bump("customers")
     
     created_at = datetime.now()
     if hasattr(sale_input, 'sale_date') and sale_input.sale_date:
@@ -984,8 +1166,14 @@ async def update_sale(sale_id: str, sale_input: SaleCreate, current_user: User =
 
 # ========== DASHBOARD ==========
 
+# Dashboard, inventory summary and stock alerts are requested by every screen at once at shift start.
+# Identical requests share one computation, and its result is reused for this many seconds
+# unless a write bumps the stock (or customers) generation first.
+AGGREGATE_CACHE_SECONDS = float(os.environ.get("AGGREGATE_CACHE_SECONDS", "2"))
+
 
 @api_router.get("/dashboard/stats", response_model=DashboardStats)
+@singleflight.coalesce(ttl=AGGREGATE_CACHE_SECONDS, namespaces=("stock", "customers"))
 async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
     try:
         # Date ranges for filtering
@@ -994,82 +1182,45 @@ async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
             day=1, hour=0, minute=0, second=0, microsecond=0
         )
 
-        # Fetch all POS sales (not legacy 'sales' collection)
-        all_sales = await db.pos_sales.find({}, {"_id": 0}).to_list(10000)
-
-        # Calculate today's and month's sales
-        total_sales_today = 0
-        total_sales_month = 0
+        today_key = today_start.strftime("%Y-%m-%d")
+        month_key = month_start.strftime("%Y-%m-%d")
 
-        for s in all_sales:
-            try:
-                # POS sales use 'sale_date' field
-                sale_date_value = s.get("sale_date")
-                if not sale_date_value:
-                    continue
-
-                # Handle both string and datetime types
-                if isinstance(sale_date_value, str):
-                    sale_date = datetime.fromisoformat(sale_date_value)
-                elif isinstance(sale_date_value, datetime):
-                    sale_date = sale_date_value
-                else:
-                    continue
-
-                # Ensure timezone-aware comparison
-                if sale_date.tzinfo is None:
-                    sale_date = IST.localize(sale_date)
-
-                if sale_date >= today_start:
-                    total_sales_today += s.get("total", 0)
-                if sale_date >= month_start:
-                    total_sales_month += s.get("total", 0)
-            except Exception as e:
-                logging.warning(f"Error processing sale date: {e}")
-                continue
-
-        # Fetch all inventory purchases (not legacy 'purchases' collection)
-        all_purchases = await db.inventory_purchases.find({}, {"_id": 0}).to_list(10000)
-
-        # Calculate today's and month's purchases
-        total_purchases_today = 0
-        total_purchases_month = 0
-
-        for p in all_purchases:
-            try:
-                # Handle both 'purchase_date' field
-                purchase_date_str = p.get("purchase_date")
-                if not purchase_date_str:
-                    continue
-
-                if isinstance(purchase_date_str, str):
-                    purchase_date = datetime.fromisoformat(purchase_date_str)
-                elif isinstance(purchase_date_str, datetime):
-                    purchase_date = purchase_date_str
-                else:
-                    continue
-
-                # Ensure timezone-aware comparison
-                if purchase_date.tzinfo is None:
-                    purchase_date = IST.localize(purchase_date)
-
-                if purchase_date >= today_start:
-                    total_purchases_today += p.get("total_cost", 0)
-                if purchase_date >= month_start:
-                    total_purchases_month += p.get("total_cost", 0)
-            except Exception as e:
-                logging.warning(f"Error processing purchase date: {e}")
-                continue
+        # Month-to-date POS sales (not legacy 'sales' collection), only the columns we sum
+        month_sales = await analytics.fetch_columns(
+            db.pos_sales,
+            analytics.date_range_query("sale_date", month_key),
+            ["sale_date", "total", "cogs"],
+        )
+        sales_today = analytics.totals_since(
+            month_sales, "sale_date", ["total", "cogs"], today_key
+        )
+        sales_month = analytics.totals_since(
+            month_sales, "sale_date", ["total", "cogs"], month_key
+        )
+        total_sales_today = sales_today["total"]
+        total_sales_month = sales_month["total"]
+        cogs_today = sales_today["cogs"]
+        cogs_month = sales_month["cogs"]
+
+        # Month-to-date inventory purchases (not legacy 'purchases' collection)
+        month_purchases = await analytics.fetch_columns(
+            db.inventory_purchases,
+            analytics.date_range_query("purchase_date", month_key),
+            ["purchase_date", "total_cost"],
+        )
+        total_purchases_today = analytics.totals_since(
+            month_purchases, "purchase_date", ["total_cost"], today_key
+        )["total_cost"]
+        total_purchases_month = analytics.totals_since(
+            month_purchases, "purchase_date", ["total_cost"], month_key
+        )["total_cost"]
 
-        # Calculate profit (Sales - Purchase Cost)
-        profit_today = total_sales_today - total_purchases_today
-        profit_month = total_sales_month - total_purchases_month
+        # Calculate profit (Sales - FIFO cost of the goods actually sold)
+        profit_today = total_sales_today - cogs_today
+        profit_month = total_sales_month - cogs_month
 
-        # Low stock items
-        products = await db.products.find({}, {"_id": 0}).to_list(1000)
-        low_stock_count = sum(
-            1 for p in products if p.get("stock_quantity", 0) <= p.get("reorder_level", 0)
-        )
+        # Low stock items (counted by Mongo, no documents loaded)
+        low_stock_count = await db.products.count_documents(LOW_STOCK_PRODUCT_QUERY)
 
         # Counts
         total_customers = await db.customers.count_documents({})
@@ -1117,6 +1268,8 @@ async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
             total_purchases_month=total_purchases_month,
             profit_today=profit_today,
             profit_month=profit_month,
+            cogs_today=round(cogs_today, 2),
+            cogs_month=round(cogs_month, 2),
             low_stock_items=low_stock_count,
             total_customers=total_customers,
             total_products=total_products,
@@ -1188,7 +1341,7 @@ async def create_purchase(
 @api_router.get("/purchases", response_model=List[Purchase])
 async def get_purchases(current_user: User = Depends(get_current_user)):
     purchases = (
-        await db.purchases.find({}, {"_id": 0}).sort("purchase_date", -1).to_list(1000)
+        await fetch_all(db.purchases.find({}, {"_id": 0}).sort("purchase_date", -1))
     )
     for p in purchases:
         if isinstance(p.get("purchase_date"), str):
@@ -1265,16 +1418,35 @@ async def delete_purchase(
 
 # ========== REPORTS ==========
 
-from fastapi.responses import StreamingResponse
-from io import BytesIO
-import csv
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.units import inch
+from fastapi.responses import Response
+
+REPORT_FORMATS = ("csv", "excel", "pdf")
+
+
+async def render_report(report: str, filename: str, format: str, data):
+    """File download of a report, rendered by the report_renderers module in a worker thread"""
+    with tracing.span("render", format):
+        # Imported on the first export, so workers that never export don't load openpyxl / reportlab
+        import report_renderers
+
+        # Excel and PDF rendering is CPU-bound; off the event loop, other requests keep being served
+        content = await asyncio.to_thread(getattr(report_renderers, f"{report}_{format}"), data)
+    return Response(
+        content,
+        media_type=report_renderers.MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}.{report_renderers.EXTENSIONS[format]}"
+        },
+    )
+
+
+def archived_columns(start_date=None, end_date=None):
+    """Column fetch for analytics that also reads the archived months of the range"""
+
+    async def fetch(collection, query, fields):
+        return await archive.fetch_columns(db, collection, query, fields, start_date, end_date)
+
+    return fetch
 
 
 @api_router.get("/reports/sales")
@@ -1302,164 +1474,11 @@ async def get_sales_report(
             date_filter["$lte"] = end_date[:10] + "T99:99:99"
         query["sale_date"] = date_filter
 
-    # Fetch sales from pos_sales collection with filtering and sorting
-    sales = await db.pos_sales.find(query, {"_id": 0}).sort("sale_date", -1).to_list(10000)
-
-    if format == "csv":
-        output = BytesIO()
-        writer = csv.writer(output)
-        writer.writerow(
-            [
-                "Date",
-                "Customer",
-                "Items",
-                "Subtotal",
-                "Tax",
-                "Discount",
-                "Total",
-                "Payment Method",
-            ]
-        )
-        if not sales:
-            writer.writerow(["No records found for the selected date range", "", "", "", "", "", "", ""])
-        for sale in sales:
-            sale_date = sale.get("sale_date") or sale.get("created_at", "")
-            writer.writerow(
-                [
-                    sale_date,
-                    sale.get("customer_name", "Walk-in"),
-                    len(sale.get("items", [])),
-                    sale.get("subtotal", 0),
-                    sale.get("tax", 0),
-                    sale.get("discount", 0),
-                    sale.get("total", 0),
-                    sale.get("payment_method", ""),
-                ]
-            )
-        output.seek(0)
-        return StreamingResponse(
-            output,
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=sales_report.csv"},
-        )
-
-    elif format == "excel":
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Sales Report"
-
-        # Headers
-        headers = [
-            "Date",
-            "Customer",
-            "Items",
-            "Subtotal",
-            "Tax",
-            "Discount",
-            "Total",
-            "Payment Method",
-        ]
-        ws.append(headers)
-
-        # Style headers
-        for cell in ws[1]:
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(
-                start_color="0066CC", end_color="0066CC", fill_type="solid"
-            )
-            cell.alignment = Alignment(horizontal="center")
-
-        # Data
-        if not sales:
-            ws.append(["No records found for the selected date range", "", "", "", "", "", "", ""])
-        for sale in sales:
-            sale_date = sale.get("sale_date") or sale.get("created_at", "")
-            ws.append(
-                [
-                    sale_date,
-                    sale.get("customer_name", "Walk-in"),
-                    len(sale.get("items", [])),
-                    sale.get("subtotal", 0),
-                    sale.get("tax", 0),
-                    sale.get("discount", 0),
-                    sale.get("total", 0),
-                    sale.get("payment_method", ""),
-                ]
-            )
-
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": "attachment; filename=sales_report.xlsx"},
-        )
-
-    elif format == "pdf":
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        elements = []
-
-        styles = getSampleStyleSheet()
-        title = Paragraph("<b>Sales Report</b>", styles["Title"])
-        elements.append(title)
-        elements.append(Spacer(1, 0.3 * inch))
-
-        if not sales:
-            no_data_msg = Paragraph("No records found for the selected date range.", styles["Normal"])
-            elements.append(no_data_msg)
-        else:
-            data = [
-                [
-                    "Date",
-                    "Customer",
-                    "Items",
-                    "Subtotal",
-                    "Tax",
-                    "Discount",
-                    "Total",
-                    "Payment",
-                ]
-            ]
-            for sale in sales:
-                sale_date = sale.get("sale_date") or sale.get("created_at", "")
-                data.append(
-                    [
-                        sale_date[:10] if sale_date else "",
-                        sale.get("customer_name", "Walk-in")[:15],
-                        str(len(sale.get("items", []))),
-                        f"Rs {sale.get('subtotal', 0):.2f}",
-                        f"Rs {sale.get('tax', 0):.2f}",
-                        f"Rs {sale.get('discount', 0):.2f}",
-                        f"Rs {sale.get('total', 0):.2f}",
-                        sale.get("payment_method", ""),
-                    ]
-                )
-
-            table = Table(data)
-            table.setStyle(
-                TableStyle(
-                    [
-                        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#0066CC")),
-                        ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-                        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                        ("FONTSIZE", (0, 0), (-1, 0), 10),
-                        ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-                        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-                    ]
-                )
-            )
-            elements.append(table)
+    # Fetch sales with filtering and sorting (archived months included)
+    sales = await archive.find_all(db, "pos_sales", query, start_date, end_date, sort_field="sale_date")
 
-        doc.build(elements)
-        buffer.seek(0)
-        return StreamingResponse(
-            buffer,
-            media_type="application/pdf",
-            headers={"Content-Disposition": "attachment; filename=sales_report.pdf"},
-        )
+    if format in REPORT_FORMATS:
+        return await render_report("sales", "sales_report", format, sales)
 
     else:  # json
         return {
@@ -1473,170 +1492,10 @@ async def get_sales_report(
 async def get_inventory_report(
     format: str = "json", current_user: User = Depends(get_current_user)
 ):
-    products = await db.products.find({}, {"_id": 0}).to_list(1000)
-
-    if format == "csv":
-        output = BytesIO()
-        writer = csv.writer(output)
-        writer.writerow(
-            [
-                "Name",
-                "Category",
-                "Type",
-                "Stock",
-                "Unit",
-                "Reorder Level",
-                "Price",
-                "Purchase Cost",
-                "Status",
-            ]
-        )
-        for product in products:
-            status = (
-                "Low Stock"
-                if product["stock_quantity"] <= product["reorder_level"]
-                else "In Stock"
-            )
-            ptype = (
-                "Raw Material"
-                if product.get("is_raw_material", False)
-                else "Derived Product"
-            )
-            writer.writerow(
-                [
-                    product["name"],
-                    product["category"],
-                    ptype,
-                    product["stock_quantity"],
-                    product["unit"],
-                    product["reorder_level"],
-                    product["price_per_unit"],
-                    product.get("purchase_cost", 0),
-                    status,
-                ]
-            )
-        output.seek(0)
-        return StreamingResponse(
-            output,
-            media_type="text/csv",
-            headers={
-                "Content-Disposition": "attachment; filename=inventory_report.csv"
-            },
-        )
-
-    elif format == "excel":
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Inventory Report"
-
-        headers = [
-            "Name",
-            "Category",
-            "Type",
-            "Stock",
-            "Unit",
-            "Reorder Level",
-            "Price",
-            "Purchase Cost",
-            "Status",
-        ]
-        ws.append(headers)
-
-        for cell in ws[1]:
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(
-                start_color="008000", end_color="008000", fill_type="solid"
-            )
-            cell.alignment = Alignment(horizontal="center")
-
-        for product in products:
-            status = (
-                "Low Stock"
-                if product["stock_quantity"] <= product["reorder_level"]
-                else "In Stock"
-            )
-            ptype = (
-                "Raw Material"
-                if product.get("is_raw_material", False)
-                else "Derived Product"
-            )
-            ws.append(
-                [
-                    product["name"],
-                    product["category"],
-                    ptype,
-                    product["stock_quantity"],
-                    product["unit"],
-                    product["reorder_level"],
-                    product["price_per_unit"],
-                    product.get("purchase_cost", 0),
-                    status,
-                ]
-            )
-
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={
-                "Content-Disposition": "attachment; filename=inventory_report.xlsx"
-            },
-        )
-
-    elif format == "pdf":
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        elements = []
-
-        styles = getSampleStyleSheet()
-        title = Paragraph("<b>Inventory Report</b>", styles["Title"])
-        elements.append(title)
-        elements.append(Spacer(1, 0.3 * inch))
-
-        data = [["Name", "Category", "Type", "Stock", "Unit", "Price", "Status"]]
-        for product in products:
-            status = (
-                "Low" if product["stock_quantity"] <= product["reorder_level"] else "OK"
-            )
-            ptype = "Raw" if product.get("is_raw_material", False) else "Derived"
-            data.append(
-                [
-                    product["name"][:20],
-                    product["category"][:10],
-                    ptype,
-                    str(product["stock_quantity"]),
-                    product["unit"],
-                    f"Rs {product['price_per_unit']:.0f}",
-                    status,
-                ]
-            )
-
-        table = Table(data)
-        table.setStyle(
-            TableStyle(
-                [
-                    ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#008000")),
-                    ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-                    ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                    ("FONTSIZE", (0, 0), (-1, 0), 9),
-                    ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-                ]
-            )
-        )
-        elements.append(table)
+    products = await fetch_all(db.products.find({}, {"_id": 0}))
 
-        doc.build(elements)
-        buffer.seek(0)
-        return StreamingResponse(
-            buffer,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": "attachment; filename=inventory_report.pdf"
-            },
-        )
+    if format in REPORT_FORMATS:
+        return await render_report("inventory", "inventory_report", format, products)
 
     else:
         low_stock = [p for p in products if p["stock_quantity"] <= p["reorder_level"]]
@@ -1678,146 +1537,13 @@ async def get_purchase_report(
             date_filter["$lte"] = end_date
         query["purchase_date"] = date_filter
 
-    # Fetch purchases from inventory_purchases collection with filters
-    purchases = await db.inventory_purchases.find(query, {"_id": 0}).sort("purchase_date", -1).to_list(10000)
-
-    if format == "csv":
-        output = BytesIO()
-        writer = csv.writer(output)
-        writer.writerow(
-            [
-                "Date",
-                "Category",
-                "Vendor",
-                "Weight (kg)",
-                "Pieces",
-                "Cost/kg",
-                "Total Cost",
-            ]
-        )
-        if not purchases:
-            writer.writerow(["No records found for the selected date range", "", "", "", "", "", ""])
-        for purchase in purchases:
-            writer.writerow(
-                [
-                    purchase.get("purchase_date", ""),
-                    purchase.get("main_category_name", ""),
-                    purchase.get("vendor_name", ""),
-                    purchase.get("total_weight_kg", 0),
-                    purchase.get("total_pieces", 0),
-                    purchase.get("cost_per_kg", 0),
-                    purchase.get("total_cost", 0),
-                ]
-            )
-        output.seek(0)
-        return StreamingResponse(
-            output,
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=purchase_report.csv"},
-        )
-
-    elif format == "excel":
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Purchase Report"
-
-        headers = [
-            "Date",
-            "Category",
-            "Vendor",
-            "Weight (kg)",
-            "Pieces",
-            "Cost/kg",
-            "Total Cost",
-        ]
-        ws.append(headers)
-
-        for cell in ws[1]:
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(
-                start_color="FF6600", end_color="FF6600", fill_type="solid"
-            )
-            cell.alignment = Alignment(horizontal="center")
-
-        if not purchases:
-            ws.append(["No records found for the selected date range", "", "", "", "", "", ""])
-        for purchase in purchases:
-            ws.append(
-                [
-                    purchase.get("purchase_date", ""),
-                    purchase.get("main_category_name", ""),
-                    purchase.get("vendor_name", ""),
-                    purchase.get("total_weight_kg", 0),
-                    purchase.get("total_pieces", 0),
-                    purchase.get("cost_per_kg", 0),
-                    purchase.get("total_cost", 0),
-                ]
-            )
-
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={
-                "Content-Disposition": "attachment; filename=purchase_report.xlsx"
-            },
-        )
-
-    elif format == "pdf":
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        elements = []
-
-        styles = getSampleStyleSheet()
-        title = Paragraph("<b>Purchase Report</b>", styles["Title"])
-        elements.append(title)
-        elements.append(Spacer(1, 0.3 * inch))
-
-        if not purchases:
-            no_data_msg = Paragraph("No records found for the selected date range.", styles["Normal"])
-            elements.append(no_data_msg)
-        else:
-            data = [
-                ["Date", "Category", "Vendor", "Weight", "Pieces", "Cost/kg", "Total"]
-            ]
-            for purchase in purchases:
-                purchase_date = purchase.get("purchase_date", "")
-                data.append(
-                    [
-                        purchase_date[:10] if purchase_date else "",
-                        purchase.get("main_category_name", "")[:15],
-                        purchase.get("vendor_name", "")[:15],
-                        f"{purchase.get('total_weight_kg', 0):.2f}",
-                        str(purchase.get("total_pieces", 0)),
-                        f"Rs {purchase.get('cost_per_kg', 0):.2f}",
-                        f"Rs {purchase.get('total_cost', 0):.2f}",
-                    ]
-                )
-
-            table = Table(data)
-            table.setStyle(
-                TableStyle(
-                    [
-                        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#FF6600")),
-                        ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-                        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                        ("FONTSIZE", (0, 0), (-1, 0), 9),
-                        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-                    ]
-                )
-            )
-            elements.append(table)
+    # Fetch purchases with filters (archived months included)
+    purchases = await archive.find_all(
+        db, "inventory_purchases", query, start_date, end_date, sort_field="purchase_date"
+    )
 
-        doc.build(elements)
-        buffer.seek(0)
-        return StreamingResponse(
-            buffer,
-            media_type="application/pdf",
-            headers={"Content-Disposition": "attachment; filename=purchase_report.pdf"},
-        )
+    if format in REPORT_FORMATS:
+        return await render_report("purchases", "purchase_report", format, purchases)
 
     else:
         return {
@@ -1834,297 +1560,116 @@ async def get_profit_loss_report(
     format: str = "json",
     current_user: User = Depends(get_current_user),
 ):
-    # Get sales and purchases
-    sales = await db.sales.find({}, {"_id": 0}).to_list(10000)
-    purchases = await db.purchases.find({}, {"_id": 0}).to_list(10000)
-
-    # Filter by date
-    if start_date:
-        start = datetime.fromisoformat(start_date)
-        sales = [s for s in sales if datetime.fromisoformat(s["created_at"]) >= start]
-        purchases = [
-            p for p in purchases if datetime.fromisoformat(p["purchase_date"]) >= start
-        ]
-    if end_date:
-        end = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59)
-        sales = [s for s in sales if datetime.fromisoformat(s["created_at"]) <= end]
-        purchases = [
-            p for p in purchases if datetime.fromisoformat(p["purchase_date"]) <= end
-        ]
+    """
+    Profit & loss totals for a date range from POS sales and inventory purchases.
+    The date range is applied in the Mongo query (indexed sale_date / purchase_date)
+    and the totals are computed by an aggregation, so no documents are loaded here.
+    Archived months the range reaches are aggregated too.
+    """
+    sales_totals = await archive.aggregate_totals(
+        db,
+        "pos_sales",
+        analytics.date_range_query("sale_date", start_date, end_date),
+        ["total", "cogs"],
+        start_date,
+        end_date,
+    )
+    purchase_totals = await archive.aggregate_totals(
+        db,
+        "inventory_purchases",
+        analytics.date_range_query("purchase_date", start_date, end_date),
+        ["total_cost"],
+        start_date,
+        end_date,
+    )
 
-    total_revenue = sum(s["total"] for s in sales)
-    total_purchase_cost = sum(p["total_cost"] for p in purchases)
+    sales_count = sales_totals["count"]
+    purchase_count = purchase_totals["count"]
+    total_revenue = sales_totals["total"]
+    total_cogs = sales_totals["cogs"]
+    total_purchase_cost = purchase_totals["total_cost"]
+    gross_margin = total_revenue - total_cogs
     gross_profit = total_revenue - total_purchase_cost
     profit_margin = (gross_profit / total_revenue * 100) if total_revenue > 0 else 0
 
-    if format == "csv":
-        output = BytesIO()
-        writer = csv.writer(output)
-        writer.writerow(["Metric", "Amount"])
-        writer.writerow(["Total Revenue", total_revenue])
-        writer.writerow(["Total Purchase Cost", total_purchase_cost])
-        writer.writerow(["Gross Profit", gross_profit])
-        writer.writerow(["Profit Margin %", f"{profit_margin:.2f}%"])
-        writer.writerow([])
-        writer.writerow(["Sales Count", len(sales)])
-        writer.writerow(["Purchase Count", len(purchases)])
-        output.seek(0)
-        return StreamingResponse(
-            output,
-            media_type="text/csv",
-            headers={
-                "Content-Disposition": "attachment; filename=profit_loss_report.csv"
-            },
-        )
-
-    elif format == "excel":
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Profit & Loss"
-
-        ws["A1"] = "Profit & Loss Report"
-        ws["A1"].font = Font(bold=True, size=16)
-        ws.merge_cells("A1:B1")
-
-        ws.append([])
-        ws.append(["Metric", "Amount"])
-        ws["A3"].font = Font(bold=True)
-        ws["B3"].font = Font(bold=True)
-
-        ws.append(["Total Revenue", total_revenue])
-        ws.append(["Total Purchase Cost", total_purchase_cost])
-        ws.append(["Gross Profit", gross_profit])
-        ws.append(["Profit Margin %", f"{profit_margin:.2f}%"])
-        ws.append([])
-        ws.append(["Sales Count", len(sales)])
-        ws.append(["Purchase Count", len(purchases)])
-
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={
-                "Content-Disposition": "attachment; filename=profit_loss_report.xlsx"
-            },
-        )
-
-    elif format == "pdf":
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        elements = []
-
-        styles = getSampleStyleSheet()
-        title = Paragraph("<b>Profit & Loss Report</b>", styles["Title"])
-        elements.append(title)
-        elements.append(Spacer(1, 0.5 * inch))
-
-        data = [
-            ["Metric", "Amount"],
-            ["Total Revenue", f"Rs {total_revenue:.2f}"],
-            ["Total Purchase Cost", f"Rs {total_purchase_cost:.2f}"],
-            ["Gross Profit", f"Rs {gross_profit:.2f}"],
-            ["Profit Margin", f"{profit_margin:.2f}%"],
-            ["", ""],
-            ["Sales Count", str(len(sales))],
-            ["Purchase Count", str(len(purchases))],
-        ]
-
-        table = Table(data, colWidths=[3 * inch, 2 * inch])
-        table.setStyle(
-            TableStyle(
-                [
-                    ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#6600CC")),
-                    ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-                    ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-                    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                    ("FONTSIZE", (0, 0), (-1, -1), 11),
-                    ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-                    (
-                        "BACKGROUND",
-                        (0, 3),
-                        (-1, 3),
-                        (
-                            colors.HexColor("#CCFFCC")
-                            if gross_profit > 0
-                            else colors.HexColor("#FFCCCC")
-                        ),
-                    ),
-                ]
-            )
-        )
-        elements.append(table)
+    totals = {
+        "total_revenue": total_revenue,
+        "total_cogs": total_cogs,
+        "gross_margin": gross_margin,
+        "total_purchase_cost": total_purchase_cost,
+        "gross_profit": gross_profit,
+        "profit_margin": profit_margin,
+        "sales_count": sales_count,
+        "purchase_count": purchase_count,
+    }
 
-        doc.build(elements)
-        buffer.seek(0)
-        return StreamingResponse(
-            buffer,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": "attachment; filename=profit_loss_report.pdf"
-            },
-        )
+    if format in REPORT_FORMATS:
+        return await render_report("profit_loss", "profit_loss_report", format, totals)
 
     else:
-        return {
-            "total_revenue": total_revenue,
-            "total_purchase_cost": total_purchase_cost,
-            "gross_profit": gross_profit,
-            "profit_margin": profit_margin,
-            "sales_count": len(sales),
-            "purchase_count": len(purchases),
-        }
+        return totals
 
 
 @api_router.get("/reports/daily-profit-loss")
 async def get_daily_profit_loss(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    granularity: str = "day",
     current_user: User = Depends(get_current_user),
 ):
     """
-    Get daily profit and loss breakdown including:
+    Get daily (or weekly / monthly) profit and loss breakdown including:
     - POS Sales revenue
+    - FIFO cost of goods sold (stored on each sale at sale time)
     - Inventory purchase costs
     - Extra expenses
-    - Daily net profit/loss
+    - Net profit/loss per period
+    Totals are computed column-wise by the analytics module.
     """
-    from collections import defaultdict
-
-    # Build date query
-    date_query = {}
-    if start_date or end_date:
-        date_filter = {}
-        if start_date:
-            date_filter["$gte"] = start_date[:10]
-        if end_date:
-            date_filter["$lte"] = end_date[:10]
-        date_query = date_filter
-
-    # Fetch POS sales
-    sales_query = {}
-    if date_query:
-        sales_query["sale_date"] = {"$gte": start_date, "$lte": end_date} if start_date and end_date else {}
-    pos_sales = await db.pos_sales.find({}, {"_id": 0}).to_list(10000)
-
-    # Fetch inventory purchases
-    # Note: purchase_date is stored as ISO string (e.g., "2026-01-02T14:30:00+05:30")
-    purchase_query = {}
-    if date_query:
-        date_filter = {}
-        if start_date:
-            # Start of day: "2026-01-02T00:00:00"
-            date_filter["$gte"] = start_date[:10] + "T00:00:00"
-        if end_date:
-            # End of day: "2026-01-02T23:59:59"
-            date_filter["$lte"] = end_date[:10] + "T23:59:59"
-        purchase_query["purchase_date"] = date_filter
-    inventory_purchases = await db.inventory_purchases.find(purchase_query, {"_id": 0}).to_list(10000)
-
-    # Fetch extra expenses
-    expense_query = {}
-    if date_query:
-        expense_query["expense_date"] = date_query
-    extra_expenses = await db.extra_expenses.find(expense_query, {"_id": 0}).to_list(10000)
-
-    # Group by date
-    daily_data = defaultdict(lambda: {
-        "date": "",
-        "revenue": 0,
-        "purchase_cost": 0,
-        "expenses": 0,
-        "gross_profit": 0,
-        "net_profit": 0,
-        "sales_count": 0,
-        "purchase_count": 0,
-        "expense_count": 0
-    })
-
-    # Process POS sales
-    for sale in pos_sales:
-        sale_date_str = sale.get("sale_date", "")
-        if isinstance(sale_date_str, str) and len(sale_date_str) >= 10:
-            date_key = sale_date_str[:10]
-
-            # Apply date filter if specified
-            if date_query:
-                if start_date and date_key < start_date[:10]:
-                    continue
-                if end_date and date_key > end_date[:10]:
-                    continue
-
-            daily_data[date_key]["date"] = date_key
-            daily_data[date_key]["revenue"] += sale.get("total", 0)
-            daily_data[date_key]["sales_count"] += 1
-
-    # Process inventory purchases
-    for purchase in inventory_purchases:
-        purchase_date = purchase.get("purchase_date", "")
-
-        # Handle both datetime objects and strings (for backward compatibility)
-        if isinstance(purchase_date, datetime):
-            date_key = purchase_date.strftime("%Y-%m-%d")
-        elif isinstance(purchase_date, str) and len(purchase_date) >= 10:
-            date_key = purchase_date[:10]
-        else:
-            continue
+    if granularity not in analytics.GRANULARITIES:
+        raise HTTPException(
+            status_code=400, detail="granularity must be 'day', 'week', or 'month'"
+        )
 
-        # Apply date filter if specified (already filtered by MongoDB, but double-check)
-        if date_query:
-            if start_date and date_key < start_date[:10]:
-                continue
-            if end_date and date_key > end_date[:10]:
-                continue
+    breakdown = await analytics.profit_loss_breakdown(
+        db, start_date, end_date, granularity, fetch=archived_columns(start_date, end_date)
+    )
 
-        daily_data[date_key]["date"] = date_key
-        daily_data[date_key]["purchase_cost"] += purchase.get("total_cost", 0)
-        daily_data[date_key]["purchase_count"] += 1
-
-    # Process extra expenses
-    for expense in extra_expenses:
-        expense_date = expense.get("expense_date", "")
-        if expense_date:
-            # Apply date filter if specified
-            if date_query:
-                if start_date and expense_date < start_date[:10]:
-                    continue
-                if end_date and expense_date > end_date[:10]:
-                    continue
-
-            daily_data[expense_date]["date"] = expense_date
-            daily_data[expense_date]["expenses"] += expense.get("amount", 0)
-            daily_data[expense_date]["expense_count"] += 1
-
-    # Calculate profits
-    for date_key in daily_data:
-        data = daily_data[date_key]
-        data["gross_profit"] = data["revenue"] - data["purchase_cost"]
-        data["net_profit"] = data["gross_profit"] - data["expenses"]
-
-    # Convert to list and sort by date (most recent first)
-    daily_list = sorted(daily_data.values(), key=lambda x: x["date"], reverse=True)
+    daily_list = [
+        {"date": date_key, **row}
+        for date_key, row in zip(breakdown.index, breakdown.to_dict("records"))
+    ]
 
     # Calculate totals
-    total_revenue = sum(d["revenue"] for d in daily_list)
-    total_purchase_cost = sum(d["purchase_cost"] for d in daily_list)
-    total_expenses = sum(d["expenses"] for d in daily_list)
+    totals = breakdown.sum()
+    total_revenue = float(totals.get("revenue", 0))
+    total_cogs = float(totals.get("cogs", 0))
+    total_purchase_cost = float(totals.get("purchase_cost", 0))
+    total_expenses = float(totals.get("expenses", 0))
+    total_gross_margin = total_revenue - total_cogs
     total_gross_profit = total_revenue - total_purchase_cost
     total_net_profit = total_gross_profit - total_expenses
     profit_margin = (total_net_profit / total_revenue * 100) if total_revenue > 0 else 0
+    gross_margin_percentage = (
+        (total_gross_margin / total_revenue * 100) if total_revenue > 0 else 0
+    )
 
     return {
         "daily_breakdown": daily_list,
         "summary": {
             "total_revenue": round(total_revenue, 2),
+            "total_cogs": round(total_cogs, 2),
+            "total_gross_margin": round(total_gross_margin, 2),
+            "gross_margin_percentage": round(gross_margin_percentage, 2),
             "total_purchase_cost": round(total_purchase_cost, 2),
             "total_expenses": round(total_expenses, 2),
             "total_gross_profit": round(total_gross_profit, 2),
             "total_net_profit": round(total_net_profit, 2),
             "profit_margin": round(profit_margin, 2),
-            "total_sales_count": sum(d["sales_count"] for d in daily_list),
-            "total_purchase_count": sum(d["purchase_count"] for d in daily_list),
-            "total_expense_count": sum(d["expense_count"] for d in daily_list),
+            "total_sales_count": int(totals.get("sales_count", 0)),
+            "total_purchase_count": int(totals.get("purchase_count", 0)),
+            "total_expense_count": int(totals.get("expense_count", 0)),
+            "granularity": granularity,
             "date_range": {
                 "start_date": start_date[:10] if start_date else None,
                 "end_date": end_date[:10] if end_date else None
@@ -2156,157 +1701,12 @@ async def get_extra_expenses_report(
         query["expense_date"] = date_filter
 
     # Fetch expenses with filters
-    expenses = await db.extra_expenses.find(query, {"_id": 0}).sort("expense_date", -1).to_list(10000)
-
-    if format == "csv":
-        output = BytesIO()
-        writer = csv.writer(output)
-        writer.writerow(
-            [
-                "Date",
-                "Type",
-                "Description",
-                "Amount (Rs)",
-                "Notes",
-            ]
-        )
-        if not expenses:
-            writer.writerow(["No records found for the selected filters", "", "", "", ""])
-        for expense in expenses:
-            writer.writerow(
-                [
-                    expense.get("expense_date", ""),
-                    expense.get("expense_type", ""),
-                    expense.get("description", ""),
-                    expense.get("amount", 0),
-                    expense.get("notes", ""),
-                ]
-            )
-
-        # Add total row
-        if expenses:
-            total_amount = sum(e.get("amount", 0) for e in expenses)
-            writer.writerow([])
-            writer.writerow(["TOTAL", "", "", total_amount, ""])
-
-        output.seek(0)
-        return StreamingResponse(
-            output,
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=extra_expenses_report.csv"},
-        )
-
-    elif format == "excel":
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Extra Expenses"
-
-        headers = [
-            "Date",
-            "Type",
-            "Description",
-            "Amount (Rs)",
-            "Notes",
-        ]
-        ws.append(headers)
-
-        for cell in ws[1]:
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(
-                start_color="059669", end_color="059669", fill_type="solid"
-            )
-            cell.alignment = Alignment(horizontal="center")
-
-        if not expenses:
-            ws.append(["No records found for the selected filters", "", "", "", ""])
-        else:
-            for expense in expenses:
-                ws.append(
-                    [
-                        expense.get("expense_date", ""),
-                        expense.get("expense_type", ""),
-                        expense.get("description", ""),
-                        expense.get("amount", 0),
-                        expense.get("notes", ""),
-                    ]
-                )
-
-            # Add total row
-            total_amount = sum(e.get("amount", 0) for e in expenses)
-            ws.append([])
-            total_row = ws.max_row
-            ws.append(["TOTAL", "", "", total_amount, ""])
-            for cell in ws[total_row]:
-                cell.font = Font(bold=True)
-
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={
-                "Content-Disposition": "attachment; filename=extra_expenses_report.xlsx"
-            },
-        )
-
-    elif format == "pdf":
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        elements = []
-
-        styles = getSampleStyleSheet()
-        title = Paragraph("<b>Extra Expenses Report</b>", styles["Title"])
-        elements.append(title)
-        elements.append(Spacer(1, 0.3 * inch))
-
-        if not expenses:
-            no_data_msg = Paragraph("No records found for the selected filters.", styles["Normal"])
-            elements.append(no_data_msg)
-        else:
-            data = [
-                ["Date", "Type", "Description", "Amount", "Notes"]
-            ]
-            for expense in expenses:
-                expense_date = expense.get("expense_date", "")
-                data.append(
-                    [
-                        expense_date[:10] if expense_date else "",
-                        expense.get("expense_type", "")[:12],
-                        expense.get("description", "")[:25],
-                        f"Rs {expense.get('amount', 0):.2f}",
-                        expense.get("notes", "")[:15] if expense.get("notes") else "-",
-                    ]
-                )
-
-            # Add total row
-            total_amount = sum(e.get("amount", 0) for e in expenses)
-            data.append(["", "", "TOTAL", f"Rs {total_amount:.2f}", ""])
-
-            table = Table(data)
-            table.setStyle(
-                TableStyle(
-                    [
-                        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#059669")),
-                        ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-                        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                        ("FONTSIZE", (0, 0), (-1, 0), 8),
-                        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-                        ("BACKGROUND", (0, -1), (-1, -1), colors.HexColor("#E0E0E0")),
-                        ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
-                    ]
-                )
-            )
-            elements.append(table)
+    expenses = await fetch_all(
+        db.extra_expenses.find(query, {"_id": 0}).sort("expense_date", -1)
+    )
 
-        doc.build(elements)
-        buffer.seek(0)
-        return StreamingResponse(
-            buffer,
-            media_type="application/pdf",
-            headers={"Content-Disposition": "attachment; filename=extra_expenses_report.pdf"},
-        )
+    if format in REPORT_FORMATS:
+        return await render_report("extra_expenses", "extra_expenses_report", format, expenses)
 
     else:
         total_amount = sum(e.get("amount", 0) for e in expenses)
@@ -2326,7 +1726,10 @@ async def get_extra_expenses_report(
 # Main Categories Management
 @api_router.get("/main-categories", response_model=List[MainCategory])
 async def get_main_categories(current_user: User = Depends(get_current_user)):
-    categories = await db.main_categories.find({}, {"_id": 0}).to_list(length=None)
+    categories = await cache.shared.get_or_load(
+        "main_categories", "all",
+        lambda: db.main_categories.find({}, {"_id": 0}).to_list(length=None),
+    )
     return categories
 
 
@@ -2349,7 +1752,8 @@ async def create_main_category(
         )
 
     new_category = MainCategory(**category.dict())
-    await db.main_categories.insert_one(new_category.dict())
+    await db.main_categories.insert_one({**new_category.dict(), **await sync.stamp(db)})
+    await cache.shared.bump("main_categories")
     logger.info(f"Main category created: {new_category.name}")
     return new_category
 
@@ -2371,10 +1775,10 @@ async def update_main_category(
     if not existing:
         raise HTTPException(status_code=404, detail="Category not found")
 
-    update_data = category.dict()
-    update_data["updated_at"] = get_ist_now()
+    update_data = {**category.dict(), **await sync.stamp(db)}
 
     await db.main_categories.update_one({"id": category_id}, {"$set": update_data})
+    await cache.shared.bump("main_categories")
 
     updated = await db.main_categories.find_one({"id": category_id}, {"_id": 0})
     return MainCategory(**updated)
@@ -2404,6 +1808,8 @@ async def delete_main_category(
     result = await db.main_categories.delete_one({"id": category_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Category not found")
+    await sync.record_delete(db, "main_categories", category_id)
+    await cache.shared.bump("main_categories")
 
     return {"message": "Category deleted successfully"}
 
@@ -2411,7 +1817,10 @@ async def delete_main_category(
 # Expense Types Management
 @api_router.get("/expense-types", response_model=List[ExpenseType])
 async def get_expense_types(current_user: User = Depends(get_current_user)):
-    types = await db.expense_types.find({}, {"_id": 0}).to_list(length=None)
+    types = await cache.shared.get_or_load(
+        "expense_types", "all",
+        lambda: db.expense_types.find({}, {"_id": 0}).to_list(length=None),
+    )
     return types
 
 
@@ -2437,6 +1846,7 @@ async def create_expense_type(
 
     new_type = ExpenseType(**expense_type.dict())
     await db.expense_types.insert_one(new_type.dict())
+    await cache.shared.bump("expense_types")
     logger.info(f"Expense type created: {new_type.name}")
     return new_type
 
@@ -2462,6 +1872,7 @@ async def update_expense_type(
     update_data["updated_at"] = get_ist_now()
 
     await db.expense_types.update_one({"id": type_id}, {"$set": update_data})
+    await cache.shared.bump("expense_types")
 
     updated = await db.expense_types.find_one({"id": type_id}, {"_id": 0})
     return ExpenseType(**updated)
@@ -2495,6 +1906,7 @@ async def delete_expense_type(
     result = await db.expense_types.delete_one({"id": type_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Expense type not found")
+    await cache.shared.bump("expense_types")
 
     return {"message": "Expense type deleted successfully"}
 
@@ -2513,6 +1925,17 @@ async def cleanup_duplicate_expense_types(current_user: User = Depends(get_curre
             status_code=403, detail="Only admin can cleanup expense types"
         )
 
+    deleted_count, remaining_count = await remove_duplicate_expense_types()
+
+    return {
+        "message": f"Cleanup completed. Removed {deleted_count} duplicate expense types.",
+        "deleted_count": deleted_count,
+        "remaining_count": remaining_count
+    }
+
+
+async def remove_duplicate_expense_types():
+    """Keep the oldest expense type of each name; returns (deleted, remaining)"""
     # Get all expense types
     all_types = await db.expense_types.find({}, {"_id": 0}).to_list(length=None)
 
@@ -2541,14 +1964,22 @@ async def cleanup_duplicate_expense_types(current_user: User = Depends(get_curre
         else:
             kept_types.append(types_list[0])
 
-    return {
-        "message": f"Cleanup completed. Removed {deleted_count} duplicate expense types.",
-        "deleted_count": deleted_count,
-        "remaining_count": len(kept_types)
-    }
+    if deleted_count > 0:
+        await cache.shared.bump("expense_types")
+
+    return deleted_count, len(kept_types)
 
 
 # Derived Products Management
+def normalize_derived_product(product: dict) -> dict:
+    # Ensure backwards compatibility - add default sale_unit if missing
+    if "sale_unit" not in product or not product["sale_unit"]:
+        product["sale_unit"] = "weight"
+    if "package_weight_kg" not in product:
+        product["package_weight_kg"] = None
+    return product
+
+
 @api_router.get("/derived-products", response_model=List[DerivedProduct])
 async def get_derived_products(
     main_category_id: Optional[str] = None,
@@ -2558,14 +1989,13 @@ async def get_derived_products(
     if main_category_id:
         query["main_category_id"] = main_category_id
 
-    products = await db.derived_products.find(query, {"_id": 0}).to_list(length=None)
-    # Ensure backwards compatibility - add default sale_unit if missing
-    for product in products:
-        if "sale_unit" not in product or not product["sale_unit"]:
-            product["sale_unit"] = "weight"
-        if "package_weight_kg" not in product:
-            product["package_weight_kg"] = None
-    return products
+    async def load():
+        products = await db.derived_products.find(query, {"_id": 0}).to_list(length=None)
+        for product in products:
+            normalize_derived_product(product)
+        return products
+
+    return await cache.shared.get_or_load("derived_products", main_category_id or "all", load)
 
 
 @api_router.post("/derived-products", response_model=DerivedProduct)
@@ -2617,7 +2047,8 @@ async def create_derived_product(
         )
 
     new_product = DerivedProduct(**product.dict())
-    await db.derived_products.insert_one(new_product.dict())
+    await db.derived_products.insert_one({**new_product.dict(), **await sync.stamp(db)})
+    await cache.shared.bump("derived_products")
     logger.info(
         f"Derived product created: {new_product.name} (SKU: {new_product.sku}, Unit: {new_product.sale_unit})"
     )
@@ -2651,10 +2082,10 @@ async def update_derived_product(
                 status_code=400, detail="Product with this SKU already exists"
             )
 
-    update_data = product.dict()
-    update_data["updated_at"] = get_ist_now()
+    update_data = {**product.dict(), **await sync.stamp(db)}
 
     await db.derived_products.update_one({"id": product_id}, {"$set": update_data})
+    await cache.shared.bump("derived_products")
 
     updated = await db.derived_products.find_one({"id": product_id}, {"_id": 0})
     return DerivedProduct(**updated)
@@ -2674,6 +2105,8 @@ async def delete_derived_product(
     result = await db.derived_products.delete_one({"id": product_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    await sync.record_delete(db, "derived_products", product_id)
+    await cache.shared.bump("derived_products")
 
     return {"message": "Product deleted successfully"}
 
@@ -2742,14 +2175,37 @@ async def create_inventory_purchase(
         total_cost=total_cost,
     )
 
-    await db.inventory_purchases.insert_one(new_purchase.dict())
+    await db.inventory_purchases.insert_one({**new_purchase.dict(), **await sync.stamp(db)})
+    live_changes.add("today", "purchases")
+    await adjust_inventory_valuation(
+        new_purchase.main_category_id,
+        new_purchase.remaining_weight_kg,
+        new_purchase.remaining_weight_kg * new_purchase.cost_per_kg,
+    )
     logger.info(
         f"Inventory purchase created: {category['name']} - {purchase.total_weight_kg}kg from {vendor['name']}"
     )
     return new_purchase
 
 
+async def stock_by_category() -> dict:
+    """Remaining weight and pieces of every category's lots, in one grouped aggregate"""
+    rows = await db.inventory_purchases.aggregate(
+        [
+            {
+                "$group": {
+                    "_id": "$main_category_id",
+                    "remaining_weight_kg": {"$sum": {"$ifNull": ["$remaining_weight_kg", 0]}},
+                    "remaining_pieces": {"$sum": {"$ifNull": ["$remaining_pieces", 0]}},
+                }
+            }
+        ]
+    ).to_list(length=None)
+    return {row.pop("_id"): row for row in rows}
+
+
 @api_router.get("/inventory-summary", response_model=List[InventorySummary])
+@singleflight.coalesce(ttl=AGGREGATE_CACHE_SECONDS, namespaces=("main_categories", "stock"))
 async def get_inventory_summary(current_user: User = Depends(get_current_user)):
     # Get all main categories
     categories = await db.main_categories.find({}, {"_id": 0}).to_list(length=None)
@@ -2758,48 +2214,40 @@ async def get_inventory_summary(current_user: User = Depends(get_current_user)):
     today = get_ist_now().strftime("%Y-%m-%d")
     week_ago = (get_ist_now() - timedelta(days=7)).strftime("%Y-%m-%d")
 
-    summary = []
-    for category in categories:
-        # Get all purchases for this category
-        purchases = await db.inventory_purchases.find(
-            {"main_category_id": category["id"]}, {"_id": 0}
-        ).to_list(length=None)
-
-        total_weight = sum(p.get("remaining_weight_kg", 0) for p in purchases)
-        total_pieces = sum(
-            p.get("remaining_pieces", 0)
-            for p in purchases
-            if p.get("remaining_pieces") is not None
-        )
-
-        # Get today's waste (simplified - just waste_kg)
-        today_waste = await db.daily_waste_tracking.find(
-            {"main_category_id": category["id"], "tracking_date": today}, {"_id": 0}
-        ).to_list(length=None)
-
-        today_waste_kg = sum(w.get("waste_kg", 0) for w in today_waste)
-
-        # Get this week's waste
-        week_waste = await db.daily_waste_tracking.find(
+    # One grouped aggregate each for the lots and for the week's waste, not queries per category
+    stock = await stock_by_category()
+    waste_rows = await db.daily_waste_tracking.aggregate(
+        [
+            {"$match": {"tracking_date": {"$gte": week_ago, "$lte": today}}},
             {
-                "main_category_id": category["id"],
-                "tracking_date": {"$gte": week_ago, "$lte": today},
+                "$group": {
+                    "_id": "$main_category_id",
+                    "today_waste_kg": {
+                        "$sum": {"$cond": [{"$eq": ["$tracking_date", today]}, {"$ifNull": ["$waste_kg", 0]}, 0]}
+                    },
+                    "week_waste_kg": {"$sum": {"$ifNull": ["$waste_kg", 0]}},
+                }
             },
-            {"_id": 0},
-        ).to_list(length=None)
+        ]
+    ).to_list(length=None)
+    waste = {row["_id"]: row for row in waste_rows}
 
-        week_waste_kg = sum(w.get("waste_kg", 0) for w in week_waste)
+    summary = []
+    for category in categories:
+        lots = stock.get(category["id"], {})
+        total_weight = lots.get("remaining_weight_kg", 0)
+        category_waste = waste.get(category["id"], {})
 
         summary.append(
             InventorySummary(
                 main_category_id=category["id"],
                 main_category_name=category["name"],
                 total_weight_kg=round(total_weight, 2),
-                total_pieces=total_pieces,
-                low_stock=total_weight < 10,  # Alert if less than 10kg
-                today_waste_kg=round(today_waste_kg, 2),
+                total_pieces=int(lots.get("remaining_pieces", 0)),
+                low_stock=total_weight < LOW_STOCK_KG,
+                today_waste_kg=round(category_waste.get("today_waste_kg", 0), 2),
                 today_waste_percentage=0,  # Removed percentage calculation
-                week_waste_kg=round(week_waste_kg, 2),
+                week_waste_kg=round(category_waste.get("week_waste_kg", 0), 2),
                 week_waste_percentage=0,  # Removed percentage calculation
             )
         )
@@ -2876,11 +2324,25 @@ async def update_inventory_purchase(
     if update_data.purchase_date:
         update_dict["purchase_date"] = update_data.purchase_date
 
+    update_dict.update(await sync.stamp(db))
     await db.inventory_purchases.update_one({"id": purchase_id}, {"$set": update_dict})
 
+    # Move the lot's stock value out of the old figures and into the new ones
+    await adjust_inventory_valuation(
+        existing_purchase["main_category_id"],
+        -old_remaining_weight,
+        -old_remaining_weight * existing_purchase.get("cost_per_kg", 0),
+    )
+    await adjust_inventory_valuation(
+        update_data.main_category_id,
+        update_dict["remaining_weight_kg"],
+        update_dict["remaining_weight_kg"] * update_data.cost_per_kg,
+    )
+
     updated_purchase = await db.inventory_purchases.find_one(
         {"id": purchase_id}, {"_id": 0}
     )
+    live_changes.add("today", "purchases")
     logger.info(f"Purchase updated: {purchase_id}")
     return InventoryPurchase(**updated_purchase)
 
@@ -2913,48 +2375,511 @@ async def delete_inventory_purchase(
 
     # Delete purchase
     await db.inventory_purchases.delete_one({"id": purchase_id})
+    await sync.record_delete(db, "inventory_purchases", purchase_id)
+    live_changes.add("today", "purchases")
+    await adjust_inventory_valuation(
+        existing_purchase["main_category_id"],
+        -remaining_weight,
+        -remaining_weight * existing_purchase.get("cost_per_kg", 0),
+    )
     logger.info(f"Purchase deleted: {purchase_id}")
     return {"message": "Purchase deleted successfully"}
 
 
 # Stock Alerts
+LOW_STOCK_KG = 10
+CRITICAL_STOCK_KG = 5
+
+
+def stock_alert(category: dict, total_weight: float):
+    """Alert for a category below LOW_STOCK_KG, None when its stock is fine"""
+    if total_weight >= LOW_STOCK_KG:
+        return None
+    return {
+        "category_id": category["id"],
+        "category_name": category["name"],
+        "current_stock_kg": round(total_weight, 2),
+        "alert_level": "critical" if total_weight < CRITICAL_STOCK_KG else "warning",
+        "message": f"Low stock alert: Only {round(total_weight, 2)}kg remaining",
+    }
+
+
+def stock_alert_cleared(category: dict, total_weight: float) -> dict:
+    """Live event for a category whose stock is back to LOW_STOCK_KG or more"""
+    return {
+        "category_id": category["id"],
+        "category_name": category["name"],
+        "current_stock_kg": round(total_weight, 2),
+        "alert_level": "cleared",
+        "message": f"Stock back to {round(total_weight, 2)}kg",
+    }
+
+
 @api_router.get("/stock-alerts")
+@singleflight.coalesce(ttl=AGGREGATE_CACHE_SECONDS, namespaces=("main_categories", "stock"))
 async def get_stock_alerts(current_user: User = Depends(get_current_user)):
     # Get all main categories
     categories = await db.main_categories.find({}, {"_id": 0}).to_list(length=None)
 
+    stock = await stock_by_category()
     alerts = []
     for category in categories:
-        # Get all purchases for this category
-        purchases = await db.inventory_purchases.find(
-            {"main_category_id": category["id"]}, {"_id": 0}
-        ).to_list(length=None)
-
-        total_weight = sum(p.get("remaining_weight_kg", 0) for p in purchases)
-
-        # Low stock if less than 10kg
-        if total_weight < 10:
-            alerts.append(
-                {
-                    "category_id": category["id"],
-                    "category_name": category["name"],
-                    "current_stock_kg": round(total_weight, 2),
-                    "alert_level": "critical" if total_weight < 5 else "warning",
-                    "message": f"Low stock alert: Only {round(total_weight, 2)}kg remaining",
-                }
-            )
+        total_weight = stock.get(category["id"], {}).get("remaining_weight_kg", 0)
+
+        alert = stock_alert(category, total_weight)
+        if alert:
+            alerts.append(alert)
 
     return alerts
 
 
-# Daily Pieces Tracking
-@api_router.get("/daily-pieces-tracking", response_model=List[DailyPiecesTracking])
-async def get_daily_pieces_tracking(
-    main_category_id: Optional[str] = None,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    current_user: User = Depends(get_current_user),
-):
+# Live Events
+# Stock and today's totals pushed to the dashboard / inventory screens over SSE.
+# Handlers call live_changes.add(...) after a write; the changed values are
+# recomputed once per burst of writes and published to every connected screen.
+async def category_stock(category: dict, today: str) -> dict:
+    """The live fields of a category's inventory summary row"""
+    lots = await analytics.aggregate_totals(
+        db.inventory_purchases,
+        {"main_category_id": category["id"]},
+        ["remaining_weight_kg", "remaining_pieces"],
+    )
+    waste = await analytics.aggregate_totals(
+        db.daily_waste_tracking,
+        {"main_category_id": category["id"], "tracking_date": today},
+        ["waste_kg"],
+    )
+    total_weight = lots["remaining_weight_kg"]
+    return {
+        "main_category_id": category["id"],
+        "main_category_name": category["name"],
+        "total_weight_kg": round(total_weight, 2),
+        "total_pieces": int(lots["remaining_pieces"]),
+        "low_stock": total_weight < LOW_STOCK_KG,
+        "today_waste_kg": round(waste["waste_kg"], 2),
+    }
+
+
+async def today_totals(sections, today: str) -> dict:
+    """Today's dashboard figures for the changed sections only"""
+    totals = {"date": today}
+    if "sales" in sections:
+        sales = await analytics.aggregate_totals(
+            db.pos_sales, analytics.date_range_query("sale_date", today, today), ["total", "cogs"]
+        )
+        totals.update(
+            total_sales_today=sales["total"],
+            sales_count_today=sales["count"],
+            cogs_today=round(sales["cogs"], 2),
+            profit_today=sales["total"] - sales["cogs"],
+        )
+    if "purchases" in sections:
+        purchases = await analytics.aggregate_totals(
+            db.inventory_purchases,
+            analytics.date_range_query("purchase_date", today, today),
+            ["total_cost"],
+        )
+        totals["total_purchases_today"] = purchases["total_cost"]
+    if "expenses" in sections:
+        expenses = await analytics.aggregate_totals(
+            db.extra_expenses, {"expense_date": today}, ["amount"]
+        )
+        totals["extra_expenses_today"] = expenses["amount"]
+    if "waste" in sections:
+        waste = await analytics.aggregate_totals(
+            db.daily_waste_tracking, {"tracking_date": today}, ["waste_kg"]
+        )
+        totals["waste_kg_today"] = round(waste["waste_kg"], 2)
+    return totals
+
+
+# Last alert level published per category, so an alert goes out when the level changes
+published_alert_levels = {}
+
+
+async def publish_live_changes(pending: dict):
+    if not await events.broker.has_audience():
+        # No screen anywhere to patch; whoever connects next loads the full data first
+        published_alert_levels.clear()
+        return
+    today = get_ist_now().strftime("%Y-%m-%d")
+    if pending.get("stock"):
+        categories = await cache.shared.get_or_load(
+            "main_categories", "all",
+            lambda: db.main_categories.find({}, {"_id": 0}).to_list(length=None),
+        )
+        for category in categories:
+            if category["id"] not in pending["stock"]:
+                continue
+            stock = await category_stock(category, today)
+            await events.broker.publish("stock", stock)
+
+            alert = stock_alert(category, stock["total_weight_kg"])
+            level = alert["alert_level"] if alert else None
+            previous_level = published_alert_levels.get(category["id"])
+            if level != previous_level:
+                published_alert_levels[category["id"]] = level
+                if alert:
+                    await events.broker.publish("stock_alert", alert)
+                elif previous_level:
+                    await events.broker.publish(
+                        "stock_alert", stock_alert_cleared(category, stock["total_weight_kg"])
+                    )
+    if pending.get("today"):
+        await events.broker.publish("today", await today_totals(pending["today"], today))
+
+
+live_changes = events.Coalescer(publish_live_changes)
+
+
+async def stock_changed(*category_ids):
+    """Record a stock movement: conditional GETs see it at once, live screens after the debounce"""
+    await cache.shared.bump("stock")
+    live_changes.add("stock", *category_ids)
+
+
+@startup.step("live_events")
+async def start_live_events():
+    await events.broker.start(db)
+
+
+@api_router.get("/events")
+async def stream_events(
+    request: Request,
+    token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+):
+    """
+    Server-sent events for live screens:
+    - stock: a category's inventory summary fields after its stock or waste changed
+    - stock_alert: a category entered (or changed) low-stock level, shaped like /stock-alerts;
+      alert_level "cleared" when its stock is back above the threshold
+    - today: the changed figures among today's sales, purchases, expenses and waste
+
+    EventSource cannot send headers, so the JWT may be passed as ?token=.
+    Screens should load the full data once on connect and patch it from the events.
+    """
+    if credentials:
+        token = credentials.credentials
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    await user_from_token(token)
+
+    return StreamingResponse(
+        events.broker.stream(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Inventory Valuation
+# One document per main category in `inventory_valuation` holding the kg and rupee
+# value left in its purchase lots. Every purchase write and FIFO movement applies
+# its delta here, so reading the valuation never scans inventory_purchases.
+async def adjust_inventory_valuation(
+    main_category_id: str, weight_delta: float, value_delta: float
+):
+    """Apply a stock movement to the category's running valuation"""
+    if not main_category_id or (weight_delta == 0 and value_delta == 0):
+        return
+    await db.inventory_valuation.update_one(
+        {"main_category_id": main_category_id},
+        {
+            "$inc": {
+                "remaining_weight_kg": weight_delta,
+                "remaining_value": value_delta,
+            },
+            "$set": {"updated_at": get_ist_now()},
+        },
+        upsert=True,
+    )
+    await stock_changed(main_category_id)
+
+
+async def rebuild_inventory_valuation():
+    """Recompute every category's valuation from the purchase lots (repair path)"""
+    pipeline = [
+        {
+            "$group": {
+                "_id": "$main_category_id",
+                "remaining_weight_kg": {"$sum": {"$ifNull": ["$remaining_weight_kg", 0]}},
+                "remaining_value": {
+                    "$sum": {
+                        "$multiply": [
+                            {"$ifNull": ["$remaining_weight_kg", 0]},
+                            {"$ifNull": ["$cost_per_kg", 0]},
+                        ]
+                    }
+                },
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "main_category_id": "$_id",
+                "remaining_weight_kg": 1,
+                "remaining_value": 1,
+                "updated_at": "$$NOW",
+            }
+        },
+        # $out swaps the collection atomically, so readers never see a partial rebuild
+        {"$out": "inventory_valuation"},
+    ]
+    await db.inventory_purchases.aggregate(pipeline).to_list(length=None)
+    return await db.inventory_valuation.count_documents({})
+
+
+@startup.step("inventory_valuation")
+async def init_inventory_valuation():
+    await db.inventory_valuation.create_index("main_category_id", unique=True)
+    if await db.inventory_valuation.estimated_document_count() == 0:
+        categories = await rebuild_inventory_valuation()
+        logger.info(f"✅ Inventory valuation built for {categories} categories")
+        return {"rebuilt_categories": categories}
+    return {"rebuilt_categories": 0}
+
+
+@api_router.get("/inventory-valuation", response_model=List[InventoryValuation])
+async def get_inventory_valuation(current_user: User = Depends(get_current_user)):
+    valuations = await db.inventory_valuation.find({}, {"_id": 0}).to_list(length=None)
+    categories = await db.main_categories.find(
+        {}, {"_id": 0, "id": 1, "name": 1}
+    ).to_list(length=None)
+    category_names = {c["id"]: c["name"] for c in categories}
+
+    result = []
+    for v in valuations:
+        remaining_weight = v.get("remaining_weight_kg", 0)
+        remaining_value = v.get("remaining_value", 0)
+        result.append(
+            InventoryValuation(
+                main_category_id=v["main_category_id"],
+                main_category_name=category_names.get(v["main_category_id"], "Unknown"),
+                remaining_weight_kg=round(remaining_weight, 2),
+                remaining_value=round(remaining_value, 2),
+                weighted_avg_cost_per_kg=(
+                    round(remaining_value / remaining_weight, 2)
+                    if remaining_weight > 0
+                    else 0
+                ),
+            )
+        )
+    return result
+
+
+@api_router.post("/inventory-valuation/rebuild")
+async def rebuild_inventory_valuation_endpoint(
+    current_user: User = Depends(get_current_user),
+):
+    # Check if user is admin
+    user_doc = await db.users.find_one({"id": current_user.id}, {"_id": 0})
+    if not user_doc.get("is_admin", False):
+        raise HTTPException(
+            status_code=403, detail="Only admin can rebuild inventory valuation"
+        )
+
+    categories = await rebuild_inventory_valuation()
+    logger.info(f"Inventory valuation rebuilt for {categories} categories")
+    return {"message": "Inventory valuation rebuilt", "category_count": categories}
+
+
+# FIFO Stock Allocation
+def lot_cost_per_piece(purchase: dict) -> float:
+    """Cost of a single piece from a purchase lot (0 if the lot has no pieces)"""
+    total_pieces = purchase.get("total_pieces") or 0
+    if total_pieces <= 0:
+        return 0.0
+    return purchase.get("total_cost", 0) / total_pieces
+
+
+async def update_lots(lot_updates):
+    """Write (purchase id, fields) lot changes, stamped from one block of sync versions"""
+    for (purchase_id, fields), stamp in zip(lot_updates, await sync.stamps(db, len(lot_updates))):
+        await db.inventory_purchases.update_one({"id": purchase_id}, {"$set": {**fields, **stamp}})
+
+
+async def fifo_deduct_weight(main_category_id: str, weight_kg: float):
+    """
+    Deduct weight from the oldest purchase lots first.
+    Returns (cost_consumed, weight_not_deducted) so callers can record COGS.
+    """
+    purchases = (
+        await db.inventory_purchases.find(
+            {"main_category_id": main_category_id}, {"_id": 0}
+        )
+        .sort("purchase_date", 1)
+        .to_list(length=None)
+    )
+
+    weight_to_deduct = weight_kg
+    cost_consumed = 0.0
+    weight_removed = 0.0
+    value_removed = 0.0
+    lot_updates = []
+    for purchase in purchases:
+        if weight_to_deduct <= 0:
+            break
+
+        remaining = purchase.get("remaining_weight_kg", 0)
+        if remaining > 0:
+            deduction = min(remaining, weight_to_deduct)
+            new_remaining = round(remaining - deduction, 2)
+            weight_to_deduct -= deduction
+            cost_consumed += deduction * purchase.get("cost_per_kg", 0)
+            # Track what actually left the lot (after rounding) for the valuation
+            weight_removed += remaining - new_remaining
+            value_removed += (remaining - new_remaining) * purchase.get("cost_per_kg", 0)
+            lot_updates.append((purchase["id"], {"remaining_weight_kg": new_remaining}))
+
+    await update_lots(lot_updates)
+    await adjust_inventory_valuation(main_category_id, -weight_removed, -value_removed)
+    return cost_consumed, weight_to_deduct
+
+
+async def fifo_restore_weight(main_category_id: str, weight_kg: float):
+    """
+    Add weight back to the newest purchase lots first (undoing a FIFO deduction).
+    Returns the weight that could not be restored.
+    """
+    purchases = (
+        await db.inventory_purchases.find(
+            {"main_category_id": main_category_id}, {"_id": 0}
+        )
+        .sort("purchase_date", -1)
+        .to_list(length=None)
+    )
+
+    weight_to_add_back = weight_kg
+    weight_added = 0.0
+    value_added = 0.0
+    lot_updates = []
+    for purchase in purchases:
+        if weight_to_add_back <= 0:
+            break
+
+        remaining_weight = purchase.get("remaining_weight_kg", 0)
+        total_weight = purchase.get("total_weight_kg", 0)
+
+        if remaining_weight < total_weight:
+            addition = min(total_weight - remaining_weight, weight_to_add_back)
+            new_remaining = round(remaining_weight + addition, 2)
+            weight_to_add_back -= addition
+            weight_added += new_remaining - remaining_weight
+            value_added += (new_remaining - remaining_weight) * purchase.get("cost_per_kg", 0)
+            lot_updates.append((purchase["id"], {"remaining_weight_kg": new_remaining}))
+
+    await update_lots(lot_updates)
+    await adjust_inventory_valuation(main_category_id, weight_added, value_added)
+    return weight_to_add_back
+
+
+async def fifo_deduct_pieces(main_category_id: str, pieces: int):
+    """
+    Deduct pieces from the oldest purchase lots first.
+    Returns (cost_consumed, pieces_not_deducted); piece cost is the lot's total_cost / total_pieces,
+    which is only the item's cost when no weight was sold with it (see fifo_deduct_item).
+    """
+    purchases = (
+        await db.inventory_purchases.find(
+            {"main_category_id": main_category_id}, {"_id": 0}
+        )
+        .sort("purchase_date", 1)
+        .to_list(length=None)
+    )
+
+    pieces_to_deduct = pieces
+    cost_consumed = 0.0
+    lot_updates = []
+    for purchase in purchases:
+        if pieces_to_deduct <= 0:
+            break
+
+        remaining_pieces = purchase.get("remaining_pieces", 0) or 0
+        if remaining_pieces > 0:
+            deduction = min(remaining_pieces, pieces_to_deduct)
+            pieces_to_deduct -= deduction
+            cost_consumed += deduction * lot_cost_per_piece(purchase)
+            lot_updates.append((purchase["id"], {"remaining_pieces": remaining_pieces - deduction}))
+
+    await update_lots(lot_updates)
+    await stock_changed(main_category_id)
+    return cost_consumed, pieces_to_deduct
+
+
+async def fifo_deduct_item(main_category_id: str, quantity_kg: float, quantity_pieces) -> float:
+    """
+    Deduct one sale item (weight and/or pieces) from the lots; returns its COGS.
+    A lot's total_cost already pays for its weight, so the pieces of an item sold by
+    weight are only counted out of the lots, not costed a second time.
+    """
+    cost = 0.0
+    if quantity_kg and quantity_kg > 0:
+        cost, _ = await fifo_deduct_weight(main_category_id, quantity_kg)
+    if quantity_pieces and quantity_pieces > 0:
+        pieces_cost, _ = await fifo_deduct_pieces(main_category_id, quantity_pieces)
+        if not quantity_kg or quantity_kg <= 0:
+            cost += pieces_cost
+    return cost
+
+
+async def fifo_restore_pieces(main_category_id: str, pieces: int):
+    """
+    Add pieces back to the newest purchase lots first (undoing a FIFO deduction).
+    Returns the pieces that could not be restored.
+    """
+    purchases = (
+        await db.inventory_purchases.find(
+            {"main_category_id": main_category_id}, {"_id": 0}
+        )
+        .sort("purchase_date", -1)
+        .to_list(length=None)
+    )
+
+    pieces_to_add_back = pieces
+    lot_updates = []
+    for purchase in purchases:
+        if pieces_to_add_back <= 0:
+            break
+
+        remaining_pieces = purchase.get("remaining_pieces", 0) or 0
+        total_pieces = purchase.get("total_pieces", 0) or 0
+        if remaining_pieces < total_pieces:
+            addition = min(total_pieces - remaining_pieces, pieces_to_add_back)
+            pieces_to_add_back -= addition
+            lot_updates.append((purchase["id"], {"remaining_pieces": remaining_pieces + addition}))
+
+    await update_lots(lot_updates)
+    await stock_changed(main_category_id)
+    return pieces_to_add_back
+
+
+async def fifo_restore_item(main_category_id: str, quantity_kg: float, quantity_pieces):
+    """Put one sale item's weight and pieces back into the lots (undoing fifo_deduct_item)"""
+    if quantity_kg and quantity_kg > 0:
+        await fifo_restore_weight(main_category_id, quantity_kg)
+    if quantity_pieces and quantity_pieces > 0:
+        await fifo_restore_pieces(main_category_id, quantity_pieces)
+
+
+async def sale_item_category(item: dict):
+    """Main category of a stored sale item (older items only name their derived product)"""
+    if item.get("main_category_id"):
+        return item["main_category_id"]
+    product_id = item.get("derived_product_id") or item.get("product_id")
+    if not product_id:
+        return None
+    derived_product = await db.derived_products.find_one({"id": product_id}, {"_id": 0})
+    return derived_product.get("main_category_id") if derived_product else None
+
+
+# Daily Pieces Tracking
+@api_router.get("/daily-pieces-tracking", response_model=List[DailyPiecesTracking])
+async def get_daily_pieces_tracking(
+    main_category_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+):
     query = {}
     if main_category_id:
         query["main_category_id"] = main_category_id
@@ -3005,30 +2930,11 @@ async def create_daily_pieces_tracking(
             detail="Pieces already tracked for this category and date. Please update instead.",
         )
 
-    # Get all inventory purchases for this category and deduct pieces
-    purchases = (
-        await db.inventory_purchases.find(
-            {"main_category_id": tracking.main_category_id}, {"_id": 0}
-        )
-        .sort("purchase_date", 1)
-        .to_list(length=None)
+    # Deduct pieces from inventory using FIFO
+    _, pieces_to_deduct = await fifo_deduct_pieces(
+        tracking.main_category_id, tracking.pieces_sold
     )
 
-    pieces_to_deduct = tracking.pieces_sold
-    for purchase in purchases:
-        if pieces_to_deduct <= 0:
-            break
-
-        remaining = purchase.get("remaining_pieces", 0)
-        if remaining and remaining > 0:
-            deduction = min(remaining, pieces_to_deduct)
-            new_remaining = remaining - deduction
-            pieces_to_deduct -= deduction
-
-            await db.inventory_purchases.update_one(
-                {"id": purchase["id"]}, {"$set": {"remaining_pieces": new_remaining}}
-            )
-
     if pieces_to_deduct > 0:
         logger.warning(
             f"Not enough pieces in inventory. {pieces_to_deduct} pieces could not be deducted."
@@ -3081,43 +2987,10 @@ async def update_daily_pieces_tracking(
     pieces_difference = new_pieces_sold - old_pieces_sold
 
     # If pieces increased, deduct more. If decreased, add back
-    if pieces_difference != 0:
-        purchases = (
-            await db.inventory_purchases.find(
-                {"main_category_id": update_data.main_category_id}, {"_id": 0}
-            )
-            .sort("purchase_date", 1 if pieces_difference > 0 else -1)
-            .to_list(length=None)
-        )
-
-        pieces_to_adjust = abs(pieces_difference)
-        for purchase in purchases:
-            if pieces_to_adjust <= 0:
-                break
-
-            remaining_pieces = purchase.get("remaining_pieces", 0) or 0
-
-            if pieces_difference > 0:  # Need to deduct more pieces
-                if remaining_pieces > 0:
-                    deduction = min(remaining_pieces, pieces_to_adjust)
-                    new_remaining = remaining_pieces - deduction
-                    pieces_to_adjust -= deduction
-
-                    await db.inventory_purchases.update_one(
-                        {"id": purchase["id"]},
-                        {"$set": {"remaining_pieces": new_remaining}},
-                    )
-            else:  # Need to add back pieces
-                total_pieces = purchase.get("total_pieces", 0) or 0
-                if remaining_pieces < total_pieces:
-                    addition = min(total_pieces - remaining_pieces, pieces_to_adjust)
-                    new_remaining = remaining_pieces + addition
-                    pieces_to_adjust -= addition
-
-                    await db.inventory_purchases.update_one(
-                        {"id": purchase["id"]},
-                        {"$set": {"remaining_pieces": new_remaining}},
-                    )
+    if pieces_difference > 0:
+        await fifo_deduct_pieces(update_data.main_category_id, pieces_difference)
+    elif pieces_difference < 0:
+        await fifo_restore_pieces(update_data.main_category_id, -pieces_difference)
 
     # Update tracking record
     tracking_date = (
@@ -3141,6 +3014,7 @@ async def update_daily_pieces_tracking(
     updated_tracking = await db.daily_pieces_tracking.find_one(
         {"id": tracking_id}, {"_id": 0}
     )
+    await stock_changed(existing_tracking["main_category_id"], update_data.main_category_id)
     logger.info(f"Daily pieces tracking updated: {tracking_id}")
     return DailyPiecesTracking(**updated_tracking)
 
@@ -3167,30 +3041,7 @@ async def delete_daily_pieces_tracking(
     pieces_to_add_back = existing_tracking.get("pieces_sold", 0)
 
     if pieces_to_add_back > 0:
-        purchases = (
-            await db.inventory_purchases.find(
-                {"main_category_id": existing_tracking["main_category_id"]}, {"_id": 0}
-            )
-            .sort("purchase_date", -1)
-            .to_list(length=None)
-        )
-
-        for purchase in purchases:
-            if pieces_to_add_back <= 0:
-                break
-
-            remaining_pieces = purchase.get("remaining_pieces", 0) or 0
-            total_pieces = purchase.get("total_pieces", 0) or 0
-
-            if remaining_pieces < total_pieces:
-                addition = min(total_pieces - remaining_pieces, pieces_to_add_back)
-                new_remaining = remaining_pieces + addition
-                pieces_to_add_back -= addition
-
-                await db.inventory_purchases.update_one(
-                    {"id": purchase["id"]},
-                    {"$set": {"remaining_pieces": new_remaining}},
-                )
+        await fifo_restore_pieces(existing_tracking["main_category_id"], pieces_to_add_back)
 
     # Delete tracking record
     await db.daily_pieces_tracking.delete_one({"id": tracking_id})
@@ -3263,30 +3114,10 @@ async def create_daily_waste_tracking(
     )
 
     # Deduct waste weight from inventory using FIFO
-    purchases = (
-        await db.inventory_purchases.find(
-            {"main_category_id": tracking.main_category_id}, {"_id": 0}
-        )
-        .sort("purchase_date", 1)
-        .to_list(length=None)
+    _, weight_to_deduct = await fifo_deduct_weight(
+        tracking.main_category_id, tracking.waste_kg
     )
 
-    weight_to_deduct = tracking.waste_kg
-    for purchase in purchases:
-        if weight_to_deduct <= 0:
-            break
-
-        remaining = purchase.get("remaining_weight_kg", 0)
-        if remaining > 0:
-            deduction = min(remaining, weight_to_deduct)
-            new_remaining = remaining - deduction
-            weight_to_deduct -= deduction
-
-            await db.inventory_purchases.update_one(
-                {"id": purchase["id"]},
-                {"$set": {"remaining_weight_kg": round(new_remaining, 2)}},
-            )
-
     if weight_to_deduct > 0:
         logger.warning(
             f"Not enough inventory for {category['name']}. {weight_to_deduct}kg could not be deducted."
@@ -3302,6 +3133,8 @@ async def create_daily_waste_tracking(
     )
 
     await db.daily_waste_tracking.insert_one(new_tracking.dict())
+    await stock_changed(tracking.main_category_id)
+    live_changes.add("today", "waste")
     logger.info(
         f"Daily waste tracking created: {category['name']} - Waste: {tracking.waste_kg}kg on {tracking_date}"
     )
@@ -3347,43 +3180,10 @@ async def update_daily_waste_tracking(
     waste_difference = new_waste_kg - old_waste_kg
 
     # If waste increased, deduct more. If decreased, add back
-    if waste_difference != 0:
-        purchases = (
-            await db.inventory_purchases.find(
-                {"main_category_id": update_data.main_category_id}, {"_id": 0}
-            )
-            .sort("purchase_date", 1 if waste_difference > 0 else -1)
-            .to_list(length=None)
-        )
-
-        weight_to_adjust = abs(waste_difference)
-        for purchase in purchases:
-            if weight_to_adjust <= 0:
-                break
-
-            remaining_weight = purchase.get("remaining_weight_kg", 0)
-
-            if waste_difference > 0:  # Need to deduct more weight
-                if remaining_weight > 0:
-                    deduction = min(remaining_weight, weight_to_adjust)
-                    new_remaining = remaining_weight - deduction
-                    weight_to_adjust -= deduction
-
-                    await db.inventory_purchases.update_one(
-                        {"id": purchase["id"]},
-                        {"$set": {"remaining_weight_kg": round(new_remaining, 2)}},
-                    )
-            else:  # Need to add back weight
-                total_weight = purchase.get("total_weight_kg", 0)
-                if remaining_weight < total_weight:
-                    addition = min(total_weight - remaining_weight, weight_to_adjust)
-                    new_remaining = remaining_weight + addition
-                    weight_to_adjust -= addition
-
-                    await db.inventory_purchases.update_one(
-                        {"id": purchase["id"]},
-                        {"$set": {"remaining_weight_kg": round(new_remaining, 2)}},
-                    )
+    if waste_difference > 0:
+        await fifo_deduct_weight(update_data.main_category_id, waste_difference)
+    elif waste_difference < 0:
+        await fifo_restore_weight(update_data.main_category_id, -waste_difference)
 
     # Update tracking record
     tracking_date = (
@@ -3408,6 +3208,8 @@ async def update_daily_waste_tracking(
     updated_tracking = await db.daily_waste_tracking.find_one(
         {"id": tracking_id}, {"_id": 0}
     )
+    await stock_changed(existing_tracking["main_category_id"], update_data.main_category_id)
+    live_changes.add("today", "waste")
     logger.info(f"Daily waste tracking updated: {tracking_id}")
     return DailyWasteTracking(**updated_tracking)
 
@@ -3434,33 +3236,14 @@ async def delete_daily_waste_tracking(
     weight_to_add_back = existing_tracking.get("waste_kg", 0)
 
     if weight_to_add_back > 0:
-        purchases = (
-            await db.inventory_purchases.find(
-                {"main_category_id": existing_tracking["main_category_id"]}, {"_id": 0}
-            )
-            .sort("purchase_date", -1)
-            .to_list(length=None)
+        await fifo_restore_weight(
+            existing_tracking["main_category_id"], weight_to_add_back
         )
 
-        for purchase in purchases:
-            if weight_to_add_back <= 0:
-                break
-
-            remaining_weight = purchase.get("remaining_weight_kg", 0)
-            total_weight = purchase.get("total_weight_kg", 0)
-
-            if remaining_weight < total_weight:
-                addition = min(total_weight - remaining_weight, weight_to_add_back)
-                new_remaining = remaining_weight + addition
-                weight_to_add_back -= addition
-
-                await db.inventory_purchases.update_one(
-                    {"id": purchase["id"]},
-                    {"$set": {"remaining_weight_kg": round(new_remaining, 2)}},
-                )
-
     # Delete tracking record
     await db.daily_waste_tracking.delete_one({"id": tracking_id})
+    await stock_changed(existing_tracking["main_category_id"])
+    live_changes.add("today", "waste")
     logger.info(f"Daily waste tracking deleted: {tracking_id}")
     return {"message": "Waste tracking deleted successfully"}
 
@@ -3514,6 +3297,7 @@ async def create_extra_expense(
     )
 
     await db.extra_expenses.insert_one(new_expense.dict())
+    live_changes.add("today", "expenses")
     logger.info(
         f"Extra expense created: {expense.expense_type} - ₹{expense.amount} on {expense.expense_date}"
     )
@@ -3553,6 +3337,7 @@ async def update_extra_expense(
         },
     )
 
+    live_changes.add("today", "expenses")
     logger.info(f"Extra expense updated: {expense_id}")
     return {"message": "Expense updated successfully", "id": expense_id}
 
@@ -3577,6 +3362,7 @@ async def delete_extra_expense(
 
     # Delete expense
     await db.extra_expenses.delete_one({"id": expense_id})
+    live_changes.add("today", "expenses")
     logger.info(f"Extra expense deleted: {expense_id}")
     return {"message": "Expense deleted successfully"}
 
@@ -3608,78 +3394,68 @@ async def create_pos_sale(
                 detail=f"Main category {item.main_category_id} not found",
             )
 
-    # Deduct inventory weight/pieces from purchases (FIFO)
+    # Deduct inventory weight/pieces from purchases (FIFO) and capture COGS
     for item in sale.items:
-        # Deduct weight if applicable (weight or package units)
-        if item.quantity_kg > 0:
-            weight_to_deduct = item.quantity_kg
-
-            # Get all purchases for this main category, sorted by purchase date (FIFO)
-            purchases = (
-                await db.inventory_purchases.find(
-                    {"main_category_id": item.main_category_id}, {"_id": 0}
-                )
-                .sort("purchase_date", 1)
-                .to_list(length=None)
-            )
-
-            for purchase in purchases:
-                if weight_to_deduct <= 0:
-                    break
-
-                remaining = purchase.get("remaining_weight_kg", 0)
-                if remaining > 0:
-                    deduction = min(remaining, weight_to_deduct)
-                    new_remaining = remaining - deduction
-                    weight_to_deduct -= deduction
-
-                    await db.inventory_purchases.update_one(
-                        {"id": purchase["id"]},
-                        {"$set": {"remaining_weight_kg": round(new_remaining, 2)}},
-                    )
-
-        # Deduct pieces if applicable (pieces unit)
-        if item.quantity_pieces and item.quantity_pieces > 0:
-            pieces_to_deduct = item.quantity_pieces
-
-            # Get all purchases for this main category, sorted by purchase date (FIFO)
-            purchases = (
-                await db.inventory_purchases.find(
-                    {"main_category_id": item.main_category_id}, {"_id": 0}
-                )
-                .sort("purchase_date", 1)
-                .to_list(length=None)
-            )
-
-            for purchase in purchases:
-                if pieces_to_deduct <= 0:
-                    break
-
-                remaining_pieces = purchase.get("remaining_pieces", 0) or 0
-                if remaining_pieces > 0:
-                    deduction = min(remaining_pieces, pieces_to_deduct)
-                    new_remaining = remaining_pieces - deduction
-                    pieces_to_deduct -= deduction
-
-                    await db.inventory_purchases.update_one(
-                        {"id": purchase["id"]},
-                        {"$set": {"remaining_pieces": new_remaining}},
-                    )
+        item_cogs = await fifo_deduct_item(
+            item.main_category_id, item.quantity_kg, item.quantity_pieces
+        )
+        item.cogs = round(item_cogs, 2)
 
     # Create sale record
     new_sale = POSSaleNew(**sale.dict())
-    await db.pos_sales.insert_one(new_sale.dict())
+    new_sale.cogs = round(sum(item.cogs or 0 for item in new_sale.items), 2)
+    await db.pos_sales.insert_one({**new_sale.dict(), **await sync.stamp(db)})
+    live_changes.add("today", "sales")
 
     # Update customer total purchases if customer provided
     if sale.customer_id:
         await db.customers.update_one(
             {"id": sale.customer_id}, {"$inc": {"total_purchases": sale.total}}
         )
+        await cache.shared.bump("customers")
 
     logger.info(f"POS sale created: Total {sale.total}")
     return new_sale
 
 
+def normalize_pos_sale(sale: dict) -> dict:
+    """Convert string dates to datetime objects and normalize old data"""
+    if isinstance(sale.get("sale_date"), str):
+        sale["sale_date"] = datetime.fromisoformat(sale["sale_date"])
+    if isinstance(sale.get("created_at"), str):
+        sale["created_at"] = datetime.fromisoformat(sale["created_at"])
+
+    # Normalize old sale items to new schema format
+    if "items" in sale:
+        for item in sale["items"]:
+            # If old schema fields exist but new schema fields don't, copy them over
+            if item.get("product_id") and not item.get("derived_product_id"):
+                item["derived_product_id"] = item.get("product_id", "")
+                item["derived_product_name"] = item.get("product_name", "Unknown")
+                item["main_category_id"] = item.get("product_id", "")  # Fallback
+                item["main_category_name"] = item.get("product_name", "Unknown")
+                item["quantity_kg"] = item.get("quantity", 0)
+                item["selling_price"] = item.get("price_per_unit", 0)
+                # Keep old fields for backward compatibility
+
+            # Ensure required fields have defaults
+            if "total" not in item:
+                item["total"] = 0
+            if "derived_product_id" not in item:
+                item["derived_product_id"] = ""
+            if "derived_product_name" not in item:
+                item["derived_product_name"] = "Unknown"
+            if "main_category_id" not in item:
+                item["main_category_id"] = ""
+            if "main_category_name" not in item:
+                item["main_category_name"] = "Unknown"
+            if "quantity_kg" not in item:
+                item["quantity_kg"] = 0
+            if "selling_price" not in item:
+                item["selling_price"] = 0
+    return sale
+
+
 @api_router.get("/pos-sales", response_model=List[POSSaleNew])
 async def get_pos_sales(
     start_date: Optional[str] = None,
@@ -3717,41 +3493,8 @@ async def get_pos_sales(
         .to_list(length=None)
     )
 
-    # Convert string dates to datetime objects and normalize old data
-    for s in sales:
-        if isinstance(s.get("sale_date"), str):
-            s["sale_date"] = datetime.fromisoformat(s["sale_date"])
-        if isinstance(s.get("created_at"), str):
-            s["created_at"] = datetime.fromisoformat(s["created_at"])
-
-        # Normalize old sale items to new schema format
-        if "items" in s:
-            for item in s["items"]:
-                # If old schema fields exist but new schema fields don't, copy them over
-                if item.get("product_id") and not item.get("derived_product_id"):
-                    item["derived_product_id"] = item.get("product_id", "")
-                    item["derived_product_name"] = item.get("product_name", "Unknown")
-                    item["main_category_id"] = item.get("product_id", "")  # Fallback
-                    item["main_category_name"] = item.get("product_name", "Unknown")
-                    item["quantity_kg"] = item.get("quantity", 0)
-                    item["selling_price"] = item.get("price_per_unit", 0)
-                    # Keep old fields for backward compatibility
-
-                # Ensure required fields have defaults
-                if "total" not in item:
-                    item["total"] = 0
-                if "derived_product_id" not in item:
-                    item["derived_product_id"] = ""
-                if "derived_product_name" not in item:
-                    item["derived_product_name"] = "Unknown"
-                if "main_category_id" not in item:
-                    item["main_category_id"] = ""
-                if "main_category_name" not in item:
-                    item["main_category_name"] = "Unknown"
-                if "quantity_kg" not in item:
-                    item["quantity_kg"] = 0
-                if "selling_price" not in item:
-                    item["selling_price"] = 0
+    for sale in sales:
+        normalize_pos_sale(sale)
 
     return sales
 
@@ -3787,7 +3530,7 @@ async def update_pos_sale(
     if payment_method_only:
         result = await db.pos_sales.update_one(
             {"id": sale_id},
-            {"$set": {"payment_method": sale_data.get("payment_method")}}
+            {"$set": {"payment_method": sale_data.get("payment_method"), **await sync.stamp(db)}}
         )
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Sale not found")
@@ -3797,64 +3540,38 @@ async def update_pos_sale(
     old_items = existing_sale.get("items", [])
     new_items = sale_data.get("items", [])
 
-    # Create a mapping of old items by product ID for comparison
-    old_items_map = {}
-    for item in old_items:
-        product_id = item.get('derived_product_id') or item.get('product_id')
-        if product_id:
-            old_items_map[product_id] = item.get('quantity_kg', 0)
-
-    # Process new items and adjust inventory
-    for new_item in new_items:
-        product_id = new_item.get('derived_product_id') or new_item.get('product_id')
-        if not product_id:
-            continue
-
-        # Get the derived product to find main category
-        derived_product = await db.derived_products.find_one({"id": product_id}, {"_id": 0})
-        if not derived_product:
-            continue
-
-        main_category_id = derived_product.get("main_category_id")
-        if not main_category_id:
-            continue
-
-        # Calculate quantity difference
-        new_qty = new_item.get('quantity', 0)
-        old_qty = old_items_map.get(product_id, 0)
-        qty_delta = new_qty - old_qty
-
-        if qty_delta != 0:
-            # Adjust main category inventory
-            main_category = await db.main_categories.find_one({"id": main_category_id}, {"_id": 0})
-            if main_category:
-                new_weight = main_category.get("total_weight_kg", 0) - qty_delta
-
-                if new_weight < 0:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Insufficient stock for {derived_product.get('name')}. Available: {main_category.get('total_weight_kg', 0)} kg"
-                    )
+    async def stock_lines(items):
+        return [
+            (
+                await sale_item_category(item),
+                item.get("quantity_kg", 0) or 0,
+                item.get("quantity_pieces", 0) or 0,
+            )
+            for item in items
+        ]
 
-                await db.main_categories.update_one(
-                    {"id": main_category_id},
-                    {"$set": {"total_weight_kg": new_weight}}
-                )
+    old_lines = await stock_lines(old_items)
+    new_lines = await stock_lines(new_items)
 
-        # Remove from old items map once processed
-        if product_id in old_items_map:
-            del old_items_map[product_id]
+    if new_lines == old_lines:
+        # Same stock taken: keep the COGS recorded when the sale was made
+        for new_item, old_item in zip(new_items, old_items):
+            new_item["cogs"] = old_item.get("cogs")
+        sale_cogs = existing_sale.get("cogs")
+    else:
+        # Put the old items back into their lots, then take the new ones out (FIFO) and re-cost them
+        for main_category_id, quantity_kg, quantity_pieces in old_lines:
+            if main_category_id:
+                await fifo_restore_item(main_category_id, quantity_kg, quantity_pieces)
 
-    # Restore inventory for items that were removed from the sale
-    for product_id, old_qty in old_items_map.items():
-        derived_product = await db.derived_products.find_one({"id": product_id}, {"_id": 0})
-        if derived_product:
-            main_category_id = derived_product.get("main_category_id")
+        sale_cogs = 0.0
+        for new_item, (main_category_id, quantity_kg, quantity_pieces) in zip(new_items, new_lines):
+            item_cogs = 0.0
             if main_category_id:
-                await db.main_categories.update_one(
-                    {"id": main_category_id},
-                    {"$inc": {"total_weight_kg": old_qty}}
-                )
+                item_cogs = await fifo_deduct_item(main_category_id, quantity_kg, quantity_pieces)
+            new_item["cogs"] = round(item_cogs, 2)
+            sale_cogs += new_item["cogs"]
+        sale_cogs = round(sale_cogs, 2)
 
     # Handle customer total purchases update
     old_customer_id = existing_sale.get("customer_id")
@@ -3881,6 +3598,8 @@ async def update_pos_sale(
                 {"id": new_customer_id},
                 {"$inc": {"total_purchases": new_total}}
             )
+    if old_customer_id or new_customer_id:
+        await cache.shared.bump("customers")
 
     # Prepare update data
     update_data = {
@@ -3892,6 +3611,7 @@ async def update_pos_sale(
         "tax": sale_data.get("tax", 0),
         "total": new_total,
         "payment_method": sale_data.get("payment_method", "cash"),
+        "cogs": sale_cogs,
     }
 
     # Handle sale date if provided
@@ -3907,6 +3627,7 @@ async def update_pos_sale(
                 pass
 
     # Update the sale
+    update_data.update(await sync.stamp(db))
     result = await db.pos_sales.update_one(
         {"id": sale_id},
         {"$set": update_data}
@@ -3914,6 +3635,7 @@ async def update_pos_sale(
 
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Sale not found")
+    live_changes.add("today", "sales")
 
     return {"message": "Sale updated successfully", "id": sale_id}
 
@@ -3930,41 +3652,207 @@ async def delete_pos_sale(sale_id: str, current_user: User = Depends(get_current
     if not sale:
         raise HTTPException(status_code=404, detail="Sale not found")
 
-    # Restore inventory for each item
+    # Delete the sale, then put its items back into their lots (only once if deletes race)
+    result = await db.pos_sales.delete_one({"id": sale_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Sale not found")
     for item in sale.get("items", []):
-        main_category_id = item.get("main_category_id")
-        quantity_kg = item.get("quantity_kg", 0)
-        quantity_pieces = item.get("quantity_pieces", 0)
-
+        main_category_id = await sale_item_category(item)
         if main_category_id:
-            # Find the most recent purchase to restore inventory
-            # Note: This is a simplified approach. In production, you'd want to track
-            # which specific purchase the sale came from
-            category_summary = await db.inventory_summary.find_one(
-                {"main_category_id": main_category_id}, {"_id": 0}
+            await fifo_restore_item(
+                main_category_id, item.get("quantity_kg", 0) or 0, item.get("quantity_pieces", 0) or 0
             )
+    await sync.record_delete(db, "pos_sales", sale_id)
+    live_changes.add("today", "sales")
 
-            if category_summary:
-                # Restore the inventory
-                new_weight = category_summary.get("total_weight_kg", 0) + quantity_kg
-                new_pieces = category_summary.get("total_pieces", 0) + quantity_pieces
-
-                await db.inventory_summary.update_one(
-                    {"main_category_id": main_category_id},
-                    {
-                        "$set": {
-                            "total_weight_kg": new_weight,
-                            "total_pieces": new_pieces,
-                        }
-                    },
-                )
+    return {"message": "Sale deleted successfully", "id": sale_id}
 
-    # Delete the sale
-    result = await db.pos_sales.delete_one({"id": sale_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Sale not found")
 
-    return {"message": "Sale deleted successfully", "id": sale_id}
+# Delta Sync
+# The POS pages keep local copies of these collections and refresh them with
+# GET /sync?since=<token> instead of reloading the full lists after every action
+SYNC_SHAPES = {
+    "main_categories": (MainCategory, None),
+    "derived_products": (DerivedProduct, normalize_derived_product),
+    "inventory_purchases": (InventoryPurchase, None),
+    "pos_sales": (POSSaleNew, normalize_pos_sale),
+}
+
+
+@api_router.get("/sync")
+async def get_sync(
+    since: Optional[str] = None,
+    collections: Optional[str] = None,
+    limit: int = sync.PAGE_LIMIT,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Changes to the POS collections since `since` (a token from an earlier response).
+    Without a token (or with one older than the tombstone retention) the response is a
+    full snapshot with reset=true. Documents come in the same shape as the list
+    endpoints; `deleted` lists the ids removed since the token. When has_more is true
+    the client should call again right away with the new token.
+    """
+    names = collections.split(",") if collections else list(sync.COLLECTIONS)
+    unknown = [name for name in names if name not in SYNC_SHAPES]
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Cannot sync {', '.join(unknown)}"
+        )
+
+    try:
+        result = await sync.changes(db, since, names, max(1, min(limit, sync.PAGE_LIMIT)))
+    except sync.InvalidToken as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    with tracing.span("serialize", "sync"):
+        for name, documents in result["changes"].items():
+            model, normalize = SYNC_SHAPES[name]
+            result["changes"][name] = [
+                model(**(normalize(document) if normalize else document)).model_dump(mode="json")
+                for document in documents
+            ]
+    return result
+
+
+# POS Bootstrap
+# Everything NewPOS.jsx needs on open in one response. The ETag is made of the
+# catalog cache generations and the sync counter (bumped by every stock and sale
+# write), so it is known without building the payload and a reopen is usually a 304.
+POS_RECENT_CUSTOMERS = int(os.environ.get("POS_RECENT_CUSTOMERS", "50"))
+
+
+async def pos_bootstrap_etag() -> str:
+    counter = await db[sync.COUNTERS].find_one({"_id": "sync"}, {"version": 1}) or {}
+    generations = [
+        cache.shared.generation(namespace)
+        for namespace in ("main_categories", "derived_products", "customers")
+    ]
+    return '"pos-' + "-".join(str(part) for part in [*generations, counter.get("version", 0)]) + '"'
+
+
+async def recent_customers(limit: int) -> list:
+    """Latest buyers first, then the newest customers, `limit` in all"""
+    sales = (
+        await db.pos_sales.find({"customer_id": {"$nin": [None, ""]}}, {"_id": 0, "customer_id": 1})
+        .sort("sale_date", -1)
+        .limit(limit * 4)
+        .to_list(length=None)
+    )
+    buyer_ids = list(dict.fromkeys(sale["customer_id"] for sale in sales))[:limit]
+    buyers = await db.customers.find(
+        {"id": {"$in": buyer_ids}}, {"_id": 0, "id": 1, "name": 1, "phone": 1}
+    ).to_list(length=None)
+    newest = (
+        await db.customers.find({}, {"_id": 0, "id": 1, "name": 1, "phone": 1})
+        .sort("created_at", -1)
+        .limit(limit)
+        .to_list(length=None)
+    )
+
+    by_id = {customer["id"]: customer for customer in buyers}
+    ordered = [by_id[customer_id] for customer_id in buyer_ids if customer_id in by_id]
+    seen = set(by_id)
+    ordered.extend(customer for customer in newest if customer["id"] not in seen)
+    return ordered[:limit]
+
+
+async def build_pos_bootstrap() -> dict:
+    categories = await get_main_categories(current_user=None)
+    products = await get_derived_products(main_category_id=None, current_user=None)
+
+    # Stock from the running valuation counters; pieces only live on the lots
+    valuation = await db.inventory_valuation.find(
+        {}, {"_id": 0, "main_category_id": 1, "remaining_weight_kg": 1}
+    ).to_list(length=None)
+    pieces = await db.inventory_purchases.aggregate(
+        [
+            {"$match": {"remaining_pieces": {"$gt": 0}}},
+            {"$group": {"_id": "$main_category_id", "pieces": {"$sum": "$remaining_pieces"}}},
+        ]
+    ).to_list(length=None)
+    weight_by_category = {row["main_category_id"]: row.get("remaining_weight_kg", 0) for row in valuation}
+    pieces_by_category = {row["_id"]: row["pieces"] for row in pieces}
+
+    return {
+        "categories": [
+            {"id": category["id"], "name": category["name"]} for category in categories
+        ],
+        "products": [
+            {
+                "id": product["id"],
+                "main_category_id": product["main_category_id"],
+                "name": product["name"],
+                "sku": product.get("sku"),
+                "sale_unit": product["sale_unit"],
+                "package_weight_kg": product["package_weight_kg"],
+                "selling_price": product.get("selling_price", 0),
+            }
+            for product in products
+        ],
+        "stock": {
+            category["id"]: {
+                "weight_kg": round(max(weight_by_category.get(category["id"], 0), 0), 2),
+                "pieces": int(pieces_by_category.get(category["id"], 0)),
+            }
+            for category in categories
+        },
+        "customers": await recent_customers(POS_RECENT_CUSTOMERS),
+    }
+
+
+@api_router.get("/pos/bootstrap")
+async def get_pos_bootstrap(request: Request, current_user: User = Depends(get_current_user)):
+    """Categories, products, stock and recent customers for the POS screen (ETag / 304)"""
+    if not cache.shared.fresh():
+        # Generations may be behind other workers' writes, so they can't vouch for an ETag
+        return await build_pos_bootstrap()
+
+    etag = await pos_bootstrap_etag()
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    # Terminals opening together share one build per version
+    payload = await cache.shared.get_or_load("pos_bootstrap", etag, build_pos_bootstrap)
+    return CustomJSONResponse(payload, headers=headers)
+
+
+# Batch
+# Read-only sub-requests that a page needs on load, run in-process with one auth.
+# Sub-requests skip the admission middleware, so reports (the report lane) can't be batched.
+BATCH_EXCLUDED_PATHS = ("/api/batch", "/api/events", "/api/reports/")
+
+
+@api_router.post("/batch")
+async def run_batch(
+    batch_request: BatchRequest,
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Run up to BATCH_MAX_ITEMS GET requests concurrently and return their results in order.
+    Each result has the item's status, selected headers and decoded body; one failing
+    item does not fail the batch.
+    """
+    if not batch_request.requests:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(batch_request.requests) > batch.MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch has {len(batch_request.requests)} requests, the limit is {batch.MAX_ITEMS}",
+        )
+
+    marker = authenticated_user.set((credentials.credentials, current_user))
+    try:
+        results = await batch.run(
+            request.app.router, request.scope, batch_request.requests, excluded=BATCH_EXCLUDED_PATHS
+        )
+    finally:
+        authenticated_user.reset(marker)
+    return {"results": results}
 
 
 @api_router.get("/")
@@ -3972,9 +3860,352 @@ async def root():
     return {"message": "Meat Inventory API"}
 
 
+# Metrics
+@api_router.get("/metrics")
+async def get_metrics(request: Request):
+    """Request and MongoDB metrics in the Prometheus text format"""
+    # Optional shared secret for the scraper; when unset the endpoint is open like a standard /metrics
+    token = os.environ.get("METRICS_TOKEN")
+    if token and request.headers.get("authorization") != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# Slow Queries
+@startup.step("slow_query_recorder")
+async def start_slow_query_recorder():
+    await slow_queries.recorder.start(db)
+
+
+@api_router.get("/slow-queries")
+async def get_slow_queries(
+    limit: int = 20,
+    hours: Optional[float] = None,
+    current_user: User = Depends(get_current_user),
+):
+    # Check if user is admin
+    user_doc = await db.users.find_one({"id": current_user.id}, {"_id": 0})
+    if not user_doc.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Only admin can view slow queries")
+
+    since = datetime.now(timezone.utc) - timedelta(hours=hours) if hours else None
+    offenders = await slow_queries.worst_offenders(db, max(1, min(limit, 200)), since)
+    return {
+        "settings": slow_queries.settings.as_dict(),
+        "dropped": slow_queries.recorder.dropped,
+        "offenders": offenders,
+    }
+
+
+@api_router.put("/slow-queries/settings")
+async def update_slow_query_settings(
+    update: SlowQuerySettingsUpdate, current_user: User = Depends(get_current_user)
+):
+    # Check if user is admin
+    user_doc = await db.users.find_one({"id": current_user.id}, {"_id": 0})
+    if not user_doc.get("is_admin", False):
+        raise HTTPException(
+            status_code=403, detail="Only admin can change slow query settings"
+        )
+
+    # Applies to this process only; restart-proof settings belong in the environment
+    for field, value in update.model_dump(exclude_none=True).items():
+        setattr(slow_queries.settings, field, value)
+    logger.info(f"Slow query settings changed: {slow_queries.settings.as_dict()}")
+    return slow_queries.settings.as_dict()
+
+
+# Request Profiles
+async def is_admin_request(scope) -> bool:
+    """Does the request carry a valid token of an admin user? (used outside FastAPI's Depends)"""
+    payload = request_token_payload(scope)
+    if payload is None:
+        return False
+    user_doc = await db.users.find_one({"id": payload.get("sub")}, {"_id": 0, "is_admin": 1})
+    return bool(user_doc and user_doc.get("is_admin", False))
+
+
+@api_router.get("/profiles")
+async def get_profiles(current_user: User = Depends(get_current_user)):
+    # Check if user is admin
+    user_doc = await db.users.find_one({"id": current_user.id}, {"_id": 0})
+    if not user_doc.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Only admin can view profiles")
+
+    return await asyncio.to_thread(profiler.list_profiles)
+
+
+@api_router.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str, current_user: User = Depends(get_current_user)):
+    # Check if user is admin
+    user_doc = await db.users.find_one({"id": current_user.id}, {"_id": 0})
+    if not user_doc.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Only admin can download profiles")
+
+    path = profiler.profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    # Collapsed stacks: open in speedscope or pipe through flamegraph.pl
+    return FileResponse(path, media_type="text/plain", filename=f"profile_{profile_id}.collapsed")
+
+
+# Catalog warm-up and probes
+CATALOG_COLLECTIONS = ["products", "vendors"]
+
+
+@startup.step("catalogs")
+async def preload_catalogs():
+    # Cached catalogs load through their endpoints, so the cache holds exactly what they serve
+    cached = {
+        "main_categories": await get_main_categories(current_user=None),
+        "expense_types": await get_expense_types(current_user=None),
+        "derived_products": await get_derived_products(main_category_id=None, current_user=None),
+    }
+    # The rest are only touched, so their pages are in Mongo's cache
+    touched = await asyncio.gather(
+        *(fetch_all(db[name].find({}, {"_id": 0})) for name in CATALOG_COLLECTIONS)
+    )
+    return {
+        name: len(documents)
+        for name, documents in [*cached.items(), *zip(CATALOG_COLLECTIONS, touched)]
+    }
+
+
+# Scheduled Jobs
+# Nightly maintenance that used to be run by hand; schedules are in IST.
+jobs = scheduler.Scheduler(now=get_ist_now)
+# Back-dated sales and purchases are common, so each rollup recomputes this many past days
+ROLLUP_DAYS = int(os.environ.get("ROLLUP_DAYS", "7"))
+
+
+async def store_daily_rollups(start: str, end: str) -> int:
+    """Upsert per-day P&L totals of start..end (YYYY-MM-DD) into daily_rollups"""
+    breakdown = await analytics.profit_loss_breakdown(
+        db, start, end, "day", fetch=archived_columns(start, end)
+    )
+    operations = [
+        UpdateOne(
+            {"date": day},
+            {
+                "$set": {
+                    # numpy scalars -> plain int / float for the driver
+                    **{column: value.item() if hasattr(value, "item") else value for column, value in row.items()},
+                    "updated_at": datetime.now(timezone.utc),
+                }
+            },
+            upsert=True,
+        )
+        for day, row in zip(breakdown.index, breakdown.to_dict("records"))
+    ]
+    if operations:
+        await db.daily_rollups.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+@jobs.job("daily_rollup", "5 0 * * *")
+async def daily_rollup():
+    """Per-day P&L totals of the last ROLLUP_DAYS days"""
+    today = get_ist_now()
+    start = (today - timedelta(days=ROLLUP_DAYS)).strftime("%Y-%m-%d")
+    end = (today - timedelta(days=1)).strftime("%Y-%m-%d")
+    return {"start_date": start, "end_date": end, "days": await store_daily_rollups(start, end)}
+
+
+@jobs.job("inventory_snapshot", "55 23 * * *")
+async def inventory_snapshot():
+    """End-of-day stock and value per category, kept in inventory_snapshots"""
+    day = get_ist_now().strftime("%Y-%m-%d")
+    valuations = await db.inventory_valuation.find({}, {"_id": 0}).to_list(length=None)
+    operations = [
+        UpdateOne(
+            {"date": day, "main_category_id": valuation["main_category_id"]},
+            {
+                "$set": {
+                    "remaining_weight_kg": round(valuation.get("remaining_weight_kg", 0), 3),
+                    "remaining_value": round(valuation.get("remaining_value", 0), 2),
+                    "taken_at": datetime.now(timezone.utc),
+                }
+            },
+            upsert=True,
+        )
+        for valuation in valuations
+    ]
+    if operations:
+        await db.inventory_snapshots.bulk_write(operations, ordered=False)
+    return {"date": day, "categories": len(operations)}
+
+
+# Every worker keeps its own cache, so every worker warms it (no lease)
+@jobs.job("cache_warmup", "*/5 * * * *", exclusive=False)
+async def cache_warmup():
+    return await preload_catalogs()
+
+
+@jobs.job("integrity_check", "30 1 * * *")
+async def integrity_check():
+    """Duplicate expense types, valuation drift and sales without COGS"""
+    duplicates_removed, _ = await remove_duplicate_expense_types()
+
+    before = {
+        valuation["main_category_id"]: valuation
+        for valuation in await db.inventory_valuation.find({}, {"_id": 0}).to_list(length=None)
+    }
+    await rebuild_inventory_valuation()
+    drifted = []
+    for valuation in await db.inventory_valuation.find({}, {"_id": 0}).to_list(length=None):
+        old = before.pop(valuation["main_category_id"], {})
+        if (
+            abs(old.get("remaining_weight_kg", 0) - valuation["remaining_weight_kg"]) > 0.001
+            or abs(old.get("remaining_value", 0) - valuation["remaining_value"]) > 0.01
+        ):
+            drifted.append(valuation["main_category_id"])
+    drifted.extend(before)
+    if drifted:
+        logger.warning(f"Inventory valuation drifted for {len(drifted)} categories, rebuilt")
+        await stock_changed(*drifted)
+
+    # Archived months count too: backfill_cogs.py replays (and fills in) both tiers
+    missing_cogs = 0
+    for sales in await archive.tiers(db, "pos_sales"):
+        missing_cogs += await sales.count_documents({"cogs": {"$exists": False}})
+    if missing_cogs:
+        logger.warning(
+            f"{missing_cogs} POS sales (hot and archived) have no COGS, "
+            "run backfill_cogs.py - it replays FIFO over the archived months too"
+        )
+
+    return {
+        "duplicate_expense_types_removed": duplicates_removed,
+        "valuation_drifted_categories": drifted,
+        "sales_missing_cogs": missing_cogs,
+    }
+
+
+async def rollup_month(month: str):
+    # A month's rollups are stored before its documents leave the hot tier
+    await store_daily_rollups(*archive.month_bounds(month))
+
+
+@jobs.job("archival", "0 3 * * *", lease_seconds=6 * 3600)
+async def archival():
+    """Closed months older than ARCHIVE_HORIZON_MONTHS to per-month archive collections"""
+    return await archive.archive_closed_months(db, get_ist_now(), before_month=rollup_month)
+
+
+@api_router.get("/archive/months")
+async def get_archived_months(current_user: User = Depends(get_current_user)):
+    # Check if user is admin
+    user_doc = await db.users.find_one({"id": current_user.id}, {"_id": 0})
+    if not user_doc.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Only admin can view the archive")
+
+    return await db[archive.INDEX].find({}, {"_id": 0}).sort([("collection", 1), ("month", -1)]).to_list(length=None)
+
+
+@startup.step("scheduler")
+async def start_scheduler():
+    return await jobs.start(db)
+
+
+@api_router.get("/scheduler/jobs")
+async def get_scheduled_jobs(current_user: User = Depends(get_current_user)):
+    # Check if user is admin
+    user_doc = await db.users.find_one({"id": current_user.id}, {"_id": 0})
+    if not user_doc.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Only admin can view scheduled jobs")
+
+    return [
+        {**job.as_dict(), "recent_runs": await jobs.history(job.name, limit=5)}
+        for job in jobs.jobs.values()
+    ]
+
+
+@api_router.post("/scheduler/jobs/{job_name}/run")
+async def run_scheduled_job(job_name: str, current_user: User = Depends(get_current_user)):
+    # Check if user is admin
+    user_doc = await db.users.find_one({"id": current_user.id}, {"_id": 0})
+    if not user_doc.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Only admin can run scheduled jobs")
+
+    job = jobs.jobs.get(job_name)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Scheduled job not found")
+    try:
+        return await jobs.trigger(job)
+    except scheduler.JobBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.on_event("startup")
+async def start_bootstrap():
+    startup.start()
+
+
+@api_router.get("/health")
+async def health():
+    """Liveness: the process is serving requests (no database work)"""
+    return {"status": "ok"}
+
+
+@api_router.get("/ready")
+async def ready():
+    """Readiness: 200 once the bootstrap pipeline has finished, 503 before"""
+    report = startup.report()
+    return CustomJSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
+# Conditional GET
+# Catalog-style reads answered with 304 from in-memory cache generations.
+# inventory-summary also reports today's and this week's waste, so its version changes daily.
+stock_version = etag.generations("main_categories", "stock")
+
+
+def inventory_summary_version(scope) -> str:
+    return stock_version(scope) + get_ist_now().strftime(".%Y-%m-%d")
+
+
+CONDITIONAL_GET_ROUTES = {
+    "/api/main-categories": etag.generations("main_categories"),
+    "/api/derived-products": etag.generations("derived_products"),
+    "/api/vendors": etag.generations("vendors"),
+    "/api/customers": etag.generations("customers"),
+    "/api/expense-types": etag.generations("expense_types"),
+    "/api/inventory-summary": inventory_summary_version,
+}
+
+
+def has_valid_token(scope) -> bool:
+    return request_token_payload(scope) is not None
+
+
+# Admission Control
+# Lanes for the admission middleware: checkouts keep moving while reports export.
+# Reports (JSON or exported as csv/excel/pdf) and the valuation rebuild go to the small report lane.
+POS_WRITE_PATHS = ("/api/pos-sales", "/api/customers")
+REPORT_PATHS = ("/api/reports/", "/api/inventory-valuation/rebuild")
+# Probes, metrics and long-lived event streams never wait for a slot
+UNLIMITED_PATHS = ("/api/health", "/api/ready", "/api/metrics", "/api/events")
+
+
+def admission_lane(scope) -> Optional[str]:
+    path = scope["path"]
+    if path in UNLIMITED_PATHS or not path.startswith("/api/"):
+        return None
+    if scope["method"] in ("POST", "PUT", "DELETE") and path.startswith(POS_WRITE_PATHS):
+        return "pos_write"
+    if path.startswith(REPORT_PATHS):
+        return "report"
+    return "general"
+
+
 # Include router
 app.include_router(api_router)
 
+# Innermost, so 304s still get CORS headers and show up in metrics and traces
+app.add_middleware(
+    etag.ConditionalGetMiddleware, sources=CONDITIONAL_GET_ROUTES, authorize=has_valid_token
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -3983,6 +4214,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Admin-only request profiling (X-Profile: 1 or ?profile=1)
+app.add_middleware(profiler.ProfilerMiddleware, authorize=is_admin_request)
+
+# Request spans returned as Server-Timing (and optionally logged as JSON lines)
+app.add_middleware(tracing.TracingMiddleware)
+
+# Per-request DB query counting (N+1 budget warnings, X-DB-Queries in debug mode)
+app.add_middleware(query_counter.QueryCounterMiddleware)
+
+# Per-lane concurrency limits; inside metrics, so queueing and rejections are measured
+app.add_middleware(admission.AdmissionMiddleware, classify=admission_lane)
+
+# Outermost, so recorded latency covers the whole middleware stack
+app.add_middleware(metrics.MetricsMiddleware)
+
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
@@ -3991,4 +4237,9 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await startup.stop()
+    await jobs.stop()
+    await cache.shared.stop()
+    await events.broker.stop()
+    await slow_queries.recorder.stop()
     client.close()
@@ -0,0 +1,102 @@
+"""
+Single-flight coalescing for expensive aggregate handlers.
+
+At shift start every screen asks for /dashboard/stats, /inventory-summary and
+/stock-alerts at the same moment. Each request would run the same
+aggregation. With `@coalesce()` under the route decorator:
+
+- the first request for a key runs the handler (the leader)
+- identical requests arriving while it runs await the leader's result
+  instead of starting their own. Its error is shared too.
+- with `ttl`, the result is also kept for that many seconds. A later
+  identical request gets it without running the handler.
+
+Requests are identical when they have the same parameters and the same
+permissions. The user argument (`current_user`) counts only through its
+is_admin flag, so two cashiers share a result and a cashier never gets one
+computed for an admin. `namespaces` ties kept results to cache.shared
+generations, so a write that bumps one of them ends the TTL early.
+
+The leader runs as its own task. A client that disconnects, the leader's
+included, doesn't cancel the work the others are waiting for. Results are
+shared between requests, so treat them as read-only.
+"""
+import asyncio
+import functools
+import time
+
+import cache
+import metrics
+
+CALLS = metrics.Counter(
+    "singleflight_calls_total", "Coalesced handler calls by handler and result (leader, shared, cached)",
+    ("handler", "result"),
+)
+
+
+def request_key(kwargs: dict, user_arg: str = "current_user"):
+    """Parameters of a call, with the user reduced to what it may see"""
+    user = kwargs.get(user_arg)
+    params = tuple(sorted((name, repr(value)) for name, value in kwargs.items() if name != user_arg))
+    return params, getattr(user, "is_admin", None)
+
+
+class SingleFlight:
+    def __init__(self, name: str, ttl: float = 0, namespaces=()):
+        self.name = name
+        self.ttl = ttl
+        self.namespaces = tuple(namespaces)
+        self.in_flight = {}
+        # key -> (generations, expires_at, value)
+        self.results = {}
+
+    def generations(self):
+        return tuple(cache.shared.generation(namespace) for namespace in self.namespaces)
+
+    async def do(self, key, loader):
+        if self.ttl:
+            entry = self.results.get(key)
+            if entry is not None:
+                generations, expires_at, value = entry
+                if generations == self.generations() and expires_at > time.monotonic():
+                    CALLS.inc((self.name, "cached"))
+                    return value
+                del self.results[key]
+
+        task = self.in_flight.get(key)
+        if task is not None:
+            CALLS.inc((self.name, "shared"))
+            return await asyncio.shield(task)
+
+        CALLS.inc((self.name, "leader"))
+        # Read before running: a bump landing mid-run leaves the result already stale
+        generations = self.generations()
+        task = asyncio.ensure_future(loader())
+        self.in_flight[key] = task
+        task.add_done_callback(lambda done: self._finished(key, generations, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key, generations, task):
+        self.in_flight.pop(key, None)
+        if self.ttl and not task.cancelled() and task.exception() is None:
+            self.results[key] = (generations, time.monotonic() + self.ttl, task.result())
+        # Expired entries of other keys go when they are next looked up, or here
+        now = time.monotonic()
+        for stale in [k for k, (_, expires_at, _) in self.results.items() if expires_at <= now]:
+            del self.results[stale]
+
+
+def coalesce(ttl: float = 0, namespaces=()):
+    """Decorator for an async handler: identical concurrent calls share one run"""
+
+    def decorator(handler):
+        flight = SingleFlight(handler.__name__, ttl, namespaces)
+
+        @functools.wraps(handler)
+        async def wrapper(**kwargs):
+            return await flight.do(request_key(kwargs), lambda: handler(**kwargs))
+
+        wrapper.flight = flight
+        return wrapper
+
+    return decorator
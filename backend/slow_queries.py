@@ -0,0 +1,315 @@
+"""
+Slow-operation recorder with sampled explain plans.
+
+SlowQueryListener (a pymongo CommandListener) watches query and write
+commands. Any command slower than the threshold is handed to the recorder's
+background task, so the driver thread never waits on our own writes.
+
+For each slow command, the task:
+- reduces the filter / pipeline to a query shape (values replaced by "?")
+- on a sample of shapes, re-runs the command as explain("executionStats")
+  and keeps the plan summary (stages, index used, keys and docs examined),
+  or the explain's error as `explain_error` when it fails
+- writes the record into the capped `slow_queries` collection
+
+Settings come from the environment and can be changed at runtime from the
+admin endpoint (per process):
+- SLOW_QUERY_LOG: true to record (default false)
+- SLOW_QUERY_MS: threshold in milliseconds (default 100)
+- SLOW_QUERY_EXPLAIN_SAMPLE: fraction of slow commands explained (default 0.2)
+- SLOW_QUERY_EXPLAIN_INTERVAL: minimum seconds between explains of one shape (default 300)
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "slow_queries"
+CAPPED_SIZE_BYTES = 32 * 1024 * 1024
+CAPPED_MAX_DOCUMENTS = 20_000
+QUEUE_SIZE = 1000
+
+# Commands worth recording; the filter lives under a different key for each
+FILTER_KEYS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+}
+RECORDED_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify", "insert"}
+EXPLAINABLE_COMMANDS = RECORDED_COMMANDS - {"insert"}
+
+
+class SlowQuerySettings:
+    def __init__(self):
+        self.enabled = os.environ.get("SLOW_QUERY_LOG", "").lower() in ("1", "true", "yes")
+        self.threshold_ms = float(os.environ.get("SLOW_QUERY_MS", "100"))
+        self.explain_sample_rate = float(os.environ.get("SLOW_QUERY_EXPLAIN_SAMPLE", "0.2"))
+        self.explain_interval_seconds = float(os.environ.get("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+
+    def as_dict(self):
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold_ms,
+            "explain_sample_rate": self.explain_sample_rate,
+            "explain_interval_seconds": self.explain_interval_seconds,
+        }
+
+
+settings = SlowQuerySettings()
+
+
+def shape_of(value):
+    """Query structure with literal values replaced by '?'"""
+    if isinstance(value, dict):
+        return {key: shape_of(item) for key, item in value.items()}
+    if isinstance(value, list):
+        # $and / $or branches and pipelines keep their structure, value lists collapse
+        if value and all(isinstance(item, dict) for item in value):
+            return [shape_of(item) for item in value]
+        return "?"
+    return "?"
+
+
+def command_filter(command_name: str, command: dict):
+    """(filter, sort) a command runs with"""
+    if command_name in FILTER_KEYS:
+        return command.get(FILTER_KEYS[command_name]) or {}, command.get("sort")
+    if command_name == "update":
+        updates = command.get("updates") or [{}]
+        return updates[0].get("q") or {}, None
+    if command_name == "delete":
+        deletes = command.get("deletes") or [{}]
+        return deletes[0].get("q") or {}, None
+    if command_name == "aggregate":
+        pipeline = command.get("pipeline") or []
+        match = pipeline[0].get("$match", {}) if pipeline else {}
+        sort = next((stage["$sort"] for stage in pipeline if "$sort" in stage), None)
+        return match, sort
+    return {}, None
+
+
+def query_shape(collection: str, command_name: str, command: dict) -> str:
+    if command_name == "aggregate":
+        pipeline = command.get("pipeline") or []
+        shape = [
+            {name: shape_of(spec)} if name == "$match" else name
+            for stage in pipeline
+            for name, spec in stage.items()
+        ]
+    else:
+        query, sort = command_filter(command_name, command)
+        shape = {"filter": shape_of(query)}
+        if sort:
+            shape["sort"] = dict(sort)
+    return f"{collection}.{command_name} {json.dumps(shape, sort_keys=True, default=str)}"
+
+
+def explain_command(command: dict) -> dict:
+    """Copy of a driver command that can be sent back wrapped in explain"""
+    return {
+        key: value
+        for key, value in command.items()
+        if not key.startswith("$") and key not in ("lsid", "txnNumber", "readConcern", "writeConcern")
+    }
+
+
+def plan_stages(plan) -> list:
+    """Stage names of a winning plan, outermost first"""
+    stages = []
+    while isinstance(plan, dict):
+        if plan.get("stage"):
+            stages.append(plan["stage"] + (f"({plan['indexName']})" if plan.get("indexName") else ""))
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0] or plan.get("queryPlan")
+    return stages
+
+
+def summarize_explain(explained: dict) -> dict:
+    """Plan stages and execution counters from an explain("executionStats") reply"""
+    # Aggregations nest the find-layer explain under their first $cursor stage
+    for stage in explained.get("stages") or []:
+        if "$cursor" in stage:
+            explained = stage["$cursor"]
+            break
+    planner = explained.get("queryPlanner") or {}
+    stats = explained.get("executionStats") or {}
+    stages = plan_stages(planner.get("winningPlan"))
+    return {
+        "plan": " <- ".join(stages),
+        "collection_scan": any(stage.startswith("COLLSCAN") for stage in stages),
+        "returned": stats.get("nReturned"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "execution_ms": stats.get("executionTimeMillis"),
+    }
+
+
+class SlowQueryRecorder:
+    """Moves slow command records from driver threads to a background writer task"""
+
+    def __init__(self):
+        self.db = None
+        self.loop = None
+        self.queue = None
+        self.task = None
+        self.explained_at = {}
+        self.dropped = 0
+
+    async def start(self, db):
+        self.db = db
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        if COLLECTION not in await db.list_collection_names():
+            await db.create_collection(
+                COLLECTION, capped=True, size=CAPPED_SIZE_BYTES, max=CAPPED_MAX_DOCUMENTS
+            )
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    def submit(self, record: dict):
+        """Thread-safe: queue a record for the writer task (dropped if the queue is full)"""
+        if self.loop is None or self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self._enqueue, record)
+
+    def _enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _should_explain(self, record) -> bool:
+        if record["command"] not in EXPLAINABLE_COMMANDS:
+            return False
+        if random.random() >= settings.explain_sample_rate:
+            return False
+        last = self.explained_at.get(record["shape"], 0)
+        if time.monotonic() - last < settings.explain_interval_seconds:
+            return False
+        self.explained_at[record["shape"]] = time.monotonic()
+        return True
+
+    async def _run(self):
+        while True:
+            record = await self.queue.get()
+            command = record.pop("_command")
+            if self._should_explain(record):
+                # A command that can't be explained is still worth recording
+                try:
+                    explained = await self.db.command(
+                        {"explain": command, "verbosity": "executionStats"}
+                    )
+                    record["explain"] = summarize_explain(explained)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    record["explain_error"] = str(e)
+            try:
+                await self.db[COLLECTION].insert_one(record)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Could not record slow query {record['shape']}: {e}")
+
+
+recorder = SlowQueryRecorder()
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Captures commands slower than the threshold (never blocks the driver thread)"""
+
+    def __init__(self):
+        self.pending = {}
+
+    def started(self, event):
+        if not settings.enabled or event.command_name not in RECORDED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str) or collection == COLLECTION:
+            return
+        self.pending[(event.connection_id, event.request_id)] = (collection, event.command)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        started = self.pending.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < settings.threshold_ms:
+            return
+
+        collection, command = started
+        query, sort = command_filter(event.command_name, command)
+        recorder.submit(
+            {
+                "ts": datetime.now(timezone.utc),
+                "collection": collection,
+                "command": event.command_name,
+                "shape": query_shape(collection, event.command_name, command),
+                # As JSON text: operator keys ($or, $gte) can't always be stored as field names
+                "filter": json.dumps(query, default=str),
+                "sort": json.dumps(sort, default=str) if sort else None,
+                "duration_ms": round(duration_ms, 2),
+                "failed": isinstance(event, monitoring.CommandFailedEvent) or bool(getattr(event, "failure", None)),
+                "explain": None,
+                "_command": explain_command(command),
+            }
+        )
+
+
+async def worst_offenders(db, limit: int = 20, since=None):
+    """Slow queries grouped by shape, worst total time first"""
+    pipeline = []
+    if since is not None:
+        pipeline.append({"$match": {"ts": {"$gte": since}}})
+    pipeline += [
+        {
+            "$group": {
+                "_id": "$shape",
+                "collection": {"$first": "$collection"},
+                "command": {"$first": "$command"},
+                "count": {"$sum": 1},
+                "total_ms": {"$sum": "$duration_ms"},
+                "avg_ms": {"$avg": "$duration_ms"},
+                "max_ms": {"$max": "$duration_ms"},
+                "last_seen": {"$max": "$ts"},
+                "sample_filter": {"$last": "$filter"},
+                "explains": {"$push": "$explain"},
+            }
+        },
+        {"$sort": {"total_ms": -1}},
+        {"$limit": limit},
+    ]
+    groups = await db[COLLECTION].aggregate(pipeline).to_list(length=None)
+
+    offenders = []
+    for group in groups:
+        explains = [explain for explain in group.pop("explains") if explain]
+        latest = explains[-1] if explains else None
+        offenders.append(
+            {
+                "shape": group.pop("_id"),
+                **group,
+                "total_ms": round(group["total_ms"], 2),
+                "avg_ms": round(group["avg_ms"], 2),
+                "explain": latest,
+                "missing_index": bool(latest and latest["collection_scan"]),
+            }
+        )
+    return offenders
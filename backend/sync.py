@@ -0,0 +1,215 @@
+"""
+Version stamps and tombstones behind GET /api/sync (delta sync for the POS pages).
+
+Every write to a synced collection stamps the document it touches:
+- `sync_version`: a number from the `sync_counters` collection. Each stamp
+  gets the next value, so versions increase across all workers. A write
+  touching several documents (a FIFO deduction over many lots) reserves one
+  block of versions with `stamps()`.
+- `updated_at`: when the stamp was taken.
+
+A delete leaves a tombstone in `sync_tombstones` that has its own version.
+Tombstones expire after SYNC_TOMBSTONE_DAYS through a TTL index.
+
+A client syncs with the token from its last response and gets the documents
+and tombstones with a higher version. Tokens are "<version>.<issued unix time>":
+- no token: the client gets a full snapshot
+- a token older than the tombstone retention: the client gets a full snapshot
+  too. It could have missed deletes, so the response says "reset".
+
+A write stamps the document before the document itself is written. A slow
+write can therefore show up after a faster write with a higher version.
+Tokens are held back to the newest change that is at least
+SYNC_SETTLE_SECONDS old, on every page. Changes from the last few seconds are
+sent once more on the next sync rather than skipped, and clients apply them
+by id.
+"""
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+
+COLLECTIONS = ("main_categories", "derived_products", "inventory_purchases", "pos_sales")
+COUNTERS = "sync_counters"
+TOMBSTONES = "sync_tombstones"
+
+SETTLE_SECONDS = float(os.environ.get("SYNC_SETTLE_SECONDS", "5"))
+TOMBSTONE_DAYS = int(os.environ.get("SYNC_TOMBSTONE_DAYS", "30"))
+PAGE_LIMIT = int(os.environ.get("SYNC_PAGE_LIMIT", "500"))
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+def utc(value: datetime) -> datetime:
+    # Both backends hand back naive UTC datetimes
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+# Stamping writes
+
+
+async def next_version(db, count: int = 1) -> int:
+    """Reserve `count` versions and return the highest"""
+    counter = await db[COUNTERS].find_one_and_update(
+        {"_id": "sync"},
+        {"$inc": {"version": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return counter["version"]
+
+
+async def stamp(db) -> dict:
+    """Fields to merge into an inserted document or a $set"""
+    return {"sync_version": await next_version(db), "updated_at": datetime.now(timezone.utc)}
+
+
+async def stamps(db, count: int) -> list:
+    """`count` stamps from one reserved block of versions, in version order"""
+    if count <= 0:
+        return []
+    last = await next_version(db, count)
+    now = datetime.now(timezone.utc)
+    return [{"sync_version": last - count + 1 + n, "updated_at": now} for n in range(count)]
+
+
+async def record_delete(db, collection: str, document_id: str):
+    """Leave a tombstone for a deleted document (call after the delete)"""
+    await db[TOMBSTONES].insert_one(
+        {
+            "collection": collection,
+            "id": document_id,
+            "sync_version": await next_version(db),
+            "deleted_at": datetime.now(timezone.utc),
+        }
+    )
+
+
+# Tokens
+
+
+def make_token(version: int) -> str:
+    return f"{version}.{int(time.time())}"
+
+
+def parse_token(token: str):
+    """(version, issued unix time) of a token"""
+    try:
+        version, issued = token.split(".")
+        return int(version), int(issued)
+    except ValueError:
+        raise InvalidToken(f"Invalid sync token: {token}")
+
+
+def token_expired(issued: int) -> bool:
+    return time.time() - issued > TOMBSTONE_DAYS * 86400
+
+
+def settled_version(since: int, entries) -> int:
+    """Version for the next token: the newest entry that can no longer be overtaken"""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=SETTLE_SECONDS)
+    settled = [
+        entry["sync_version"]
+        for entry in entries
+        if entry.get("stamped_at") is not None and utc(entry["stamped_at"]) <= cutoff
+    ]
+    return max([since] + settled)
+
+
+# Reading changes
+
+
+async def snapshot(db, collections) -> dict:
+    """Every document of the collections, and the token to continue from"""
+    documents = {}
+    entries = []
+    for collection in collections:
+        documents[collection] = await db[collection].find({}, {"_id": 0}).to_list(length=None)
+        entries.extend(
+            {"sync_version": document["sync_version"], "stamped_at": document.get("updated_at")}
+            for document in documents[collection]
+            if isinstance(document.get("sync_version"), int)
+        )
+    return {
+        "reset": True,
+        "has_more": False,
+        "token": make_token(settled_version(0, entries)),
+        "changes": documents,
+        "deleted": {collection: [] for collection in collections},
+    }
+
+
+async def changes_since(db, since: int, collections, limit: int = PAGE_LIMIT) -> dict:
+    """Documents and tombstones of the collections with a version above `since`, oldest first"""
+    entries = []
+    for collection in collections:
+        documents = (
+            await db[collection]
+            .find({"sync_version": {"$gt": since}}, {"_id": 0})
+            .sort("sync_version", 1)
+            .limit(limit + 1)
+            .to_list(length=None)
+        )
+        entries.extend(
+            {
+                "collection": collection,
+                "sync_version": document["sync_version"],
+                "stamped_at": document.get("updated_at"),
+                "document": document,
+            }
+            for document in documents
+        )
+
+    tombstones = (
+        await db[TOMBSTONES]
+        .find({"sync_version": {"$gt": since}, "collection": {"$in": list(collections)}}, {"_id": 0})
+        .sort("sync_version", 1)
+        .limit(limit + 1)
+        .to_list(length=None)
+    )
+    entries.extend(
+        {
+            "collection": tombstone["collection"],
+            "sync_version": tombstone["sync_version"],
+            "stamped_at": tombstone.get("deleted_at"),
+            "deleted": tombstone["id"],
+        }
+        for tombstone in tombstones
+    )
+
+    entries.sort(key=lambda entry: entry["sync_version"])
+    page = entries[:limit]
+    # Held back on every page: a slow write can still land below an unsettled version
+    version = settled_version(since, page)
+    # A page with nothing settled would come back unchanged; the client waits for its next poll instead
+    has_more = len(entries) > limit and version > since
+
+    changed = {collection: [] for collection in collections}
+    deleted = {collection: [] for collection in collections}
+    for entry in page:
+        if "deleted" in entry:
+            deleted[entry["collection"]].append(entry["deleted"])
+        else:
+            changed[entry["collection"]].append(entry["document"])
+    return {
+        "reset": False,
+        "has_more": has_more,
+        "token": make_token(version),
+        "changes": changed,
+        "deleted": deleted,
+    }
+
+
+async def changes(db, token: str = None, collections=COLLECTIONS, limit: int = PAGE_LIMIT) -> dict:
+    """Sync response for a client holding `token` (None for the first load)"""
+    if not token:
+        return await snapshot(db, collections)
+    since, issued = parse_token(token)
+    if token_expired(issued):
+        return await snapshot(db, collections)
+    return await changes_since(db, since, collections, limit)
@@ -0,0 +1,67 @@
+"""
+Shared setup for the backend tests.
+
+Tests run the app in process on the in-memory engine (DB_BACKEND=memory),
+each against a fresh database, and talk to it through httpx's ASGI transport.
+The scheduler stays off so no job runs in the middle of a test.
+"""
+import asyncio
+import os
+import sys
+import uuid
+
+os.environ.setdefault("DB_BACKEND", "memory")
+os.environ.setdefault("SCHEDULER_ENABLED", "false")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+import cache  # noqa: E402
+import database  # noqa: E402
+import server  # noqa: E402
+
+ADMIN = {"username": "admin-bano", "password": "India@54321"}
+
+# Handlers whose results outlive a request (singleflight TTL)
+COALESCED_HANDLERS = (
+    server.get_dashboard_stats,
+    server.get_inventory_summary,
+    server.get_stock_alerts,
+)
+
+
+def reset_process_state():
+    """Forget what earlier tests left in this process's caches"""
+    cache.shared.entries.clear()
+    cache.shared.generations.clear()
+    for handler in COALESCED_HANDLERS:
+        handler.flight.results.clear()
+
+
+@pytest.fixture
+def run_app():
+    """Run `await scenario(client, db)` against a freshly started app and database
+
+    The client is logged in as the admin. Each call gets its own event loop.
+    """
+
+    def run(scenario):
+        async def main():
+            reset_process_state()
+            test_db = database.bind(server.client[f"test_{uuid.uuid4().hex}"])
+            await server.app.router.startup()
+            await server.startup.wait()
+            try:
+                transport = httpx.ASGITransport(app=server.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                    response = await client.post("/api/auth/login", json=ADMIN)
+                    response.raise_for_status()
+                    client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+                    return await scenario(client, test_db)
+            finally:
+                await server.app.router.shutdown()
+
+        return asyncio.run(main())
+
+    return run
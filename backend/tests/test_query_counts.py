@@ -0,0 +1,89 @@
+"""
+Database round trips per request for the hot endpoints.
+
+Each request is wrapped in `assert_max_queries` with a fixed bound measured
+with several categories, lots and waste entries seeded. inventory-summary and
+stock-alerts group every category's lots (and the week's waste) in single
+aggregates, and a FIFO deduction stamps its lots from one block of sync
+versions. A handler that goes back to one query per category (or per lot)
+fails here instead of in production logs.
+"""
+from query_counter import assert_max_queries
+
+CATEGORIES = 6
+
+
+async def seed_stock(client):
+    vendor = (
+        await client.post("/api/vendors", json={"name": "Vendor", "contact_person": "Owner", "phone": "1"})
+    ).json()
+    categories = []
+    for n in range(CATEGORIES):
+        category = (await client.post("/api/main-categories", json={"name": f"Category {n}"})).json()
+        product = (
+            await client.post(
+                "/api/derived-products",
+                json={
+                    "main_category_id": category["id"],
+                    "name": f"Cut {n}",
+                    "sku": f"CUT{n}",
+                    "sale_unit": "weight",
+                    "selling_price": 300,
+                },
+            )
+        ).json()
+        for day, weight in (("2026-01-01", 4), ("2026-01-02", 6 + n)):
+            await client.post(
+                "/api/inventory-purchases",
+                json={
+                    "main_category_id": category["id"],
+                    "vendor_id": vendor["id"],
+                    "purchase_date": day,
+                    "total_weight_kg": weight,
+                    "cost_per_kg": 200,
+                },
+            )
+        await client.post("/api/daily-waste-tracking", json={"main_category_id": category["id"], "waste_kg": 0.5})
+        categories.append((category, product))
+    return categories
+
+
+def test_inventory_and_dashboard_reads_have_fixed_query_counts(run_app):
+    async def scenario(client, db):
+        await seed_stock(client)
+        with assert_max_queries(3):
+            assert (await client.get("/api/inventory-summary")).status_code == 200
+        with assert_max_queries(2):
+            assert (await client.get("/api/stock-alerts")).status_code == 200
+        with assert_max_queries(6):
+            assert (await client.get("/api/dashboard/stats")).status_code == 200
+
+    run_app(scenario)
+
+
+def test_pos_sale_creation_query_count(run_app):
+    async def scenario(client, db):
+        categories = await seed_stock(client)
+        category, product = categories[0]
+        sale = {
+            "items": [
+                {
+                    "derived_product_id": product["id"],
+                    "main_category_id": category["id"],
+                    "quantity_kg": 5,
+                    "selling_price": 300,
+                    "total": 1500,
+                }
+            ],
+            "subtotal": 1500,
+            "tax": 0,
+            "discount": 0,
+            "total": 1500,
+            "payment_method": "cash",
+            "sale_date": "2026-01-03",
+        }
+        # 5kg spans both of the category's 4kg and 6kg lots: two lot updates, one block of sync versions
+        with assert_max_queries(10):
+            assert (await client.post("/api/pos-sales", json=sale)).status_code == 200
+
+    run_app(scenario)
@@ -0,0 +1,105 @@
+"""
+Profit & loss reports and dashboard totals over more than 50k sales and purchases.
+
+The report paths used to read through `to_list(10000)`, which silently dropped
+everything past the cap. These tests seed past it and check every total
+against sums computed here from the seeded documents.
+"""
+import random
+import uuid
+from datetime import timedelta
+
+import pytest
+
+import server
+
+SALES = 52_000
+PURCHASES = 51_000
+
+
+def stored_date(day, rng):
+    """A time on `day` (IST), stored as an IST ISO string or a BSON datetime like real data"""
+    moment = day.replace(hour=rng.randint(0, 23), minute=rng.randint(0, 59), second=0, microsecond=0)
+    return moment.isoformat() if rng.random() < 0.5 else moment
+
+
+def seed(days, seed_value=30):
+    rng = random.Random(seed_value)
+    sales, purchases = [], []
+    for _ in range(SALES):
+        day = rng.choice(days)
+        sales.append(
+            {
+                "id": str(uuid.uuid4()),
+                "sale_date": stored_date(day, rng),
+                "total": rng.randint(100, 500_000) / 100,
+                "cogs": rng.randint(50, 300_000) / 100,
+                "items": [],
+                "day": day.strftime("%Y-%m-%d"),
+            }
+        )
+    for _ in range(PURCHASES):
+        day = rng.choice(days)
+        purchases.append(
+            {
+                "id": str(uuid.uuid4()),
+                "main_category_id": "none",
+                "purchase_date": stored_date(day, rng),
+                "total_weight_kg": 0,
+                "remaining_weight_kg": 0,
+                "total_cost": rng.randint(100, 900_000) / 100,
+                "day": day.strftime("%Y-%m-%d"),
+            }
+        )
+    return sales, purchases
+
+
+def total(documents, field, day=None):
+    return sum(document[field] for document in documents if day is None or document["day"] == day)
+
+
+def test_report_and_dashboard_totals_past_old_caps(run_app):
+    today = server.get_ist_now()
+    days = [today - timedelta(days=n) for n in range(today.day)]
+    sales, purchases = seed(days)
+    start_date = days[-1].strftime("%Y-%m-%d")
+    today_key = today.strftime("%Y-%m-%d")
+
+    async def scenario(client, db):
+        await db.pos_sales.insert_many([dict(sale) for sale in sales])
+        await db.inventory_purchases.insert_many([dict(purchase) for purchase in purchases])
+        params = {"start_date": start_date, "end_date": today_key}
+        return (
+            (await client.get("/api/reports/profit-loss", params=params)).json(),
+            (await client.get("/api/reports/daily-profit-loss", params=params)).json(),
+            (await client.get("/api/dashboard/stats")).json(),
+        )
+
+    profit_loss, daily, dashboard = run_app(scenario)
+
+    revenue, cogs, purchase_cost = total(sales, "total"), total(sales, "cogs"), total(purchases, "total_cost")
+    assert profit_loss["sales_count"] == SALES
+    assert profit_loss["purchase_count"] == PURCHASES
+    assert profit_loss["total_revenue"] == pytest.approx(revenue, abs=0.01)
+    assert profit_loss["total_cogs"] == pytest.approx(cogs, abs=0.01)
+    assert profit_loss["total_purchase_cost"] == pytest.approx(purchase_cost, abs=0.01)
+
+    summary = daily["summary"]
+    assert summary["total_sales_count"] == SALES
+    assert summary["total_purchase_count"] == PURCHASES
+    assert summary["total_revenue"] == pytest.approx(revenue, abs=0.01)
+    assert summary["total_cogs"] == pytest.approx(cogs, abs=0.01)
+    assert summary["total_purchase_cost"] == pytest.approx(purchase_cost, abs=0.01)
+    by_day = {row["date"]: row for row in daily["daily_breakdown"]}
+    for day in days:
+        key = day.strftime("%Y-%m-%d")
+        assert by_day[key]["revenue"] == pytest.approx(total(sales, "total", key), abs=0.01)
+        assert by_day[key]["purchase_cost"] == pytest.approx(total(purchases, "total_cost", key), abs=0.01)
+
+    assert dashboard["total_sales_month"] == pytest.approx(revenue, abs=0.01)
+    assert dashboard["cogs_month"] == pytest.approx(cogs, abs=0.01)
+    assert dashboard["total_purchases_month"] == pytest.approx(purchase_cost, abs=0.01)
+    assert dashboard["total_sales_today"] == pytest.approx(total(sales, "total", today_key), abs=0.01)
+    assert dashboard["cogs_today"] == pytest.approx(total(sales, "cogs", today_key), abs=0.01)
+    assert dashboard["total_purchases_today"] == pytest.approx(total(purchases, "total_cost", today_key), abs=0.01)
+    assert dashboard["profit_month"] == pytest.approx(revenue - cogs, abs=0.01)
@@ -0,0 +1,233 @@
+"""
+Lightweight per-request tracing: spans in a Server-Timing header and an optional JSON-lines file.
+
+TracingMiddleware opens a Trace for every request. Code running for that
+request adds spans with `span()`:
+
+    with tracing.span("render", "pdf"):
+        doc.build(elements)
+
+TraceCommandListener (a pymongo CommandListener) adds one "db" span per Mongo
+command. Motor copies contextvars into its executor threads, so commands are
+charged to the request that awaited them.
+
+The response carries the spans summed per name, which browser devtools show
+under Timing:
+
+    Server-Timing: auth;dur=1.9, db;dur=38.2;desc="7 queries", render;dur=210.4;desc="pdf",
+                   app;dur=12.0;desc="unattributed", total;dur=262.5
+
+"app" is the time no span covers (route logic, validation, framework).
+Concurrent DB calls overlap, so the per-name sums can exceed "total".
+
+Settings:
+- SERVER_TIMING: false to leave the header off (default true)
+- TRACE_FILE: path of a JSON-lines file receiving every trace with its
+  individual spans (off when unset). It rotates at TRACE_FILE_MAX_BYTES
+  (default 10 MB) and keeps TRACE_FILE_BACKUPS old files (default 5).
+  Lines are written from a background thread, never from the event loop.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from pymongo import monitoring
+
+import metrics
+
+HEADER_ENABLED = os.environ.get("SERVER_TIMING", "true").lower() not in ("0", "false", "no")
+TRACE_FILE = os.environ.get("TRACE_FILE")
+TRACE_FILE_MAX_BYTES = int(os.environ.get("TRACE_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_FILE_BACKUPS = int(os.environ.get("TRACE_FILE_BACKUPS", "5"))
+
+HEADER_NAME = b"server-timing"
+MAX_SPANS = 1000
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """Spans recorded while serving one request (times relative to its start)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.dropped = 0
+
+    def add(self, name: str, detail, started: float, duration: float):
+        # list.append is atomic, so driver threads can add spans without a lock
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append((name, detail, started - self.started, duration))
+        else:
+            self.dropped += 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def covered(self) -> float:
+        """Seconds covered by at least one span (overlapping and nested spans count once)"""
+        covered = 0.0
+        end = 0.0
+        for _, _, start, duration in sorted(self.spans, key=lambda span: span[2]):
+            stop = start + duration
+            if stop > end:
+                covered += stop - max(start, end)
+                end = stop
+        return covered
+
+    def server_timing(self) -> str:
+        totals = {}
+        for name, detail, _, duration in self.spans:
+            entry = totals.setdefault(name, [0.0, 0, []])
+            entry[0] += duration
+            entry[1] += 1
+            if detail and name != "db" and detail not in entry[2]:
+                entry[2].append(detail)
+
+        total = self.elapsed()
+        parts = []
+        for name, (duration, count, details) in totals.items():
+            if name == "db":
+                description = f"{count} {'query' if count == 1 else 'queries'}"
+            else:
+                description = ", ".join(details)
+            parts.append(timing_entry(name, duration, description))
+        parts.append(timing_entry("app", max(total - self.covered(), 0.0), "unattributed"))
+        parts.append(timing_entry("total", total))
+        return ", ".join(parts)
+
+    def as_dict(self) -> dict:
+        return {
+            "duration_ms": round(self.elapsed() * 1000, 3),
+            "spans": [
+                {
+                    "name": name,
+                    "detail": detail,
+                    "start_ms": round(start * 1000, 3),
+                    "duration_ms": round(duration * 1000, 3),
+                }
+                for name, detail, start, duration in self.spans
+            ],
+            "dropped_spans": self.dropped,
+        }
+
+
+def timing_entry(name: str, seconds: float, description: str = "") -> str:
+    entry = f"{name};dur={seconds * 1000:.1f}"
+    if description:
+        entry += ';desc="' + description.replace("\\", "").replace('"', "'") + '"'
+    return entry
+
+
+@contextmanager
+def span(name: str, detail: str = None):
+    """Time the block as a span of the current request (no-op outside a request)"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, detail, started, time.perf_counter() - started)
+
+
+class TraceCommandListener(monitoring.CommandListener):
+    """Adds a "db" span for every command issued while a trace is active"""
+
+    def __init__(self):
+        self.pending = {}
+
+    def started(self, event):
+        trace = _current.get()
+        if trace is not None:
+            self.pending[(event.connection_id, event.request_id)] = (
+                trace, f"{metrics.command_collection(event)}.{event.command_name}", time.perf_counter()
+            )
+
+    def _finished(self, event):
+        started = self.pending.pop((event.connection_id, event.request_id), None)
+        if started is not None:
+            trace, detail, started_at = started
+            trace.add("db", detail, started_at, event.duration_micros / 1_000_000)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+
+# JSON-lines output
+
+trace_log = logging.getLogger("tracing.traces")
+trace_log.propagate = False
+
+
+def configure_trace_file(path: str):
+    """Write traces to a rotating file through a queue drained by a background thread"""
+    handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=TRACE_FILE_MAX_BYTES, backupCount=TRACE_FILE_BACKUPS, encoding="utf-8"
+    )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, handler)
+    trace_log.addHandler(logging.handlers.QueueHandler(records))
+    trace_log.setLevel(logging.INFO)
+    listener.start()
+    atexit.register(listener.stop)
+
+
+if TRACE_FILE:
+    configure_trace_file(TRACE_FILE)
+
+
+class TracingMiddleware:
+    """Opens a trace per request, returns it as Server-Timing and optionally logs it"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (HEADER_ENABLED or trace_log.handlers):
+            return await self.app(scope, receive, send)
+
+        trace = Trace()
+        token = _current.set(trace)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if HEADER_ENABLED:
+                    headers = list(message.get("headers", []))
+                    headers.append((HEADER_NAME, trace.server_timing().encode("latin-1", "replace")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if trace_log.handlers:
+                trace_log.info(
+                    json.dumps(
+                        {
+                            "ts": datetime.now(timezone.utc).isoformat(),
+                            "method": scope["method"],
+                            "route": metrics.route_label(scope),
+                            "path": scope["path"],
+                            "status": status_code,
+                            **trace.as_dict(),
+                        }
+                    )
+                )